@@ -7,6 +7,8 @@
 
 import time
 import re
+import struct
+import threading
 import bb.event
 
 class SystemStats:
@@ -159,3 +161,157 @@ class SystemStats:
                               for dev, sample in event.disk_usage.items()]).encode('ascii') +
                      b'\n')
             self.last_disk_monitor = now
+
+# Continuous resource sampling, enabled by setting BUILDSTATS_SAMPLE_INTERVAL.
+#
+# Samples are appended to a binary file made of records, each starting with
+# a one byte record type:
+#   'N': name of a task:  id (uint32), length (uint16), utf-8 "PF:task"
+#   'S': system sample:   time (double), cumulative /proc/stat user, nice,
+#                         system, idle, iowait, irq, softirq jiffies, MemTotal
+#                         and MemAvailable in kB and cumulative pressure stall
+#                         totals in us (cpu some, memory some/full, io
+#                         some/full; -1 when not available), all int64
+#   'T': task sample:     time (double), task id (uint32), cumulative CPU
+#                         seconds (double) of the processes of the task, their
+#                         RSS in kB and cumulative read/write bytes (int64)
+# scripts/lib/buildstats.py knows how to load them, with its own copy of the
+# formats below: keep them in sync.
+
+SAMPLES_MAGIC = b'OEBSSMP1'
+SAMPLES_NAME = struct.Struct('<cIH')
+SAMPLES_SYSTEM = struct.Struct('<cd14q')
+SAMPLES_TASK = struct.Struct('<cdIdqqq')
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, d):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = float(d.getVar('BUILDSTATS_SAMPLE_INTERVAL'))
+        self.tasksdir = d.getVar('BUILDSTATS_SAMPLE_TASKS')
+        bsdir = os.path.join(d.getVar('BUILDSTATS_BASE'), d.getVar('BUILDNAME'))
+        bb.utils.mkdirhier(bsdir)
+        self.bsdir = bsdir
+        self.output = open(os.path.join(bsdir, 'resource_samples.bin'), 'wb')
+        os.write(self.output.fileno(), SAMPLES_MAGIC)
+        self.names = {}
+        self.stop_event = threading.Event()
+        self.clktck = os.sysconf('SC_CLK_TCK')
+        self.pagesize = os.sysconf('SC_PAGE_SIZE') // 1024
+        self.pressure = [os.path.exists('/proc/pressure/%s' % r) for r in ('cpu', 'memory', 'io')]
+        self.sampling_time = 0.0
+        self.start_time = time.time()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.sample()
+        self.output.close()
+        elapsed = time.time() - self.start_time
+        overhead = 100.0 * self.sampling_time / elapsed if elapsed > 0 else 0.0
+        with open(os.path.join(self.bsdir, 'build_stats'), 'a') as f:
+            f.write("Resource sampling overhead: %0.2f seconds (%0.2f%% of build time) \n" % (self.sampling_time, overhead))
+        if overhead > 1.0:
+            bb.warn("buildstats resource sampling took %0.2f%% of the build time, consider increasing BUILDSTATS_SAMPLE_INTERVAL" % overhead)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _pressure_totals(self, resource):
+        data = self._read('/proc/pressure/%s' % resource)
+        totals = {}
+        if data:
+            for line in data.split(b'\n'):
+                if line:
+                    fields = line.split()
+                    totals[fields[0]] = int(fields[-1].split(b'=')[1])
+        return totals.get(b'some', -1), totals.get(b'full', -1)
+
+    def _system_sample(self, now):
+        stat = self._read('/proc/stat')
+        cpu = [int(x) for x in stat.split(b'\n', 1)[0].split()[1:8]]
+        mem = {}
+        for line in self._read('/proc/meminfo').split(b'\n'):
+            if line.startswith((b'MemTotal:', b'MemAvailable:')):
+                mem[line.split(b':')[0]] = int(line.split()[1])
+        pressure = [-1] * 5
+        if self.pressure[0]:
+            pressure[0] = self._pressure_totals('cpu')[0]
+        if self.pressure[1]:
+            pressure[1:3] = self._pressure_totals('memory')
+        if self.pressure[2]:
+            pressure[3:5] = self._pressure_totals('io')
+        return SAMPLES_SYSTEM.pack(b'S', now, *(cpu + [mem.get(b'MemTotal', -1), mem.get(b'MemAvailable', -1)] + pressure))
+
+    def _task_samples(self, now):
+        tasks = {}
+        for pid in os.listdir(self.tasksdir):
+            data = self._read(os.path.join(self.tasksdir, pid))
+            if data:
+                tasks[int(pid)] = data.decode('utf-8').strip()
+        if not tasks:
+            return []
+
+        # Attribute every process to the task it descends from
+        procs = {}
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            stat = self._read('/proc/%s/stat' % pid)
+            if not stat:
+                continue
+            # The command name may contain spaces, skip past it
+            fields = stat[stat.rfind(b')') + 2:].split()
+            procs[int(pid)] = (int(fields[1]), fields)
+
+        totals = {}
+        for pid, (ppid, fields) in procs.items():
+            owner = pid
+            while owner not in tasks and owner in procs and owner > 1:
+                owner = procs[owner][0]
+            if owner not in tasks:
+                continue
+            # utime, stime, cutime, cstime, rss (fields 14-17 and 24)
+            cputime = sum(int(x) for x in fields[11:15]) / self.clktck
+            rss = int(fields[21]) * self.pagesize
+            read_bytes = write_bytes = 0
+            io = self._read('/proc/%s/io' % pid)
+            if io:
+                for line in io.split(b'\n'):
+                    if line.startswith(b'read_bytes:'):
+                        read_bytes = int(line.split()[1])
+                    elif line.startswith(b'write_bytes:'):
+                        write_bytes = int(line.split()[1])
+            total = totals.setdefault(owner, [0.0, 0, 0, 0])
+            total[0] += cputime
+            total[1] += rss
+            total[2] += read_bytes
+            total[3] += write_bytes
+
+        records = []
+        for pid, total in totals.items():
+            name = tasks[pid]
+            if name not in self.names:
+                self.names[name] = len(self.names)
+                encoded = name.encode('utf-8')
+                records.append(SAMPLES_NAME.pack(b'N', self.names[name], len(encoded)) + encoded)
+            records.append(SAMPLES_TASK.pack(b'T', now, self.names[name], *total))
+        return records
+
+    def sample(self):
+        start = time.time()
+        try:
+            records = [self._system_sample(start)] + self._task_samples(start)
+            # Single unbuffered write per sample
+            os.write(self.output.fileno(), b''.join(records))
+        except Exception as e:
+            bb.debug(1, "buildstats resource sampling failed: %s" % e)
+        self.sampling_time += time.time() - start
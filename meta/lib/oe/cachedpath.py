@@ -3,37 +3,126 @@
 #
 # Based on standard python library functions but avoid
 # repeated stat calls. Its assumed the files will not change from under us
-# so we can cache stat calls.
+# so we can cache stat calls; callers changing files tell the cache with
+# invalidate(). The caches are bounded, dropping the least recently used
+# entries, and their hit rates are written in buildstats.
 #
 
+import collections
 import os
 import errno
 import stat as statmod
+import weakref
+
+# Entries kept in each cache of a CachedPath
+DEFAULT_MAXSIZE = 100000
+
+# The live CachedPath objects, whose statistics are written in buildstats
+_instances = weakref.WeakSet()
+
+def instances():
+    return sorted(_instances, key=lambda cpath: cpath.name)
+
+class LRUCache(object):
+    """
+    Dictionary of at most maxsize entries (unbounded if maxsize is None)
+    dropping the least recently used ones, counting the hits and misses
+    of get() and the evictions.
+    """
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def pop(self, key, default=None):
+        return self.entries.pop(key, default)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+_missing = object()
 
 class CachedPath(object):
-    def __init__(self):
-        self.statcache = {}
-        self.lstatcache = {}
-        self.normpathcache = {}
+    _count = 0
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, name=None):
+        CachedPath._count += 1
+        self.name = name or "cachedpath%d" % CachedPath._count
+        self.statcache = LRUCache(maxsize)
+        self.lstatcache = LRUCache(maxsize)
+        self.normpathcache = LRUCache(maxsize)
+        self.realpathcache = LRUCache(maxsize)
+        _instances.add(self)
         return
 
     def updatecache(self, x):
-        x = self.normpath(x)
-        if x in self.statcache:
-            del self.statcache[x]
-        if x in self.lstatcache:
-            del self.lstatcache[x]
+        self.invalidate(x)
+
+    def invalidate(self, path, recursive=False):
+        """
+        Forget the cached stat results of a path the caller changed, and
+        those of all the paths below it if recursive is set. The cached
+        stat results of symlinks pointing to it are kept.
+        """
+        path = self.normpath(path)
+        self.statcache.pop(path)
+        self.lstatcache.pop(path)
+        if recursive:
+            prefix = path.rstrip(os.path.sep) + os.path.sep
+            for cache in (self.statcache, self.lstatcache):
+                for key in [key for key in cache.entries if key.startswith(prefix)]:
+                    del cache[key]
+        # Any resolved path may go through it
+        self.realpathcache.clear()
+
+    def stats(self):
+        """The statistics of each cache, {cache: {'size', 'hits', 'misses', 'evictions'}}"""
+        return {'stat': self.statcache.stats(), 'lstat': self.lstatcache.stats(),
+                'normpath': self.normpathcache.stats(), 'realpath': self.realpathcache.stats()}
 
     def normpath(self, path):
-        if path in self.normpathcache:
-            return self.normpathcache[path]
+        newpath = self.normpathcache.get(path)
+        if newpath is not None:
+            return newpath
         newpath = os.path.normpath(path)
         self.normpathcache[path] = newpath
         return newpath
 
     def _callstat(self, path):
-        if path in self.statcache:
-            return self.statcache[path]
         try:
             st = os.stat(path)
             self.statcache[path] = st
@@ -48,13 +137,22 @@ class CachedPath(object):
     # in real world usage of this cache
     def callstat(self, path):
         path = self.normpath(path)
-        self.calllstat(path)
-        return self.statcache[path]
+        st = self.statcache.get(path, _missing)
+        if st is not _missing:
+            return st
+        lst = self.calllstat(path)
+        if path in self.statcache:
+            return self.statcache[path]
+        if lst and statmod.S_ISLNK(lst.st_mode):
+            return self._callstat(path)
+        self.statcache[path] = lst
+        return lst
 
     def calllstat(self, path):
         path = self.normpath(path)
-        if path in self.lstatcache:
-            return self.lstatcache[path]
+        lst = self.lstatcache.get(path, _missing)
+        if lst is not _missing:
+            return lst
         #bb.error("LStatpath:" + path)
         try:
             lst = os.lstat(path)
@@ -206,6 +304,11 @@ class CachedPath(object):
         no symlink in the path. When 'assume_dir' is not set, missing
         path components will raise an ENOENT error"""
 
+        key = (file, root, use_physdir, loop_cnt, assume_dir)
+        cached = self.realpathcache.get(key)
+        if cached is not None:
+            return cached
+
         root = os.path.normpath(root)
         file = os.path.normpath(file)
 
@@ -232,4 +335,5 @@ class CachedPath(object):
 
             raise
 
+        self.realpathcache[key] = file
         return file
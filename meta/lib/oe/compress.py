@@ -0,0 +1,179 @@
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# Parallel compression of files and tarballs
+#
+
+import collections
+import concurrent.futures
+import os
+import struct
+import subprocess
+import tarfile
+import time
+import zlib
+
+# Extension of the files written by each supported compression
+extensions = {
+    "gz": ".gz",
+    "xz": ".xz",
+}
+
+class ParallelGzipWriter(object):
+    """File-like object writing a gzip stream compressed in parallel blocks
+
+    As pigz does, the input is split into blocks which are deflated
+    independently by a pool of threads (zlib releases the GIL), each using
+    the end of the previous block as its dictionary so that the compression
+    ratio stays close to that of gzip. The blocks are concatenated in a
+    single gzip member which any gzip reader can decompress.
+    """
+    def __init__(self, fileobj, level=6, threads=None, blocksize=128 * 1024, mtime=None):
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.blocksize = blocksize
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = collections.deque()
+        self.buf = bytearray()
+        self.dictionary = b""
+        self.crc = 0
+        self.size = 0
+        self.closed = False
+
+        if mtime is None:
+            mtime = int(time.time())
+        xfl = 2 if level == 9 else (4 if level == 1 else 0)
+        # Magic, deflate, no flags, mtime, extra flags, OS (unix)
+        self.fileobj.write(struct.pack("<BBBBLBB", 0x1f, 0x8b, 8, 0, mtime & 0xffffffff, xfl, 3))
+
+    def _deflate(self, data, dictionary, last):
+        if dictionary:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _submit(self, data, last):
+        self.pending.append(self.executor.submit(self._deflate, data, self.dictionary, last))
+        self.dictionary = data[-32768:]
+        # Bound the memory used by blocks waiting to be written
+        while len(self.pending) > self.threads * 2 or (last and self.pending):
+            self.fileobj.write(self.pending.popleft().result())
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        data = memoryview(data).cast("B")
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.buf += data
+        while len(self.buf) >= self.blocksize:
+            block = bytes(self.buf[:self.blocksize])
+            del self.buf[:self.blocksize]
+            self._submit(block, False)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self._submit(bytes(self.buf), True)
+        self.buf = bytearray()
+        self.executor.shutdown()
+        self.fileobj.write(struct.pack("<LL", self.crc & 0xffffffff, self.size & 0xffffffff))
+        self.fileobj.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _PipeWriter(object):
+    """File-like object feeding a compression command writing to a file"""
+    def __init__(self, fileobj, cmd):
+        self.fileobj = fileobj
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=fileobj)
+        self.closed = False
+
+    def write(self, data):
+        return self.proc.stdin.write(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.proc.stdin.close()
+        ret = self.proc.wait()
+        self.fileobj.close()
+        if ret != 0:
+            raise subprocess.CalledProcessError(ret, self.proc.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _HashingReader(object):
+    """Reader computing the digests of the data read through it"""
+    def __init__(self, fileobj, hashers):
+        self.fileobj = fileobj
+        self.hashers = hashers
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        for h in self.hashers.values():
+            h.update(data)
+        self.size += len(data)
+        return data
+
+class _DigestingTarFile(tarfile.TarFile):
+    """TarFile recording the digests of the files it reads in an
+    oe.filedigest.FileDigestCache, so that other tasks don't read them again"""
+    digests = None
+
+    def addfile(self, tarinfo, fileobj=None):
+        if fileobj is None or self.digests is None:
+            return super().addfile(tarinfo, fileobj)
+        st = os.fstat(fileobj.fileno())
+        reader = _HashingReader(fileobj, self.digests.hashers())
+        super().addfile(tarinfo, reader)
+        if reader.size == st.st_size:
+            self.digests.add(os.path.realpath(fileobj.name), st,
+                             {algorithm: h.hexdigest() for algorithm, h in reader.hashers.items()})
+
+def open_compressed(path, compression="gz", threads=None, level=None, xz_options=None):
+    """Open path for writing a stream compressed in parallel
+
+    compression is one of the keys of 'extensions', threads defaults to
+    the number of CPUs. xz_options are passed to xz before the number of
+    threads, e.g. XZ_DEFAULTS for its memory limit.
+    """
+    threads = threads or os.cpu_count() or 1
+    if compression not in extensions:
+        raise ValueError("Unsupported compression '%s', expected one of: %s" % (compression, " ".join(sorted(extensions))))
+    fileobj = open(path, "wb")
+    try:
+        if compression == "gz":
+            return ParallelGzipWriter(fileobj, level=6 if level is None else level, threads=threads)
+        cmd = ["xz", "-c"] + list(xz_options or []) + ["--threads=%d" % threads]
+        if level is not None:
+            cmd.append("-%d" % level)
+        return _PipeWriter(fileobj, cmd)
+    except:
+        fileobj.close()
+        raise
+
+def create_tarball(path, srcdir, arcname=None, compression="gz", threads=None, level=None, filter=None, digests=None, xz_options=None):
+    """Create a compressed tarball of srcdir at path
+
+    If digests is an oe.filedigest.FileDigestCache, the digests of the
+    archived files are recorded in it as they are read.
+    """
+    with open_compressed(path, compression, threads, level, xz_options) as out:
+        with _DigestingTarFile.open(fileobj=out, mode="w|") as tar:
+            tar.digests = digests
+            tar.add(srcdir, arcname=arcname if arcname is not None else os.path.basename(srcdir), filter=filter)
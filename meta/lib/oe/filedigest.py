@@ -0,0 +1,162 @@
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# Cache of the digests of source files, shared between the tasks of a recipe
+#
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+
+import bb.utils
+
+class FileDigestCache(object):
+    """Digests of files keyed by (path, size, mtime_ns, inode)
+
+    Each file read computes all the digests in 'algorithms' at once, so that
+    for example the sha1 checksums of spdx and the md5 checksums of the
+    license checks are obtained with a single read. The cache is persisted as
+    a JSON file (see cache_path), merged with the entries written
+    concurrently by other tasks when saved.
+
+    Modifying a file changes its size, modification time or inode (patch and
+    quilt write a new file), so entries of files changed by do_patch or later
+    tasks are not used and are dropped when the cache is saved.
+    """
+    version = 1
+
+    def __init__(self, cachefile=None, algorithms=("md5", "sha1"), jobs=None):
+        self.cachefile = cachefile
+        self.algorithms = tuple(algorithms)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.entries = {}
+        self.updated = {}
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0
+        self.recorded = 0
+        self.lock = threading.Lock()
+        if cachefile:
+            self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cachefile) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != self.version or data.get("algorithms") != list(self.algorithms):
+            return {}
+        return data.get("files", {})
+
+    @staticmethod
+    def _key(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _lookup(self, path, st, algorithm):
+        entry = self.entries.get(path)
+        if entry and entry[0] == self._key(st) and algorithm in entry[1]:
+            with self.lock:
+                self.hits += 1
+                self.hit_bytes += st.st_size
+            return entry[1][algorithm]
+        return None
+
+    def add(self, path, st, digests):
+        """Record the digests of the content of path read when its stat was
+        st, unless it has been modified since"""
+        self._add(os.path.realpath(path), st, digests)
+
+    def _add(self, path, st, digests):
+        key = self._key(st)
+        try:
+            if self._key(os.stat(path)) != key:
+                return
+        except OSError:
+            return
+        with self.lock:
+            self.entries[path] = [key, digests]
+            self.updated[path] = [key, digests]
+            self.recorded += 1
+
+    def hashers(self):
+        return {algorithm: hashlib.new(algorithm) for algorithm in self.algorithms}
+
+    def _compute(self, path, st):
+        hashers = self.hashers()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                for h in hashers.values():
+                    h.update(chunk)
+        digests = {algorithm: h.hexdigest() for algorithm, h in hashers.items()}
+        self._add(path, st, digests)
+        with self.lock:
+            self.misses += 1
+        return digests
+
+    def digest(self, path, algorithm="sha1"):
+        """Digest of the content of path, None if it can not be read
+
+        The files are keyed by their real path, S and work-shared being
+        symlinks for some recipes."""
+        path = os.path.realpath(path)
+        try:
+            st = os.stat(path)
+            cached = self._lookup(path, st, algorithm)
+            if cached is not None:
+                return cached
+            return self._compute(path, st)[algorithm]
+        except OSError:
+            return None
+
+    def digests(self, paths, algorithm="sha1"):
+        """Digests of paths, in the same order, files missing from the cache
+        are read in parallel"""
+        paths = list(paths)
+        if len(paths) < 2 or self.jobs == 1:
+            return [self.digest(p, algorithm) for p in paths]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(lambda p: self.digest(p, algorithm), paths))
+
+    def stats(self):
+        return "%d hits (%.1f MiB not reread), %d misses, %d recorded" % (self.hits, self.hit_bytes / 1024 / 1024, self.misses, self.recorded)
+
+    def save(self):
+        """Merge the new entries into the cache file, dropping stale ones"""
+        if not self.cachefile or not self.updated:
+            return
+        bb.utils.mkdirhier(os.path.dirname(self.cachefile))
+        lf = bb.utils.lockfile(self.cachefile + ".lock")
+        try:
+            entries = self._load()
+            entries.update(self.updated)
+            for path, entry in list(entries.items()):
+                try:
+                    if self._key(os.stat(path)) != entry[0]:
+                        del entries[path]
+                except OSError:
+                    del entries[path]
+            tmpfile = self.cachefile + ".tmp"
+            with open(tmpfile, "w") as f:
+                json.dump({"version": self.version, "algorithms": list(self.algorithms), "files": entries}, f, separators=(",", ":"))
+            os.replace(tmpfile, self.cachefile)
+            self.entries = entries
+            self.updated = {}
+        finally:
+            bb.utils.unlockfile(lf)
+
+def cache_path(d):
+    """FILE_DIGEST_CACHE, or for sources in ${TMPDIR}/work-shared (kernel,
+    gcc) a cache next to S, shared by all the recipes building them"""
+    srcdir = os.path.realpath(d.getVar("S"))
+    shared = os.path.realpath(os.path.join(d.getVar("TMPDIR"), "work-shared"))
+    if srcdir.startswith(shared + os.sep):
+        return srcdir + ".file-digests.json"
+    return d.getVar("FILE_DIGEST_CACHE")
+
+def open_cache(d):
+    """FileDigestCache of the sources of the recipe"""
+    import oe.utils
+    return FileDigestCache(cache_path(d), jobs=oe.utils.cpu_count())
@@ -17,6 +17,8 @@ import string
 from oe.gpg_sign import get_signer
 import hashlib
 import fnmatch
+import concurrent.futures
+import time
 
 # this can be used by all PM backends to create the index files in parallel
 def create_index(arg):
@@ -132,13 +134,154 @@ def generate_locale_archive(d, rootfs, target_arch, localedir):
     env = dict(os.environ)
     env["LOCALEARCHIVE"] = oe.path.join(localedir, "locale-archive")
 
-    for name in sorted(os.listdir(localedir)):
+    locales = [name for name in sorted(os.listdir(localedir)) if os.path.isdir(os.path.join(localedir, name))]
+
+    cachedir = d.getVar("LOCALE_ARCHIVE_CACHE")
+    if cachedir:
+        key = locale_archive_key(d, target_arch, arch_options, localedir, locales, env)
+        cached = os.path.join(cachedir, key)
+        try:
+            shutil.copyfile(cached, env["LOCALEARCHIVE"])
+            os.utime(cached)
+            bb.note("Using the cached locale archive %s" % cached)
+            return
+        except FileNotFoundError:
+            pass
+
+    # A single localedef adds all the locales, in a deterministic order,
+    # rather than one localedef opening and remapping the archive for each
+    if locales:
+        cmd = ["cross-localedef", "--verbose"]
+        cmd += arch_options
+        cmd += ["--add-to-archive"] + [os.path.join(localedir, name) for name in locales]
+        subprocess.check_output(cmd, env=env, stderr=subprocess.STDOUT)
+
+    if cachedir and os.path.exists(env["LOCALEARCHIVE"]):
+        bb.utils.mkdirhier(cachedir)
+        with tempfile.NamedTemporaryFile(dir=cachedir, delete=False) as f:
+            with open(env["LOCALEARCHIVE"], "rb") as src:
+                shutil.copyfileobj(src, f, 1024 * 1024)
+        os.replace(f.name, cached)
+        prune_locale_archive_cache(cachedir)
+
+def locale_archive_key(d, target_arch, arch_options, localedir, locales, env):
+    """
+    Key of the locale archive of localedir in LOCALE_ARCHIVE_CACHE: the
+    digests of the content of the locales (hashed in parallel) and of any
+    existing archive, the target arch and endianness and the localedef
+    version.
+    """
+    def digest_file(h, fpath):
+        if os.path.islink(fpath):
+            h.update(os.readlink(fpath).encode("utf-8"))
+        else:
+            with open(fpath, "rb") as fobj:
+                for chunk in iter(lambda: fobj.read(1024 * 1024), b""):
+                    h.update(chunk)
+        h.update(b"\0")
+
+    def digest_locale(name):
+        h = hashlib.sha256()
         path = os.path.join(localedir, name)
-        if os.path.isdir(path):
-            cmd = ["cross-localedef", "--verbose"]
-            cmd += arch_options
-            cmd += ["--add-to-archive", path]
-            subprocess.check_output(cmd, env=env, stderr=subprocess.STDOUT)
+        # The existing archive is a file, the locales are directories
+        if not os.path.isdir(path):
+            digest_file(h, path)
+            return name, h.hexdigest()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                fpath = os.path.join(root, f)
+                h.update(os.path.relpath(fpath, path).encode("utf-8") + b"\0")
+                digest_file(h, fpath)
+        return name, h.hexdigest()
+
+    key = hashlib.sha256()
+    version = subprocess.check_output(["cross-localedef", "--version"], env=env, stderr=subprocess.STDOUT)
+    key.update(version.splitlines()[0] if version else b"")
+    key.update(("%s %s\n" % (target_arch, " ".join(arch_options))).encode("utf-8"))
+    names = locales + (["locale-archive"] if os.path.exists(env["LOCALEARCHIVE"]) else [])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=oe.utils.cpu_count()) as executor:
+        for name, digest in executor.map(digest_locale, names):
+            key.update(("%s %s\n" % (name, digest)).encode("utf-8"))
+    return key.hexdigest()
+
+def prune_locale_archive_cache(cachedir, keep=8):
+    """Remove all but the keep most recently used archives of cachedir"""
+    archives = []
+    for name in os.listdir(cachedir):
+        path = os.path.join(cachedir, name)
+        try:
+            archives.append((os.stat(path).st_mtime, path))
+        except FileNotFoundError:
+            pass
+    for mtime, path in sorted(archives, reverse=True)[keep:]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def intercept_dependencies(intercepts_dir, scripts):
+    """
+    The scripts each of scripts has to run after: the scripts, and their
+    multilib variants, listed in its "##DEPENDS:" lines and, for a multilib
+    variant (<script>-<mlprefix>), the previous variants of the same script
+    as they share the native tools and caches.
+    """
+    def variants(name):
+        return [s for s in scripts if s == name or s.startswith(name + "-")]
+
+    # The multilib variants are copies of an intercept which is still there,
+    # even when it isn't run itself
+    names = os.listdir(intercepts_dir)
+    groups = {}
+    for script in scripts:
+        base = min((n for n in names if script.startswith(n + "-")), key=len, default=script)
+        groups.setdefault(base, []).append(script)
+
+    deps = {}
+    for script in scripts:
+        deps[script] = set()
+        with open(os.path.join(intercepts_dir, script), errors="replace") as f:
+            for line in f:
+                m = re.match(r"^##DEPENDS:(.*)", line)
+                if m is not None:
+                    for name in m.group(1).split():
+                        deps[script].update(variants(name))
+        deps[script].discard(script)
+
+    for base, group in groups.items():
+        group.sort(key=lambda s: (s != base, s))
+        for prev, script in zip(group, group[1:]):
+            deps[script].add(prev)
+    return deps
+
+def run_intercept_scripts(scripts, deps, run, jobs):
+    """
+    Call run(script) for each of scripts, up to jobs at the same time and
+    each one once those it depends on are done, yielding (script, result)
+    as they complete.
+    """
+    pending = dict((script, set(deps.get(script, ())) & set(scripts)) for script in scripts)
+    running = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    try:
+        while pending or running:
+            for script in sorted(s for s in pending if not pending[s]):
+                del pending[script]
+                running[executor.submit(run, script)] = script
+            if not running:
+                raise ValueError("Circular dependency between the intercept scripts %s" % " ".join(sorted(pending)))
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in sorted(done, key=running.get):
+                script = running.pop(future)
+                for waiting in pending.values():
+                    waiting.discard(script)
+                yield script, future.result()
+    finally:
+        # Don't start the queued scripts after a failure
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=True)
 
 class Indexer(object, metaclass=ABCMeta):
     def __init__(self, d, deploy_dir):
@@ -433,7 +576,8 @@ class PackageManager(object, metaclass=ABCMeta):
         bb.note("Running intercept scripts:")
         os.environ['D'] = self.target_rootfs
         os.environ['STAGING_DIR_NATIVE'] = self.d.getVar('STAGING_DIR_NATIVE')
-        for script in os.listdir(intercepts_dir):
+        scripts = []
+        for script in sorted(os.listdir(intercepts_dir)):
             script_full = os.path.join(intercepts_dir, script)
 
             if script == "postinst_intercept" or not os.access(script_full, os.X_OK):
@@ -449,28 +593,46 @@ class PackageManager(object, metaclass=ABCMeta):
                                 % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
                 continue
 
-            bb.note("> Executing %s intercept ..." % script)
+            scripts.append(script)
 
-            try:
-                output = subprocess.check_output(script_full, stderr=subprocess.STDOUT)
-                if output: bb.note(output.decode("utf-8"))
-            except subprocess.CalledProcessError as e:
-                bb.note("Exit code %d. Output:\n%s" % (e.returncode, e.output.decode("utf-8")))
-                if populate_sdk == 'host':
+        def run(script):
+            start = time.monotonic()
+            proc = subprocess.run(os.path.join(intercepts_dir, script), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            return proc.returncode, proc.stdout.decode("utf-8"), time.monotonic() - start
+
+        # Independent intercepts run at the same time, most of them spend
+        # their time in qemu usermode
+        bb.note("> Executing %s ..." % " ".join(scripts))
+        deps = intercept_dependencies(intercepts_dir, scripts)
+        jobs = int(self.d.getVar("BB_NUMBER_THREADS") or oe.utils.cpu_count())
+        timings = []
+        for script, (returncode, output, elapsed) in run_intercept_scripts(scripts, deps, run, jobs):
+            script_full = os.path.join(intercepts_dir, script)
+            timings.append((elapsed, script))
+            bb.note("> %s intercept done in %.2fs" % (script, elapsed))
+            if not returncode:
+                if output: bb.note(output)
+                continue
+
+            bb.note("Exit code %d. Output:\n%s" % (returncode, output))
+            if populate_sdk == 'host':
+                bb.fatal("The postinstall intercept hook '%s' failed, details in %s/log.do_%s" % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+            elif populate_sdk == 'target':
+                if "qemuwrapper: qemu usermode is not supported" in output:
+                    bb.note("The postinstall intercept hook '%s' could not be executed due to missing qemu usermode support, details in %s/log.do_%s"
+                            % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+                else:
                     bb.fatal("The postinstall intercept hook '%s' failed, details in %s/log.do_%s" % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
-                elif populate_sdk == 'target':
-                    if "qemuwrapper: qemu usermode is not supported" in e.output.decode("utf-8"):
-                        bb.note("The postinstall intercept hook '%s' could not be executed due to missing qemu usermode support, details in %s/log.do_%s"
-                                % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
-                    else:
-                        bb.fatal("The postinstall intercept hook '%s' failed, details in %s/log.do_%s" % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+            else:
+                if "qemuwrapper: qemu usermode is not supported" in output:
+                    bb.note("The postinstall intercept hook '%s' could not be executed due to missing qemu usermode support, details in %s/log.do_%s"
+                            % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+                    self._postpone_to_first_boot(script_full)
                 else:
-                    if "qemuwrapper: qemu usermode is not supported" in e.output.decode("utf-8"):
-                        bb.note("The postinstall intercept hook '%s' could not be executed due to missing qemu usermode support, details in %s/log.do_%s"
-                                % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
-                        self._postpone_to_first_boot(script_full)
-                    else:
-                        bb.fatal("The postinstall intercept hook '%s' failed, details in %s/log.do_%s" % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+                    bb.fatal("The postinstall intercept hook '%s' failed, details in %s/log.do_%s" % (script, self.d.getVar('T'), self.d.getVar('BB_CURRENTTASK')))
+
+        if timings:
+            bb.note("Intercept script timings:\n%s" % "".join("  %8.2fs %s\n" % t for t in sorted(timings, reverse=True)))
 
     @abstractmethod
     def update(self):
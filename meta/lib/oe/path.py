@@ -2,10 +2,14 @@
 # SPDX-License-Identifier: GPL-2.0-only
 #
 
+import concurrent.futures
 import errno
+import fcntl
 import glob
 import shutil
+import stat
 import subprocess
+import threading
 import os.path
 
 def join(*paths):
@@ -83,6 +87,242 @@ def format_display(path, metadata):
     else:
         return rel
 
+class NativeCopyError(Exception):
+    """The native tree copy engine could not handle the tree and the
+    caller should fall back to the tar based copy"""
+    pass
+
+# ioctl(2) request number for FICLONE (_IOW(0x94, 9, int))
+_FICLONE = 0x40049409
+
+# Maximum chunk size handed to a single copy_file_range()/sendfile() call
+_COPY_CHUNK = 1024 * 1024 * 1024
+
+def _copy_xattrs(src, dst):
+    try:
+        names = os.listxattr(src, follow_symlinks=False)
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            return
+        raise
+    for name in names:
+        value = os.getxattr(src, name, follow_symlinks=False)
+        try:
+            os.setxattr(dst, name, value, follow_symlinks=False)
+        except OSError as e:
+            if e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+                # Same as tar, the destination may not support xattrs at all
+                continue
+            raise NativeCopyError("Unable to set xattr %s on %s: %s" % (name, dst, e))
+
+def _copy_metadata(src, dst, st, chown):
+    # chown() can drop security xattrs and write permission is needed to
+    # set user xattrs so the order here matters
+    if chown:
+        os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+    _copy_xattrs(src, dst)
+    if not stat.S_ISLNK(st.st_mode):
+        os.chmod(dst, stat.S_IMODE(st.st_mode))
+    if not stat.S_ISLNK(st.st_mode) or os.utime in os.supports_follow_symlinks:
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+def _copy_range(sfd, dfd, offset, length):
+    """Copy length bytes at offset between two file descriptors"""
+    end = offset + length
+    while offset < end:
+        count = min(end - offset, _COPY_CHUNK)
+        if hasattr(os, "copy_file_range"):
+            try:
+                done = os.copy_file_range(sfd, dfd, count, offset, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                done = None
+            if done:
+                offset += done
+                continue
+        os.lseek(dfd, offset, os.SEEK_SET)
+        done = os.sendfile(dfd, sfd, offset, count)
+        if not done:
+            break
+        offset += done
+
+def _copy_file_data(src, dst, st):
+    """Copy the contents of src to dst, preferring a reflink and keeping
+    holes in sparse files"""
+    with open(src, "rb") as sf, open(dst, "wb") as df:
+        sfd = sf.fileno()
+        dfd = df.fileno()
+        if st.st_size == 0:
+            return
+        try:
+            fcntl.ioctl(dfd, _FICLONE, sfd)
+            return
+        except OSError:
+            pass
+
+        if st.st_blocks * 512 < st.st_size and hasattr(os, "SEEK_DATA"):
+            offset = 0
+            try:
+                while offset < st.st_size:
+                    try:
+                        start = os.lseek(sfd, offset, os.SEEK_DATA)
+                    except OSError as e:
+                        if e.errno == errno.ENXIO:
+                            # Only a hole is left
+                            break
+                        raise
+                    end = os.lseek(sfd, start, os.SEEK_HOLE)
+                    _copy_range(sfd, dfd, start, end - start)
+                    offset = end
+                os.ftruncate(dfd, st.st_size)
+                return
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                # Filesystem doesn't support SEEK_DATA, copy it densely
+                os.ftruncate(dfd, 0)
+        _copy_range(sfd, dfd, 0, st.st_size)
+
+def _remove_existing(dst):
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        shutil.rmtree(dst)
+    else:
+        os.unlink(dst)
+
+def _replace_existing(func, dst, *args):
+    try:
+        func(*args)
+    except FileExistsError:
+        _remove_existing(dst)
+        func(*args)
+
+class _TreeCopier(object):
+    """
+    Copy a directory tree using a pool of threads, each one scanning a single
+    directory at a time with os.scandir(). Directories are created as they are
+    found; their metadata is applied once all their contents are in place so
+    that timestamps survive. Files with more than one link are deferred until
+    the scan completes so the hardlink topology of the source is reproduced
+    in the destination.
+    """
+    def __init__(self, src, dst, hardlink=False, workers=None):
+        self.src = os.path.abspath(src)
+        self.dst = os.path.abspath(dst)
+        self.hardlink = hardlink
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        self.chown = os.geteuid() == 0
+        self.lock = threading.Lock()
+        self.dirs = []
+        self.multilinks = []
+
+    def copy_entry(self, spath, dpath, st):
+        mode = st.st_mode
+        if stat.S_ISLNK(mode):
+            _replace_existing(os.symlink, dpath, os.readlink(spath), dpath)
+        elif stat.S_ISREG(mode):
+            if self.hardlink:
+                _replace_existing(os.link, dpath, spath, dpath)
+                return
+            # Never write through an existing file, it may be read-only
+            # or hardlinked elsewhere
+            if os.path.lexists(dpath):
+                _remove_existing(dpath)
+            _copy_file_data(spath, dpath, st)
+        elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode) or stat.S_ISFIFO(mode):
+            if self.hardlink:
+                _replace_existing(os.link, dpath, spath, dpath)
+                return
+            try:
+                _replace_existing(os.mknod, dpath, dpath, mode, st.st_rdev)
+            except PermissionError as e:
+                raise NativeCopyError("Unable to create special file %s: %s" % (dpath, e))
+        elif stat.S_ISSOCK(mode):
+            # tar ignores sockets too
+            return
+        else:
+            raise NativeCopyError("Unknown file type for %s" % spath)
+        _copy_metadata(spath, dpath, st, self.chown)
+
+    def scan(self, rel):
+        spath = os.path.join(self.src, rel)
+        subdirs = []
+        with os.scandir(spath) as it:
+            entries = list(it)
+        for entry in entries:
+            erel = os.path.join(rel, entry.name)
+            st = entry.stat(follow_symlinks=False)
+            dpath = os.path.join(self.dst, erel)
+            if stat.S_ISDIR(st.st_mode):
+                followed = False
+                try:
+                    os.mkdir(dpath)
+                except FileExistsError:
+                    target = os.path.realpath(dpath)
+                    if self.hardlink and os.path.islink(dpath) and \
+                            (os.path.isdir(target) or not os.path.lexists(target)):
+                        # As tar -h does, populate the directory an existing
+                        # symlink points to (e.g. lib -> usr/lib with usrmerge)
+                        os.makedirs(target, exist_ok=True)
+                        followed = True
+                    elif not os.path.isdir(dpath) or os.path.islink(dpath):
+                        os.unlink(dpath)
+                        os.mkdir(dpath)
+                subdirs.append(erel)
+                if not followed:
+                    with self.lock:
+                        self.dirs.append((erel, st))
+            elif st.st_nlink > 1 and not stat.S_ISLNK(st.st_mode) and not self.hardlink:
+                with self.lock:
+                    self.multilinks.append(((st.st_dev, st.st_ino), erel, st))
+            else:
+                self.copy_entry(entry.path, dpath, st)
+        return subdirs
+
+    def copy(self):
+        os.makedirs(self.dst, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set([executor.submit(self.scan, "")])
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for subdir in future.result():
+                        pending.add(executor.submit(self.scan, subdir))
+
+        # First occurrence of an inode is copied, the others link to it
+        seen = {}
+        for key, rel, st in sorted(self.multilinks, key=lambda m: m[1]):
+            dpath = os.path.join(self.dst, rel)
+            if key in seen:
+                _replace_existing(os.link, dpath, seen[key], dpath)
+            else:
+                self.copy_entry(os.path.join(self.src, rel), dpath, st)
+                seen[key] = dpath
+
+        # Deepest directories first so parent timestamps aren't disturbed
+        for rel, st in sorted(self.dirs, key=lambda d: d[0].count(os.sep), reverse=True):
+            _copy_metadata(os.path.join(self.src, rel), os.path.join(self.dst, rel), st, self.chown)
+        _copy_metadata(self.src, self.dst, os.stat(self.src), self.chown)
+
+def native_copytree(src, dst, hardlink=False, workers=None):
+    """
+    Copy the tree at src into dst without spawning any external tools,
+    preserving permissions, timestamps, xattrs, sparse files and hardlinks
+    between files. Regular files are reflinked when the filesystem allows
+    it. If hardlink is True, files are hard linked rather than copied.
+    Raises NativeCopyError when the tree can't be copied natively.
+    """
+    try:
+        _TreeCopier(src, dst, hardlink, workers).copy()
+    except NativeCopyError:
+        raise
+    except OSError as e:
+        raise NativeCopyError(str(e))
+
+def _tar_copytree(src, dst):
+    cmd = "tar --xattrs --xattrs-include='*' -cf - -S -C %s -p . | tar --xattrs --xattrs-include='*' -xf - -C %s" % (src, dst)
+    subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
+
 def copytree(src, dst):
     # We could use something like shutil.copytree here but it turns out to
     # to be slow. It takes twice as long copying to an empty directory. 
@@ -90,8 +330,11 @@ def copytree(src, dst):
     # This way we also preserve hardlinks between files in the tree.
 
     bb.utils.mkdirhier(dst)
-    cmd = "tar --xattrs --xattrs-include='*' -cf - -S -C %s -p . | tar --xattrs --xattrs-include='*' -xf - -C %s" % (src, dst)
-    subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
+    try:
+        native_copytree(src, dst)
+    except NativeCopyError as e:
+        bb.debug(2, "Native tree copy failed (%s), falling back to tar" % str(e))
+        _tar_copytree(src, dst)
 
 def copyhardlinktree(src, dst):
     """Make a tree of hard links when possible, otherwise copy."""
@@ -115,6 +358,12 @@ def copyhardlinktree(src, dst):
             bb.debug(2, "Hardlink test failed with " + str(e))
 
     if (canhard):
+        if os.path.isdir(src):
+            try:
+                native_copytree(src, dst, hardlink=True)
+                return
+            except NativeCopyError as e:
+                bb.debug(2, "Native hardlink tree copy failed (%s), falling back to cp" % str(e))
         # Need to copy directories only with tar first since cp will error if two 
         # writers try and create a directory at the same time
         cmd = "cd %s; find . -type d -print | tar --xattrs --xattrs-include='*' -cf - -S -C %s -p --no-recursion --files-from - | tar --xattrs --xattrs-include='*' -xhf - -C %s" % (src, src, dst)
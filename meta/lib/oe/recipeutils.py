@@ -18,6 +18,9 @@ import shutil
 import re
 import fnmatch
 import glob
+import hashlib
+import json
+import time
 import bb.tinfoil
 
 from collections import OrderedDict, defaultdict
@@ -952,11 +955,15 @@ def get_recipe_pv_without_srcpv(pv, uri_type):
 
     return (pv, pfx, sfx)
 
-def get_recipe_upstream_version(rd):
+def get_recipe_upstream_version(rd, probe=None):
     """
         Get upstream version of recipe using bb.fetch2 methods with support for
         http, https, ftp and git.
 
+        probe is the (version, revision) result of an earlier upstream probe of
+        the recipe, as returned by _probe_upstream_version(), to use instead of
+        probing upstream again.
+
         bb.fetch2 exceptions can be raised,
             FetchError when don't have network access or upstream site don't response.
             NoMethodError when uri latest_versionstring method isn't implemented.
@@ -1010,15 +1017,13 @@ def get_recipe_upstream_version(rd):
         ru['type'] = 'A'
         ru['datetime'] = datetime.now()
     else:
-        ud = bb.fetch2.FetchData(src_uri, rd)
+        if probe is None:
+            probe = _probe_upstream_version(rd)
+        (upversion, revision) = probe
         if rd.getVar("UPSTREAM_CHECK_COMMITS") == "1":
-            revision = ud.method.latest_revision(ud, rd, 'default')
             upversion = pv
             if revision != rd.getVar("SRCREV"):
                 upversion = upversion + "-new-commits-available" 
-        else:
-            pupver = ud.method.latest_versionstring(ud, rd)
-            (upversion, revision) = pupver
 
         if upversion:
             ru['version'] = upversion
@@ -1031,8 +1036,113 @@ def get_recipe_upstream_version(rd):
 
     return ru
 
-def _get_recipe_upgrade_status(data):
-    uv = get_recipe_upstream_version(data)
+# Variables other than SRC_URI the result of an upstream probe depends on
+upstream_probe_vars = ('PV',
+                       'UPSTREAM_CHECK_COMMITS',
+                       'UPSTREAM_CHECK_GITTAGREGEX',
+                       'UPSTREAM_CHECK_REGEX',
+                       'UPSTREAM_CHECK_URI',
+                      )
+
+def _upstream_probe_key(rd):
+    """
+    Key of the upstream probe get_recipe_upstream_version() does for rd,
+    None if it does not probe upstream.
+    """
+    from bb.fetch2 import decodeurl
+
+    src_uris = rd.getVar('SRC_URI')
+    if not src_uris or rd.getVar('RECIPE_UPSTREAM_VERSION'):
+        return None
+    src_uri = src_uris.split()[0]
+    if decodeurl(src_uri)[0] == 'file':
+        return None
+    values = [src_uri] + [rd.getVar(var) or '' for var in upstream_probe_vars]
+    return hashlib.sha256('\0'.join(values).encode('utf-8')).hexdigest()
+
+def _upstream_probe_group(rd):
+    """
+    Upstream location probed for rd: the repository for git and the host of
+    the check URI otherwise.
+    """
+    from bb.fetch2 import decodeurl
+
+    uri_type, host, path, _, _, _ = decodeurl(rd.getVar('SRC_URI').split()[0])
+    if uri_type in ('git', 'gitsm'):
+        return (uri_type, host, path)
+    check_uri = rd.getVar('UPSTREAM_CHECK_URI')
+    if check_uri:
+        uri_type, host, _, _, _, _ = decodeurl(check_uri)
+    return (uri_type, host)
+
+def _probe_upstream_version(rd):
+    """
+    Probe upstream for the latest version of rd, returns (version, revision).
+    Only the latest revision is looked up when UPSTREAM_CHECK_COMMITS is set.
+    """
+    src_uri = rd.getVar('SRC_URI').split()[0]
+    ud = bb.fetch2.FetchData(src_uri, rd)
+    if rd.getVar("UPSTREAM_CHECK_COMMITS") == "1":
+        return ('', ud.method.latest_revision(ud, rd, 'default'))
+    return tuple(ud.method.latest_versionstring(ud, rd))
+
+def _upstream_probe_found(rd, probe):
+    """
+    Whether the (version, revision) probe of rd found anything. The fetchers
+    return empty values when upstream can't be reached, which must not be
+    cached.
+    """
+    version, revision = probe
+    if rd.getVar("UPSTREAM_CHECK_COMMITS") == "1":
+        return bool(revision)
+    return bool(version)
+
+def _upstream_probe_chunks(groups, jobs):
+    """
+    Split the lists of probes sharing an upstream location into chunks of at
+    most a worker's share of all the probes, largest chunks first.
+    """
+    total = sum(len(group) for group in groups)
+    size = max(1, -(-total // max(1, jobs)))
+    chunks = []
+    for group in groups:
+        for start in range(0, len(group), size):
+            chunks.append(group[start:start + size])
+    return sorted(chunks, key=len, reverse=True)
+
+def _probe_upstream_group(group):
+    """
+    Probe in turn the [(key, datastore)] of recipes sharing an upstream
+    location, returns [(key, (version, revision))].
+    """
+    return [(key, _probe_upstream_version(rd)) for key, rd in group]
+
+def _load_upstream_check_cache(path, timeout):
+    """
+    Returns the entries of the upstream check cache in path which are less
+    than timeout seconds old, key -> {'time', 'version', 'revision'}.
+    """
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {key: entry for key, entry in cache.items() if now - entry['time'] < timeout}
+
+def _save_upstream_check_cache(path, cache):
+    """
+    Write the upstream check cache to path, replacing it at once so that
+    concurrent readers never see a partial file.
+    """
+    bb.utils.mkdirhier(os.path.dirname(path))
+    tmpfile = '%s.%d' % (path, os.getpid())
+    with open(tmpfile, 'w') as f:
+        json.dump(cache, f, sort_keys=True)
+    os.replace(tmpfile, path)
+
+def _get_recipe_upgrade_status(data, probe=None):
+    uv = get_recipe_upstream_version(data, probe)
 
     pn = data.getVar('PN')
     cur_ver = uv['current_version']
@@ -1057,7 +1167,16 @@ def _get_recipe_upgrade_status(data):
     return (pn, status, cur_ver, next_ver, maintainer, revision, no_upgrade_reason)
 
 def get_recipe_upgrade_status(recipes=None):
-    pkgs_list = []
+    """
+    Returns (pn, status, current version, next version, maintainer, revision,
+    no upgrade reason) for the given recipes, all of them by default.
+
+    The recipes probing the same upstream repository or host are probed
+    together in a worker, up to a worker's share of the probes, and the
+    recipes with the same probe key only once. The probes which found a
+    version are kept in UPSTREAM_CHECK_CACHE for
+    UPSTREAM_CHECK_CACHE_TIMEOUT seconds.
+    """
     data_copy_list = []
     copy_vars = ('SRC_URI',
                  'PV',
@@ -1097,7 +1216,7 @@ def get_recipe_upgrade_status(recipes=None):
 
             unreliable = data.getVar('UPSTREAM_CHECK_UNRELIABLE')
             if unreliable == "1":
-                bb.note(" Skip package %s as upstream check unreliable" % pn)
+                bb.note(" Skip package %s as upstream check unreliable" % data.getVar('PN'))
                 continue
 
             data_copy = bb.data.init()
@@ -1109,8 +1228,41 @@ def get_recipe_upgrade_status(recipes=None):
 
             data_copy_list.append(data_copy)
 
+        cache_file = tinfoil.config_data.getVar('UPSTREAM_CHECK_CACHE')
+        cache_timeout = int(tinfoil.config_data.getVar('UPSTREAM_CHECK_CACHE_TIMEOUT') or 0)
+
+    cache = _load_upstream_check_cache(cache_file, cache_timeout) if cache_file else {}
+    probes = {key: (entry['version'], entry['revision']) for key, entry in cache.items()}
+
+    keys = []
+    # upstream location -> key -> datastore
+    groups = defaultdict(OrderedDict)
+    for data_copy in data_copy_list:
+        key = _upstream_probe_key(data_copy)
+        keys.append(key)
+        if key and key not in probes:
+            groups[_upstream_probe_group(data_copy)].setdefault(key, data_copy)
+    cached = len(set(keys) & probes.keys())
+
+    # Nothing is shared between the probes of a host, so its probes are
+    # spread over the workers when there are many of them
+    jobs = utils.cpu_count()
+    group_list = _upstream_probe_chunks([list(group.items()) for group in groups.values()], jobs)
+    found = 0
     from concurrent.futures import ProcessPoolExecutor
-    with ProcessPoolExecutor(max_workers=utils.cpu_count()) as executor:
-        pkgs_list = executor.map(_get_recipe_upgrade_status, data_copy_list)
-
-    return pkgs_list
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for group, results in zip(group_list, executor.map(_probe_upstream_group, group_list)):
+            now = time.time()
+            for (key, rd), (_, (version, revision)) in zip(group, results):
+                probes[key] = (version, revision)
+                if _upstream_probe_found(rd, (version, revision)):
+                    cache[key] = {'time': now, 'version': version, 'revision': revision}
+                    found += 1
+    bb.note(" %d upstream probes in %d groups, %d results from the cache" %
+            (sum(len(group) for group in group_list), len(group_list), cached))
+
+    if cache_file and found:
+        _save_upstream_check_cache(cache_file, cache)
+
+    return [_get_recipe_upgrade_status(data, probes.get(key))
+            for data, key in zip(data_copy_list, keys)]
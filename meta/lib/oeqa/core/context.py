@@ -72,7 +72,7 @@ class OETestContext(object):
                 modules_required, **kwargs)
         self.suites = self.loader.discover()
 
-    def runTests(self, processes=None, skips=[]):
+    def runTests(self, processes=None, skips=[], durations=None):
         self.runner = self.runnerClass(self, descriptions=False, verbosity=2)
 
         # Dinamically skip those tests specified though arguments
@@ -82,7 +82,7 @@ class OETestContext(object):
         if processes:
             from oeqa.core.utils.concurrencytest import ConcurrentTestSuite
 
-            concurrent_suite = ConcurrentTestSuite(self.suites, processes)
+            concurrent_suite = ConcurrentTestSuite(self.suites, processes, durations)
             result = self.runner.run(concurrent_suite)
         else:
             self.runner.buffer = True
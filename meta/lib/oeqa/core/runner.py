@@ -189,6 +189,8 @@ class OETestResult(_TestResult):
                 logs[status] = []
             logs[status].append("RESULTS - %s: %s%s" % (case.id(), status, t))
             report = {'status': status}
+            if case.id() in self.starttime and case.id() in self.endtime:
+                report['duration'] = self.endtime[case.id()] - self.starttime[case.id()]
             if log:
                 report['log'] = log
             if dump_streams and case.id() in self.logged_output:
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: MIT
+#
+
+import unittest
+import tempfile
+import json
+import os
+import subprocess
+from unittest import mock
+
+from common import setup_sys_path, TestBase
+setup_sys_path()
+
+try:
+    from oeqa.core.utils.concurrencytest import partition_tests, load_test_durations, \
+        prepare_builddir_template, clone_builddir
+except ImportError:
+    partition_tests = None
+
+@unittest.skipIf(partition_tests is None, "testtools/subunit not available")
+class TestPartition(TestBase):
+    class Slow(unittest.TestCase):
+        def test_a(self):
+            pass
+        def test_b(self):
+            pass
+
+    class Medium(unittest.TestCase):
+        def test_a(self):
+            pass
+
+    class Fast(unittest.TestCase):
+        def test_a(self):
+            pass
+
+    class Faster(unittest.TestCase):
+        def test_a(self):
+            pass
+
+    def _suite(self):
+        loader = unittest.TestLoader()
+        return unittest.TestSuite([loader.loadTestsFromTestCase(c) for c in (self.Slow, self.Fast, self.Faster, self.Medium)])
+
+    def _classes(self, partition):
+        return sorted(set(t.__class__.__name__ for t in partition))
+
+    def test_round_robin(self):
+        partitions, predicted = partition_tests(self._suite(), 2)
+        self.assertIsNone(predicted)
+        self.assertEqual(self._classes(partitions[0]), ['Faster', 'Slow'])
+        self.assertEqual(self._classes(partitions[1]), ['Fast', 'Medium'])
+
+    def test_longest_first(self):
+        durations = {
+            __name__ + '.Slow': 100.0,
+            __name__ + '.Medium': 60.0,
+            __name__ + '.Fast': 30.0,
+            __name__ + '.Faster': 10.0,
+        }
+        partitions, predicted = partition_tests(self._suite(), 2, durations)
+        self.assertEqual(self._classes(partitions[0]), ['Slow'])
+        self.assertEqual(self._classes(partitions[1]), ['Fast', 'Faster', 'Medium'])
+        self.assertEqual(predicted, [100.0, 100.0])
+
+        # Classes with unknown durations get the average of the known ones
+        partitions, predicted = partition_tests(self._suite(), 3, {__name__ + '.Slow': 90.0})
+        self.assertEqual(self._classes(partitions[0]), ['Fast', 'Slow'])
+        self.assertEqual(predicted, [180.0, 90.0, 90.0])
+
+    def test_load_durations(self):
+        results = {
+            'old': {'configuration': {'STARTTIME': '20190101000000'},
+                    'result': {'a.B.test_1': {'status': 'PASSED', 'duration': 50.0},
+                               'a.B.test_2': {'status': 'PASSED', 'duration': 5.0}}},
+            'new': {'configuration': {'STARTTIME': '20190202000000'},
+                    'result': {'a.B.test_1': {'status': 'PASSED', 'duration': 10.0},
+                               'a.C.test_1': {'status': 'FAILED'},
+                               'ptestresult.sections': {}}},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file = os.path.join(tmpdir, 'testresults.json')
+            with open(json_file, 'w') as f:
+                json.dump(results, f)
+            self.assertEqual(load_test_durations(json_file), {'a.B': 15.0})
+            self.assertEqual(load_test_durations(os.path.join(tmpdir, 'missing.json')), {})
+
+@unittest.skipIf(partition_tests is None, "testtools/subunit not available")
+class TestBuilddirClone(TestBase):
+    def setUp(self):
+        super(TestBuilddirClone, self).setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        environ = mock.patch.dict(os.environ, {'GIT_AUTHOR_NAME': 'oeqa', 'GIT_AUTHOR_EMAIL': 'oeqa@localhost',
+                                               'GIT_COMMITTER_NAME': 'oeqa', 'GIT_COMMITTER_EMAIL': 'oeqa@localhost'})
+        environ.start()
+        self.addCleanup(environ.stop)
+        # oe.path relies on bitbake having put bb into the builtins
+        import bb.utils, oe.path
+        oebb = mock.patch.object(oe.path, 'bb', bb, create=True)
+        oebb.start()
+        self.addCleanup(oebb.stop)
+
+        self.builddir = os.path.join(self.tmpdir.name, 'build')
+        self.selftestdir = os.path.join(self.tmpdir.name, 'meta-selftest')
+        self._write(self.builddir + '/conf/local.conf', 'MACHINE = "qemux86-64"\n')
+        self._write(self.builddir + '/conf/bblayers.conf', 'BBLAYERS = "/layers/meta %s"\n' % self.selftestdir)
+        self._write(self.builddir + '/cache/bb_cache.dat', 'cache')
+        # Hardlinked files in the cache stay hardlinked in the copies
+        os.link(self.builddir + '/cache/bb_cache.dat', self.builddir + '/cache/bb_cache.dat.hash')
+        self._write(self.selftestdir + '/conf/layer.conf', 'BBPATH .= ":${LAYERDIR}"\n')
+        self._write(self.selftestdir + '/recipes-test/foo/foo.bb', 'LICENSE = "MIT"\n')
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def _git(self, repo, *args):
+        return subprocess.check_output(('git',) + args, cwd=repo, universal_newlines=True)
+
+    def _check_clone(self, newbuilddir, newselftestdir):
+        self.assertEqual(self._read(newbuilddir + '/conf/local.conf'), 'MACHINE = "qemux86-64"\n')
+        self.assertEqual(self._read(newbuilddir + '/conf/bblayers.conf'), 'BBLAYERS = "/layers/meta %s"\n' % newselftestdir)
+        self.assertEqual(self._read(newbuilddir + '/cache/bb_cache.dat'), 'cache')
+        self.assertEqual(os.stat(newbuilddir + '/cache/bb_cache.dat').st_ino,
+                         os.stat(newbuilddir + '/cache/bb_cache.dat.hash').st_ino)
+        self.assertNotEqual(os.stat(newbuilddir + '/cache/bb_cache.dat').st_ino,
+                            os.stat(self.builddir + '/cache/bb_cache.dat').st_ino)
+        self.assertEqual(self._read(newselftestdir + '/recipes-test/foo/foo.bb'), 'LICENSE = "MIT"\n')
+        # A committed layer with nothing to commit
+        self.assertEqual(self._git(newselftestdir, 'status', '--porcelain'), '')
+        self.assertEqual(self._git(newselftestdir, 'ls-files').split(), ['conf/layer.conf', 'recipes-test/foo/foo.bb'])
+
+    def test_template(self):
+        template = prepare_builddir_template(self.builddir, self.selftestdir)
+        self.assertEqual(template, self.builddir + '-st-template')
+        self.assertTrue(os.path.isdir(template + '/workerstats'))
+
+        clones = []
+        for i in range(2):
+            newbuilddir = self.builddir + '-st-%d' % i
+            newselftestdir = newbuilddir + '/meta-selftest'
+            clone_builddir(self.builddir, newbuilddir, self.selftestdir, newselftestdir, template)
+            self._check_clone(newbuilddir, newselftestdir)
+            self.assertEqual(self._read(newselftestdir + '/.git/objects/info/alternates'), template + '/objects\n')
+            clones.append(newselftestdir)
+
+        # The clones share the objects of the template, what they commit
+        # is only in their own store
+        objects = sorted(os.listdir(template + '/objects'))
+        self._write(clones[0] + '/recipes-test/foo/foo.bbappend', 'PR = "r1"\n')
+        self._git(clones[0], 'add', 'recipes-test/foo/foo.bbappend')
+        self._git(clones[0], 'commit', '-q', '-m', 'append')
+        self.assertEqual(sorted(os.listdir(template + '/objects')), objects)
+        self.assertEqual(self._git(clones[1], 'status', '--porcelain'), '')
+        self.assertEqual(len(self._git(clones[1], 'log', '--oneline').splitlines()), 1)
+
+    def test_no_template(self):
+        newbuilddir = self.builddir + '-st-0'
+        newselftestdir = newbuilddir + '/meta-selftest'
+        clone_builddir(self.builddir, newbuilddir, self.selftestdir, newselftestdir, None)
+        self._check_clone(newbuilddir, newselftestdir)
+        self.assertFalse(os.path.exists(newselftestdir + '/.git/objects/info/alternates'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ import threading
 import time
 import io
 import json
+import heapq
 import subunit
 
 from queue import Queue
@@ -31,7 +32,7 @@ from subunit.test_results import AutoTimingTestResultDecorator
 from testtools import ThreadsafeForwardingResult, iterate_tests
 from testtools.content import Content
 from testtools.content_type import ContentType
-from oeqa.utils.commands import get_test_layer
+from oeqa.utils.commands import get_test_layer, bb_var_cache
 
 import bb.utils
 import oe.path
@@ -39,6 +40,7 @@ import oe.path
 _all__ = [
     'ConcurrentTestSuite',
     'fork_for_tests',
+    'load_test_durations',
     'partition_tests',
 ]
 
@@ -163,12 +165,18 @@ class dummybuf(object):
 #
 class ConcurrentTestSuite(unittest.TestSuite):
 
-    def __init__(self, suite, processes):
+    def __init__(self, suite, processes, durations=None):
         super(ConcurrentTestSuite, self).__init__([suite])
         self.processes = processes
+        self.durations = durations
 
     def run(self, result):
-        tests, totaltests = fork_for_tests(self.processes, self)
+        template = None
+        if 'BUILDDIR' in os.environ:
+            template = prepare_builddir_template(os.environ['BUILDDIR'], get_test_layer())
+        tests, totaltests, predicted = fork_for_tests(self.processes, self, self.durations, template)
+        starttime = time.time()
+        self.endtimes = {}
         try:
             threads = {}
             queue = Queue()
@@ -195,6 +203,7 @@ class ConcurrentTestSuite(unittest.TestSuite):
                 finished_test = queue.get()
                 threads[finished_test][0].join()
                 del threads[finished_test]
+            self.report_makespan(result, starttime, [t[0] for t in tests], predicted)
         except:
             for thread, process_result in threads.values():
                 process_result.stop()
@@ -202,6 +211,9 @@ class ConcurrentTestSuite(unittest.TestSuite):
         finally:
             for test in tests:
                 test[0]._stream.close()
+            if template:
+                report_worker_stats(result, template)
+                removebuilddir(template)
 
     def _run_test(self, test, process_result, queue):
         try:
@@ -214,8 +226,21 @@ class ConcurrentTestSuite(unittest.TestSuite):
                     error=sys.exc_info())
                 case.run(process_result)
         finally:
+            self.endtimes[test] = time.time()
             queue.put(test)
 
+    def report_makespan(self, result, starttime, tests, predicted):
+        actual = [self.endtimes[t] - starttime for t in tests if t in self.endtimes]
+        if not actual or not hasattr(result, "tc"):
+            return
+        result.makespan = {'predicted' : predicted, 'actual' : actual}
+        if predicted:
+            result.tc.logger.info("Predicted makespan %.2fs, actual %.2fs" % (max(predicted), max(actual)))
+            for i, (p, a) in enumerate(zip(predicted, actual)):
+                result.tc.logger.info("  process %s: predicted %.2fs, actual %.2fs" % (i, p, a))
+        else:
+            result.tc.logger.info("Makespan %.2fs (no previous test durations available)" % max(actual))
+
 def removebuilddir(d):
     delay = 5
     while delay and os.path.exists(d + "/bitbake.lock"):
@@ -232,12 +257,74 @@ def removebuilddir(d):
             pass
     bb.utils.prunedir(d, ionice=True)
 
-def fork_for_tests(concurrency_num, suite):
+def prepare_builddir_template(builddir, selftestdir):
+    """
+    Prepare the parts of the per process build directories which are the
+    same for every process, once. This is a committed git repository of the
+    selftest layer whose objects are kept in a separate store; the copies
+    made by clone_builddir() reference that store through git alternates
+    rather than each hashing and committing the whole layer again.
+    """
+    template = builddir + "-st-template"
+    if os.path.exists(template):
+        removebuilddir(template)
+    templatelayer = template + "/meta-selftest"
+    bb.utils.mkdirhier(template + "/workerstats")
+    oe.path.copytree(selftestdir, templatelayer)
+    subprocess.check_output("git init; git add *; git commit -a -m 'initial'", cwd=templatelayer, shell=True)
+
+    # Git objects are never modified once written so one store can be shared,
+    # anything the tests commit lands in the objects directory of each clone
+    objects = templatelayer + "/.git/objects"
+    os.rename(objects, template + "/objects")
+    bb.utils.mkdirhier(objects + "/info")
+    bb.utils.mkdirhier(objects + "/pack")
+    with open(objects + "/info/alternates", "w") as f:
+        f.write(template + "/objects\n")
+    return template
+
+def clone_builddir(builddir, newbuilddir, selftestdir, newselftestdir, template):
+    """
+    Create the build directory for a test process. Files are reflinked
+    when the filesystem supports it so only the metadata gets copied.
+    """
+    bb.utils.mkdirhier(newbuilddir)
+    oe.path.copytree(builddir + "/conf", newbuilddir + "/conf")
+    oe.path.copytree(builddir + "/cache", newbuilddir + "/cache")
+    if template:
+        oe.path.copytree(template + "/meta-selftest", newselftestdir)
+    else:
+        oe.path.copytree(selftestdir, newselftestdir)
+        subprocess.check_output("git init; git add *; git commit -a -m 'initial'", cwd=newselftestdir, shell=True)
+
+    # Tried to used bitbake-layers add/remove but it requires recipe parsing and hence is too slow
+    bblayers = newbuilddir + "/conf/bblayers.conf"
+    with open(bblayers, "r") as f:
+        data = f.read()
+    with open(bblayers, "w") as f:
+        f.write(data.replace(selftestdir, newselftestdir))
+
+def report_worker_stats(result, template):
+    setuptimes = []
+    cachestats = [0, 0]
+    statsdir = template + "/workerstats"
+    for pid in sorted(os.listdir(statsdir)):
+        with open(os.path.join(statsdir, pid), "r") as f:
+            stats = json.load(f)
+        setuptimes.append(stats['setup'])
+        cachestats = [x + y for x, y in zip(cachestats, stats['bbvarcache'])]
+    result.bbvarcache = cachestats
+    if setuptimes and hasattr(result, "tc"):
+        result.setuptimes = setuptimes
+        result.tc.logger.info("Build directory setup: %.2fs average, %.2fs maximum over %s processes" %
+                              (sum(setuptimes) / len(setuptimes), max(setuptimes), len(setuptimes)))
+
+def fork_for_tests(concurrency_num, suite, durations=None, template=None):
     result = []
     if 'BUILDDIR' in os.environ:
         selftestdir = get_test_layer()
 
-    test_blocks = partition_tests(suite, concurrency_num)
+    test_blocks, predicted = partition_tests(suite, concurrency_num, durations)
     # Clear the tests from the original suite so it doesn't keep them alive
     suite._tests[:] = []
     totaltests = sum(len(x) for x in test_blocks)
@@ -257,27 +344,21 @@ def fork_for_tests(concurrency_num, suite):
                 newbuilddir = None
                 stream = os.fdopen(c2pwrite, 'wb', 1)
                 os.close(c2pread)
+                bb_var_cache.hits = bb_var_cache.misses = 0
 
                 # Create a new separate BUILDDIR for each group of tests
                 if 'BUILDDIR' in os.environ:
+                    setupstart = time.time()
                     builddir = os.environ['BUILDDIR']
                     newbuilddir = builddir + "-st-" + str(ourpid)
                     newselftestdir = newbuilddir + "/meta-selftest"
 
-                    bb.utils.mkdirhier(newbuilddir)
-                    oe.path.copytree(builddir + "/conf", newbuilddir + "/conf")
-                    oe.path.copytree(builddir + "/cache", newbuilddir + "/cache")
-                    oe.path.copytree(selftestdir, newselftestdir)
+                    clone_builddir(builddir, newbuilddir, selftestdir, newselftestdir, template)
 
                     for e in os.environ:
                         if builddir in os.environ[e]:
                             os.environ[e] = os.environ[e].replace(builddir, newbuilddir)
 
-                    subprocess.check_output("git init; git add *; git commit -a -m 'initial'", cwd=newselftestdir, shell=True)
-
-                    # Tried to used bitbake-layers add/remove but it requires recipe parsing and hence is too slow
-                    subprocess.check_output("sed %s/conf/bblayers.conf -i -e 's#%s#%s#g'" % (newbuilddir, selftestdir, newselftestdir), cwd=newbuilddir, shell=True)
-
                     os.chdir(newbuilddir)
 
                     for t in process_suite:
@@ -289,6 +370,7 @@ def fork_for_tests(concurrency_num, suite):
                                 cp[p] = cp[p].replace(selftestdir, newselftestdir)
                             if builddir in cp[p] and newbuilddir not in cp[p]:
                                 cp[p] = cp[p].replace(builddir, newbuilddir)
+                    setuptime = time.time() - setupstart
 
                 # Leave stderr and stdout open so we can see test noise
                 # Close stdin so that the child goes away if it decides to
@@ -303,6 +385,10 @@ def fork_for_tests(concurrency_num, suite):
                 subunit_client.buffer = True
                 subunit_result = AutoTimingTestResultDecorator(subunit_client)
                 process_suite.run(ExtraResultsEncoderTestResult(subunit_result))
+                if template:
+                    with open("%s/workerstats/%s" % (template, ourpid), "w") as f:
+                        json.dump({'setup' : setuptime,
+                                   'bbvarcache' : [bb_var_cache.hits, bb_var_cache.misses]}, f)
                 if ourpid != os.getpid():
                     os._exit(0)
                 if newbuilddir:
@@ -332,9 +418,36 @@ def fork_for_tests(concurrency_num, suite):
             stream = os.fdopen(c2pread, 'rb', 1)
             test = ProtocolTestCase(stream)
             result.append((test, numtests))
-    return result, totaltests
-
-def partition_tests(suite, count):
+    return result, totaltests, predicted
+
+def load_test_durations(json_file):
+    """
+    Read the per test durations recorded by OETestResult.logDetails() in a
+    testresults.json file and return the total duration of each test class,
+    keyed by "<module>.<class>". When a test appears in several results the
+    most recent one is used.
+    """
+    if not os.path.exists(json_file):
+        return {}
+    with open(json_file, "r") as f:
+        try:
+            testresults = json.load(f)
+        except ValueError:
+            return {}
+
+    tests = {}
+    for result_id in sorted(testresults, key=lambda r: testresults[r].get('configuration', {}).get('STARTTIME', '')):
+        for test, report in testresults[result_id].get('result', {}).items():
+            if isinstance(report, dict) and 'duration' in report:
+                tests[test] = report['duration']
+
+    durations = {}
+    for test, duration in tests.items():
+        m = test.rsplit(".", 1)[0]
+        durations[m] = durations.get(m, 0) + duration
+    return durations
+
+def partition_tests(suite, count, durations=None):
     # Keep tests from the same class together but allow tests from modules
     # to go to different processes to aid parallelisation.
     modules = {}
@@ -344,11 +457,33 @@ def partition_tests(suite, count):
             modules[m] = []
         modules[m].append(test)
 
-    # Simply divide the test blocks between the available processes
     partitions = [list() for _ in range(count)]
-    for partition, m in zip(cycle(partitions), modules):
-        partition.extend(modules[m])
-
-    # No point in empty threads so drop them
-    return [p for p in partitions if p]
+    if not durations:
+        # Simply divide the test blocks between the available processes
+        for partition, m in zip(cycle(partitions), modules):
+            partition.extend(modules[m])
+
+        # No point in empty threads so drop them
+        return [p for p in partitions if p], None
+
+    # Classes with no recorded duration are assumed to take as long as the
+    # average known class
+    known = [durations[m] for m in modules if m in durations]
+    default = sum(known) / len(known) if known else 1.0
+    estimates = dict((m, durations.get(m, default)) for m in modules)
+
+    # Longest processing time first: hand the slowest remaining class to the
+    # least loaded process
+    loads = [(0.0, i) for i in range(count)]
+    for m in sorted(modules, key=lambda m: (-estimates[m], m)):
+        load, i = heapq.heappop(loads)
+        partitions[i].extend(modules[m])
+        heapq.heappush(loads, (load + estimates[m], i))
+
+    predicted = [0.0] * count
+    for load, i in loads:
+        predicted[i] = load
+
+    used = [i for i in range(count) if partitions[i]]
+    return [partitions[i] for i in used], [predicted[i] for i in used]
 
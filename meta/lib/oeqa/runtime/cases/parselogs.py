@@ -3,9 +3,10 @@
 #
 
 import os
+import re
+import tarfile
 
-from subprocess import check_output
-from shutil import rmtree
+from shutil import copyfileobj, rmtree
 from oeqa.runtime.case import OERuntimeTestCase
 from oeqa.core.decorator.depends import OETestDepends
 from oeqa.core.decorator.data import skipIfDataVar
@@ -250,25 +251,17 @@ class ParseLogsTest(OERuntimeTestCase):
 
     # Go through the log locations provided and if it's a folder
     # create a list with all the .log files in it, if it's a file
-    # just add it to that list.
+    # just add it to that list. A single command lists them all.
     def getLogList(self, log_locations):
-        logs = []
-        for location in log_locations:
-            status, _ = self.target.run('test -f ' + str(location))
-            if status == 0:
-                logs.append(str(location))
-            else:
-                status, _ = self.target.run('test -d ' + str(location))
-                if status == 0:
-                    cmd = 'find ' + str(location) + '/*.log -maxdepth 1 -type f'
-                    status, output = self.target.run(cmd)
-                    if status == 0:
-                        output = output.splitlines()
-                        for logfile in output:
-                            logs.append(os.path.join(location, str(logfile)))
-        return logs
-
-    # Copy the log files to be parsed locally
+        cmd = ('for location in %s; do '
+               'if [ -f "$location" ]; then echo "$location"; '
+               'elif [ -d "$location" ]; then find "$location"/*.log -maxdepth 1 -type f; fi; '
+               'done' % ' '.join(str(location) for location in log_locations))
+        status, output = self.target.run(cmd)
+        return [logfile for logfile in output.splitlines() if logfile.startswith('/')]
+
+    # Copy the log files to be parsed locally, in a single archive when
+    # the target has tar
     def transfer_logs(self, log_list):
         workdir = self.getWorkdir()
         self.target_logs = workdir + '/' + 'target_logs'
@@ -276,6 +269,24 @@ class ParseLogsTest(OERuntimeTestCase):
         if os.path.exists(target_logs):
             rmtree(self.target_logs)
         os.makedirs(target_logs)
+        if not log_list:
+            return
+
+        archive = '/tmp/parselogs-target-logs.tar'
+        status, _ = self.target.run('tar -chf %s %s' % (archive, ' '.join(log_list)))
+        if status == 0:
+            local_archive = os.path.join(workdir, os.path.basename(archive))
+            self.target.copyFrom(archive, local_archive)
+            self.target.run('rm -f %s' % archive)
+            with tarfile.open(local_archive) as tar:
+                for member in tar:
+                    if member.isfile():
+                        # Flattened, as copying the files one by one does
+                        with open(os.path.join(target_logs, os.path.basename(member.name)), 'wb') as f:
+                            copyfileobj(tar.extractfile(member), f)
+            os.remove(local_archive)
+            return
+
         for f in log_list:
             self.target.copyFrom(str(f), target_logs)
 
@@ -287,14 +298,10 @@ class ParseLogsTest(OERuntimeTestCase):
         logs = [f for f in dir_files if os.path.isfile(f)]
         return logs
 
-    # Build the grep command to be used with filters and exclusions
-    def build_grepcmd(self, errors, ignore_errors, log):
-        grepcmd = 'grep '
-        grepcmd += '-Ei "'
-        for error in errors:
-            grepcmd += '\<' + error + '\>' + '|'
-        grepcmd = grepcmd[:-1]
-        grepcmd += '" ' + str(log) + " | grep -Eiv \'"
+    # Build the regular expressions matching the errors and the errors
+    # to ignore, which are literal strings but for '0-9' and '.'
+    def build_matchers(self, errors, ignore_errors):
+        error_re = re.compile(r'\b(?:' + '|'.join(errors) + r')\b', re.IGNORECASE)
 
         try:
             errorlist = ignore_errors[self.getMachine()]
@@ -302,6 +309,7 @@ class ParseLogsTest(OERuntimeTestCase):
             self.msg += 'No ignore list found for this machine, using default\n'
             errorlist = ignore_errors['default']
 
+        ignores = []
         for ignore_error in errorlist:
             ignore_error = ignore_error.replace('(', '\(')
             ignore_error = ignore_error.replace(')', '\)')
@@ -311,41 +319,49 @@ class ParseLogsTest(OERuntimeTestCase):
             ignore_error = ignore_error.replace(']', '\]')
             ignore_error = ignore_error.replace('*', '\*')
             ignore_error = ignore_error.replace('0-9', '[0-9]')
-            grepcmd += ignore_error + '|'
-        grepcmd = grepcmd[:-1]
-        grepcmd += "\'"
+            ignores.append(ignore_error)
+        ignore_re = re.compile('|'.join(ignores), re.IGNORECASE) if ignores else None
 
-        return grepcmd
+        return error_re, ignore_re
 
-    # Grep only the errors so that their context could be collected.
-    # Default context is 10 lines before and after the error itself
+    # Find the errors in a first pass over each log and collect their
+    # context in a second one, as grep -F does: around every line
+    # containing the error line, 10 lines before and after by default,
+    # overlapping contexts being merged.
     def parse_logs(self, errors, ignore_errors, logs,
                    lines_before = 10, lines_after = 10):
         results = {}
-        rez = []
-        grep_output = ''
+        error_re, ignore_re = self.build_matchers(errors, ignore_errors)
 
         for log in logs:
-            result = None
-            thegrep = self.build_grepcmd(errors, ignore_errors, log)
-
-            try:
-                result = check_output(thegrep, shell=True).decode('utf-8')
-            except:
-                pass
+            with open(log, encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+
+            found = dict.fromkeys(line for line in lines
+                                  if error_re.search(line) and not (ignore_re and ignore_re.search(line)))
+
+            if found:
+                indexes = dict((line, []) for line in found)
+                found_re = re.compile('|'.join(re.escape(line) for line in found))
+                for index, l in enumerate(lines):
+                    if found_re.search(l):
+                        # The error lines found in this line may overlap
+                        for line in found:
+                            if line in l:
+                                indexes[line].append(index)
 
-            if result is not None:
                 results[log] = {}
-                rez = result.splitlines()
-
-                for xrez in rez:
-                    try:
-                        cmd = ['grep', '-F', xrez, '-B', str(lines_before)]
-                        cmd += ['-A', str(lines_after), log]
-                        grep_output = check_output(cmd).decode('utf-8')
-                    except:
-                        pass
-                    results[log][xrez]=grep_output
+                for line in found:
+                    context = []
+                    end = None
+                    for index in indexes[line]:
+                        first = max(0, index - lines_before)
+                        if end is not None and first > end:
+                            context.append('--')
+                        first = max(first, end or 0)
+                        end = min(len(lines), index + lines_after + 1)
+                        context.extend(lines[first:end])
+                    results[log][line] = '\n'.join(context) + '\n'
 
         return results
 
@@ -12,7 +12,7 @@ import errno
 from unittest.util import safe_repr
 
 import oeqa.utils.ftools as ftools
-from oeqa.utils.commands import runCmd, bitbake, get_bb_var
+from oeqa.utils.commands import runCmd, bitbake, get_bb_var, bb_var_cache
 from oeqa.core.case import OETestCase
 
 import bb.utils
@@ -205,6 +205,7 @@ to ensure accurate results.")
 
         self.logger.debug("Writing to: %s\n%s\n" % (dest_path, data))
         ftools.write_file(dest_path, data)
+        bb_var_cache.invalidate()
 
         if not multiconfig and self.tc.custommachine and 'MACHINE' in data:
             machine = get_bb_var('MACHINE')
@@ -214,6 +215,7 @@ to ensure accurate results.")
         """Append to <builddir>/conf/selftest.inc"""
         self.logger.debug("Appending to: %s\n%s\n" % (self.testinc_path, data))
         ftools.append_file(self.testinc_path, data)
+        bb_var_cache.invalidate()
 
         if self.tc.custommachine and 'MACHINE' in data:
             machine = get_bb_var('MACHINE')
@@ -223,6 +225,7 @@ to ensure accurate results.")
         """Remove data from <builddir>/conf/selftest.inc"""
         self.logger.debug("Removing from: %s\n%s\n" % (self.testinc_path, data))
         ftools.remove_from_file(self.testinc_path, data)
+        bb_var_cache.invalidate()
 
     def recipeinc(self, recipe):
         """Return absolute path of meta-selftest/recipes-test/<recipe>/test_recipe.inc"""
@@ -233,6 +236,7 @@ to ensure accurate results.")
         inc_file = self.recipeinc(recipe)
         self.logger.debug("Writing to: %s\n%s\n" % (inc_file, data))
         ftools.write_file(inc_file, data)
+        bb_var_cache.invalidate()
         return inc_file
 
     def append_recipeinc(self, recipe, data):
@@ -240,6 +244,7 @@ to ensure accurate results.")
         inc_file = self.recipeinc(recipe)
         self.logger.debug("Appending to: %s\n%s\n" % (inc_file, data))
         ftools.append_file(inc_file, data)
+        bb_var_cache.invalidate()
         return inc_file
 
     def remove_recipeinc(self, recipe, data):
@@ -247,6 +252,7 @@ to ensure accurate results.")
         inc_file = self.recipeinc(recipe)
         self.logger.debug("Removing from: %s\n%s\n" % (inc_file, data))
         ftools.remove_from_file(inc_file, data)
+        bb_var_cache.invalidate()
 
     def delete_recipeinc(self, recipe):
         """Delete meta-selftest/recipes-test/<recipe>/test_recipe.inc file"""
@@ -257,25 +263,31 @@ to ensure accurate results.")
         except OSError as e:
             if e.errno != errno.ENOENT:
                 raise
+        bb_var_cache.invalidate()
+
     def write_bblayers_config(self, data):
         """Write to <builddir>/conf/bblayers.inc"""
         self.logger.debug("Writing to: %s\n%s\n" % (self.testinc_bblayers_path, data))
         ftools.write_file(self.testinc_bblayers_path, data)
+        bb_var_cache.invalidate()
 
     def append_bblayers_config(self, data):
         """Append to <builddir>/conf/bblayers.inc"""
         self.logger.debug("Appending to: %s\n%s\n" % (self.testinc_bblayers_path, data))
         ftools.append_file(self.testinc_bblayers_path, data)
+        bb_var_cache.invalidate()
 
     def remove_bblayers_config(self, data):
         """Remove data from <builddir>/conf/bblayers.inc"""
         self.logger.debug("Removing from: %s\n%s\n" % (self.testinc_bblayers_path, data))
         ftools.remove_from_file(self.testinc_bblayers_path, data)
+        bb_var_cache.invalidate()
 
     def set_machine_config(self, data):
         """Write to <builddir>/conf/machine.inc"""
         self.logger.debug("Writing to: %s\n%s\n" % (self.machineinc_path, data))
         ftools.write_file(self.machineinc_path, data)
+        bb_var_cache.invalidate()
 
     # check does path exist
     def assertExists(self, expr, msg=None):
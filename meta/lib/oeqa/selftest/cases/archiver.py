@@ -254,3 +254,27 @@ class Archiver(OESelftestTestCase):
             glob_str = os.path.join(bb_vars['DEPLOY_DIR_SRC'], 'mirror', target_file_name)
             glob_result = glob.glob(glob_str)
             self.assertTrue(glob_result, 'Missing archive file %s' % (target_file_name))
+
+    def test_archiver_mode_compression_rerun(self):
+        """
+        Test that changing `ARCHIVER_MODE[compression-patched]` reruns
+        do_ar_patched instead of reusing the archive of the previous setting.
+        """
+
+        target = "selftest-ed"
+        features = 'INHERIT += "archiver"\n'
+        features += 'ARCHIVER_MODE[src] = "patched"\n'
+        self.write_config(features + 'ARCHIVER_MODE[compression-patched] = "gz"\n')
+        bitbake('-c clean %s' % (target))
+        bitbake('-c deploy_archives %s' % (target))
+
+        self.write_config(features + 'ARCHIVER_MODE[compression-patched] = "xz"\n')
+        result = bitbake('-c deploy_archives %s' % (target))
+        self.assertIn('do_ar_patched', result.output)
+
+        bb_vars = get_bb_vars(['DEPLOY_DIR_SRC', 'TARGET_SYS'])
+        glob_str = os.path.join(bb_vars['DEPLOY_DIR_SRC'], bb_vars['TARGET_SYS'], '%s-*' % (target))
+        glob_result = glob.glob(glob_str)
+        self.assertTrue(glob_result, 'Missing archiver directory for %s' % (target))
+        self.assertTrue(os.path.exists(os.path.join(glob_result[0], 'selftest-ed-1.14.1-r0-patched.tar.xz')),
+                        'do_ar_patched was not rerun with the new compression')
@@ -0,0 +1,153 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+import os
+import random
+import tempfile
+import time
+from oeqa.selftest.case import OESelftestTestCase
+from oeqa.selftest.cases.buildstatstests import basepath, scripts_buildstats
+from oeqa.utils.commands import runCmd
+
+BuildStats = scripts_buildstats.BuildStats
+BSCriticalPath = scripts_buildstats.BSCriticalPath
+BSRecipe = scripts_buildstats.BSRecipe
+BSTask = scripts_buildstats.BSTask
+BSTaskGraph = scripts_buildstats.BSTaskGraph
+
+class BuildstatsCriticalPathTests(OESelftestTestCase):
+    # e.do_populate_lic is needed by c.do_install but missing from the
+    # buildstats, d.do_compile depends on nothing and nothing depends on it
+    task_depends = """digraph depends {
+"a.do_fetch" [label="a do_fetch\\n:1.0-r0\\n/meta/recipes/a/a_1.0.bb"]
+"a.do_compile" [label="a do_compile\\n:1.0-r0\\n/meta/recipes/a/a_1.0.bb"]
+"a.do_compile" -> "a.do_fetch"
+"b.do_compile" [label="b do_compile\\n:1.0-r0\\n/meta/recipes/b/b_1.0.bb"]
+"b.do_compile" -> "a.do_fetch"
+"c.do_install" [label="c do_install\\n:1.0-r0\\n/meta/recipes/c/c_1.0.bb"]
+"c.do_install" -> "a.do_compile"
+"c.do_install" -> "b.do_compile"
+"c.do_install" -> "e.do_populate_lic"
+"d.do_compile" [label="d do_compile\\n:1.0-r0\\n/meta/recipes/d/d_1.0.bb"]
+"e.do_populate_lic" [label="e do_populate_lic\\n:1.0-r0\\n/meta/recipes/e/e_1.0.bb"]
+"e.do_populate_lic" -> "a.do_fetch"
+}
+"""
+
+    # Start and end times of the tasks, relative to the start of the build
+    times = {
+        'a': {'do_fetch': (0, 2), 'do_compile': (2, 12)},
+        'b': {'do_compile': (3, 7)},
+        'c': {'do_install': (12, 15)},
+        'd': {'do_compile': (1, 6)},
+    }
+
+    def write_build(self, tmpdir):
+        dot = os.path.join(tmpdir, 'task-depends.dot')
+        with open(dot, 'w') as f:
+            f.write(self.task_depends)
+        path = os.path.join(tmpdir, '20200101000000')
+        os.makedirs(path)
+        with open(os.path.join(path, 'build_stats'), 'w') as f:
+            f.write('Build Started: 1000.00\n')
+        for recipe, tasks in self.times.items():
+            os.makedirs(os.path.join(path, '%s-1.0-r0' % recipe))
+            for task, (start, end) in tasks.items():
+                with open(os.path.join(path, '%s-1.0-r0' % recipe, task), 'w') as f:
+                    f.write('Started: %0.2f\nStatus: PASSED\nEnded: %0.2f\n' % (1000 + start, 1000 + end))
+        return path, dot
+
+    def analyse(self, tmpdir):
+        path, dot = self.write_build(tmpdir)
+        return BSCriticalPath(BuildStats.from_dir(path), BSTaskGraph.from_dot(dot))
+
+    def test_graph(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph = BSTaskGraph.from_dot(self.write_build(tmpdir)[1])
+        self.assertEqual(graph.deps['c.do_install'], set(['a.do_compile', 'b.do_compile', 'e.do_populate_lic']))
+        self.assertEqual(graph.deps['d.do_compile'], set())
+        order = graph.topological_order()
+        self.assertEqual(len(order), 6)
+        for node, deps in graph.deps.items():
+            for dep in deps:
+                self.assertLess(order.index(dep), order.index(node))
+
+        graph.deps['a.do_fetch'].add('c.do_install')
+        with self.assertRaises(scripts_buildstats.BSError):
+            graph.topological_order()
+
+    def test_critical_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            analysis = self.analyse(tmpdir)
+        self.assertEqual(analysis.wall_time, 15.0)
+        self.assertEqual(analysis.length, 15.0)
+        self.assertEqual(analysis.critical_path(),
+                         [('a.do_fetch', 0.0, 2.0, 0.0),
+                          ('a.do_compile', 2.0, 10.0, 0.0),
+                          ('c.do_install', 12.0, 3.0, 0.0)])
+
+        # b.do_compile can finish as late as c.do_install starts, the
+        # missing e.do_populate_lic takes no time and d.do_compile only
+        # needs to finish with the build
+        self.assertEqual(analysis.slack('b.do_compile'), 6.0)
+        self.assertEqual(analysis.slack('e.do_populate_lic'), 10.0)
+        self.assertEqual(analysis.slack('d.do_compile'), 10.0)
+        self.assertNotIn('e.do_populate_lic', analysis.durations)
+
+    def test_parallelism(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            analysis = self.analyse(tmpdir)
+        # d.do_compile could start at 0 and b.do_compile at 2, the rest
+        # started as soon as their dependencies completed
+        expected = [(0.0, 2.2, 2.6), (5.0, 1.6, 1.6), (10.0, 1.0, 1.0)]
+        for bucket, values in zip(analysis.parallelism(3), expected):
+            for value, expected_value in zip(bucket, values):
+                self.assertAlmostEqual(value, expected_value)
+
+    def test_speedup_candidates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            analysis = self.analyse(tmpdir)
+        # Without a, b.do_compile and c.do_install take 7s
+        self.assertEqual(analysis.speedup_candidates(), [('a', 12.0, 8.0), ('c', 3.0, 3.0)])
+        self.assertEqual(analysis.speedup_candidates(1), [('a', 12.0, 8.0)])
+
+    def test_large_graph(self):
+        # 3000 recipes of 10 chained tasks, the first task of each depending
+        # on the last task of up to 3 earlier recipes
+        rand = random.Random(0)
+        graph = BSTaskGraph()
+        buildstats = BuildStats()
+        for i in range(3000):
+            recipe = BSRecipe('recipe%d' % i, None, '1.0', 'r0')
+            for j in range(10):
+                node = 'recipe%d.do_task%d' % (i, j)
+                if j:
+                    graph.deps[node] = set(['recipe%d.do_task%d' % (i, j - 1)])
+                else:
+                    graph.deps[node] = set('recipe%d.do_task9' % rand.randrange(i) for k in range(min(i, 3)))
+                recipe.tasks['do_task%d' % j] = BSTask(start_time=float(rand.randrange(10000)),
+                                                       elapsed_time=rand.uniform(0.5, 5))
+            buildstats[recipe.name] = recipe
+
+        start = time.monotonic()
+        analysis = BSCriticalPath(buildstats, graph)
+        path = analysis.critical_path()
+        analysis.parallelism()
+        analysis.speedup_candidates()
+        elapsed = time.monotonic() - start
+
+        self.assertAlmostEqual(sum(task.duration for task in path), analysis.length)
+        for task in path:
+            self.assertAlmostEqual(task.slack, 0.0)
+        for previous, task in zip(path, path[1:]):
+            self.assertIn(previous.node, graph.deps[task.node])
+        self.assertLess(elapsed, 30, 'Analysing 30000 tasks took %.1fs' % elapsed)
+
+    def test_script(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, dot = self.write_build(tmpdir)
+            result = runCmd('%s/scripts/buildstats-critical-path %s %s' % (basepath, path, dot))
+        self.assertIn('CRITICAL PATH: 15.0s of 15.0s wall clock time, 3 tasks', result.output)
+        self.assertRegex(result.output, r'\n  b.do_compile +4.0 +6.0\n')
+        self.assertRegex(result.output, r'SPEEDUP CANDIDATES:\n.*\n  a +12.0 +8.0\n  c +3.0 +3.0')
@@ -0,0 +1,187 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+import importlib.util
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+import bb.data_smart
+import bb.utils
+import buildstats
+from oeqa.selftest.case import OESelftestTestCase
+
+# scripts/lib/buildstats.py, which would be shadowed by meta/lib/buildstats.py
+basepath = os.path.abspath(os.path.dirname(__file__) + '/../../../../../')
+spec = importlib.util.spec_from_file_location('scripts_buildstats', basepath + '/scripts/lib/buildstats.py')
+scripts_buildstats = sys.modules['scripts_buildstats'] = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(scripts_buildstats)
+BuildStats = scripts_buildstats.BuildStats
+BSResourceSamples = scripts_buildstats.BSResourceSamples
+
+class BuildstatsLoaderTests(OESelftestTestCase):
+    task_data = """%s: %s
+Elapsed time: 1.25 seconds
+utime: 10
+stime: 2
+cutime: 30
+cstime: 4
+IO rchar: 12345
+IO wchar: 678
+IO read_bytes: 4096
+IO write_bytes: 8192
+rusage ru_utime: 0.5
+rusage ru_stime: 0.25
+rusage ru_maxrss: 1024
+rusage ru_inblock: 8
+rusage ru_oublock: 16
+Child rusage ru_utime: 1.5
+Child rusage ru_stime: 0.75
+Child rusage ru_maxrss: 2048
+Child rusage ru_inblock: 32
+Child rusage ru_oublock: 64
+Status: PASSED 
+Ended: %0.2f 
+"""
+
+    def write_buildstats(self, path):
+        os.makedirs(path)
+        with open(os.path.join(path, 'build_stats'), 'w') as f:
+            f.write('Build Started: 1000.00\n')
+        for i, pf in enumerate(('foo-1.0-r0', 'bar-2_3.1-r5', 'baz-git-r0')):
+            os.makedirs(os.path.join(path, pf))
+            for j, task in enumerate(('do_fetch', 'do_compile', 'do_install')):
+                with open(os.path.join(path, pf, task), 'w') as f:
+                    f.write('Started: %0.2f\n' % (1000 + i + j))
+                    f.write(self.task_data % (pf, task, 1001.25 + i + j * 2))
+
+    def assertSameBuildstats(self, bs1, bs2):
+        self.assertEqual(sorted(bs1.keys()), sorted(bs2.keys()))
+        for name in bs1:
+            self.assertEqual(bs1[name].nevr, bs2[name].nevr)
+            self.assertEqual(bs1[name].tasks, bs2[name].tasks)
+
+    def test_from_dir_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, '20200101000000')
+            self.write_buildstats(path)
+            reference = BuildStats.from_dir(path)
+            self.assertEqual(reference.num_tasks, 9)
+            self.assertEqual(reference['bar'].evr, '2_3.1-r5')
+            self.assertEqual(reference['baz'].tasks['do_install']['elapsed_time'], 1007.25 - 1004)
+
+            for jobs in (1, 2):
+                self.assertSameBuildstats(reference, BuildStats.from_dir_parallel(path, jobs=jobs, use_cache=False))
+            self.assertFalse(os.path.exists(os.path.join(path, BuildStats.cache_file)))
+
+            # First load writes the cache, second one reads it
+            self.assertSameBuildstats(reference, BuildStats.from_dir_parallel(path, jobs=2))
+            self.assertTrue(os.path.exists(os.path.join(path, BuildStats.cache_file)))
+            self.assertSameBuildstats(reference, BuildStats.from_dir_parallel(path))
+
+            # The cache directory entry is not mistaken for a recipe
+            self.assertSameBuildstats(reference, BuildStats.from_dir(path))
+
+            # New tasks invalidate the cache
+            recipe_dir = os.path.join(path, 'foo-1.0-r0')
+            with open(os.path.join(recipe_dir, 'do_package'), 'w') as f:
+                f.write('Started: 1010.00\n')
+                f.write(self.task_data % ('foo-1.0-r0', 'do_package', 1012.00))
+            st = os.stat(recipe_dir)
+            os.utime(recipe_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            updated = BuildStats.from_dir_parallel(path)
+            self.assertIn('do_package', updated['foo'].tasks)
+            self.assertSameBuildstats(BuildStats.from_dir(path), updated)
+
+    def write_samples(self, path, truncate=False):
+        # Two system samples and the samples of one task, as written by
+        # the ResourceSampler of meta/lib/buildstats.py
+        name = 'foo-1.0-r0:do_compile'.encode('utf-8')
+        records = [scripts_buildstats.SAMPLES_MAGIC,
+                   scripts_buildstats.SAMPLES_SYSTEM.pack(b'S', 1000.0, 100, 0, 50, 850, 0, 0, 0, 8000000, 6000000, -1, -1, -1, -1, -1),
+                   scripts_buildstats.SAMPLES_NAME.pack(b'N', 0, len(name)) + name,
+                   scripts_buildstats.SAMPLES_TASK.pack(b'T', 1000.0, 0, 1.5, 2048, 4096, 0),
+                   scripts_buildstats.SAMPLES_SYSTEM.pack(b'S', 1001.0, 400, 0, 150, 1350, 100, 0, 0, 8000000, 5000000, -1, -1, -1, -1, -1),
+                   scripts_buildstats.SAMPLES_TASK.pack(b'T', 1001.0, 0, 2.5, 4096, 8192, 1024)]
+        data = b''.join(records)
+        if truncate:
+            data = data[:-10]
+        with open(os.path.join(path, 'resource_samples.bin'), 'wb') as f:
+            f.write(data)
+
+    def test_resource_samples(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.write_samples(tmpdir)
+            samples = BSResourceSamples.from_dir(tmpdir)
+            self.assertEqual(samples.system['time'], [1000.0, 1001.0])
+            self.assertEqual(samples.system['mem_available'], [6000000, 5000000])
+            self.assertEqual(list(samples.tasks), ['foo-1.0-r0:do_compile'])
+            task = samples.tasks['foo-1.0-r0:do_compile']
+            self.assertEqual(task['cputime'], [1.5, 2.5])
+            self.assertEqual(task['write_bytes'], [0, 1024])
+
+            # 300 user, 100 system, 500 idle and 100 iowait jiffies
+            self.assertEqual(samples.cpu_utilization(), [(1001.0, 0.3, 0.1, 0.1)])
+            self.assertEqual(samples.memory_used(), [(1000.0, 2000000), (1001.0, 3000000)])
+
+            # An interrupted build leaves a truncated record behind
+            self.write_samples(tmpdir, truncate=True)
+            samples = BSResourceSamples.from_dir(tmpdir)
+            self.assertEqual(samples.tasks['foo-1.0-r0:do_compile']['cputime'], [1.5])
+
+    def test_resource_samples_sampler(self):
+        # The records written by the sampler of buildstats.bbclass, with
+        # their own definition of the formats, are the ones read back
+        with tempfile.TemporaryDirectory() as tmpdir:
+            d = bb.data_smart.DataSmart()
+            d.setVar('BUILDSTATS_SAMPLE_INTERVAL', '1')
+            d.setVar('BUILDSTATS_SAMPLE_TASKS', os.path.join(tmpdir, 'tasks'))
+            d.setVar('BUILDSTATS_BASE', tmpdir)
+            d.setVar('BUILDNAME', '20200101000000')
+            os.makedirs(os.path.join(tmpdir, 'tasks'))
+            task = subprocess.Popen(['sleep', '60'])
+            self.addCleanup(task.wait)
+            self.addCleanup(task.kill)
+            with open(os.path.join(tmpdir, 'tasks', str(task.pid)), 'w') as f:
+                f.write('foo-1.0-r0:do_compile\n')
+
+            # os is one of the builtins of bitbake
+            with mock.patch.object(buildstats, 'os', os, create=True):
+                sampler = buildstats.ResourceSampler(d)
+                sampler.sample()
+                sampler.sample()
+                sampler.output.close()
+
+            samples = BSResourceSamples.from_dir(os.path.join(tmpdir, '20200101000000'))
+            self.assertEqual(len(samples.system['time']), 2)
+            self.assertLessEqual(samples.system['time'][0], samples.system['time'][1])
+            self.assertGreater(samples.system['mem_total'][0], 0)
+            self.assertEqual(list(samples.tasks), ['foo-1.0-r0:do_compile'])
+            columns = samples.tasks['foo-1.0-r0:do_compile']
+            self.assertEqual(columns['time'], samples.system['time'])
+            self.assertGreater(min(columns['rss']), 0)
+
+    def test_resource_samples_pybootchartgui(self):
+        sys.path.insert(0, basepath + '/scripts/pybootchartgui')
+        try:
+            import pybootchartgui.parsing
+        finally:
+            sys.path.remove(basepath + '/scripts/pybootchartgui')
+
+        class Writer(object):
+            def info(self, msg):
+                pass
+            warn = status = info
+
+        class Options(object):
+            full_time = False
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, '20200101000000')
+            self.write_buildstats(path)
+            self.write_samples(path)
+            trace = pybootchartgui.parsing.Trace(Writer(), [path], Options())
+            self.assertEqual(len(trace.processes), 9)
@@ -1308,6 +1308,9 @@ class DevtoolExtractTests(DevtoolBase):
             filelist1.sort(key=lambda item: item.split()[-1])
             filelist2.sort(key=lambda item: item.split()[-1])
             self.assertEqual(filelist1, filelist2)
+            # Deploying again only sends what changed, nothing here
+            result = runCmd('devtool deploy-target -c %s root@%s' % (testrecipe, qemu.ip))
+            self.assertIn('%s is already deployed' % testrecipe, result.output)
             # Test undeploy-target
             result = runCmd('devtool undeploy-target -c %s root@%s' % (testrecipe, qemu.ip))
             result = runCmd('ssh %s root@%s %s' % (sshargs, qemu.ip, testcommand), ignore_status=True)
@@ -0,0 +1,131 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+import importlib.machinery
+import importlib.util
+import os
+import tempfile
+from unittest import mock
+from oeqa.selftest.case import OESelftestTestCase
+from oeqa.utils.commands import runCmd
+
+# scripts/gen-lockedsig-cache has no .py suffix
+basepath = os.path.abspath(os.path.dirname(__file__) + '/../../../../../')
+loader = importlib.machinery.SourceFileLoader('gen_lockedsig_cache', basepath + '/scripts/gen-lockedsig-cache')
+spec = importlib.util.spec_from_loader('gen_lockedsig_cache', loader)
+gen_lockedsig_cache = importlib.util.module_from_spec(spec)
+loader.exec_module(gen_lockedsig_cache)
+
+class GenLockedSigCacheTests(OESelftestTestCase):
+    """Populating a sstate cache from locked signatures"""
+
+    nativelsbstring = 'universal'
+
+    def setUp(self):
+        super(GenLockedSigCacheTests, self).setUp()
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='gen-lockedsig-cache-')
+        self.addCleanup(self.tmpdir.cleanup)
+        self.input = os.path.join(self.tmpdir.name, 'sstate-cache')
+        self.output = os.path.join(self.tmpdir.name, 'locked-sstate-cache')
+        self.hashes = {}
+        self.lockedsigs = os.path.join(self.tmpdir.name, 'locked-sigs.inc')
+        with open(self.lockedsigs, 'w') as f:
+            f.write('SIGGEN_LOCKEDSIGS_t-core2-64 = "\\\n')
+            for pn, task in (('foo', 'do_populate_sysroot'), ('bar', 'do_package_write_rpm'), ('quilt-native', 'do_populate_sysroot')):
+                sig = self.hashes[pn] = ('%s%s' % (pn, task)).encode('utf-8').hex()[:64].ljust(64, '0')
+                f.write('    %s:%s:%s \\\n' % (pn, task, sig))
+            f.write('    "\n')
+
+        # Objects of foo, with the siginfo being a symlink to a file out of
+        # the cache and a temporary file left behind by a failed download
+        self.foo = self.write(self.object('foo', 'core2-64', 'populate_sysroot.tgz'), 'foo')
+        self.siginfo = self.write(os.path.join(self.tmpdir.name, 'foo.siginfo'), 'foo siginfo')
+        os.symlink(self.siginfo, self.object('foo', 'core2-64', 'populate_sysroot.tgz.siginfo'))
+        self.write(self.object('foo', 'core2-64', 'populate_sysroot.tgz.ZXc4kzVV'), 'partial')
+        self.write(self.object('bar', 'core2-64', 'package_write_rpm.tgz'), 'bar')
+        self.write(self.object('quilt-native', 'x86_64', 'populate_sysroot.tgz', self.nativelsbstring), 'quilt')
+        # Not locked
+        self.write(self.object('foo', 'core2-64', 'populate_lic.tgz').replace(self.hashes['foo'], 'f' * 64), 'lic')
+
+    def object(self, pn, arch, suffix, subdir=''):
+        sig = self.hashes[pn]
+        return os.path.join(self.input, subdir, sig[:2], sig[2:4],
+                            'sstate:%s:%s-poky-linux:1.0:r0:%s:10:%s_%s' % (pn, arch, arch, sig, suffix))
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def outputs(self):
+        files = []
+        for root, dirs, names in os.walk(self.output):
+            files.extend(os.path.relpath(os.path.join(root, name), self.output) for name in names)
+        return sorted(files)
+
+    def run_script(self, options=''):
+        return runCmd('gen-lockedsig-cache -v %s %s %s %s %s' % (options, self.lockedsigs, self.input,
+                                                               self.output, self.nativelsbstring))
+
+    def test_layout(self):
+        result = self.run_script()
+        self.assertEqual(self.outputs(), sorted(os.path.relpath(f, self.input) for f in (
+            self.foo, self.object('foo', 'core2-64', 'populate_sysroot.tgz.siginfo'),
+            self.object('bar', 'core2-64', 'package_write_rpm.tgz'),
+            self.object('quilt-native', 'x86_64', 'populate_sysroot.tgz', self.nativelsbstring))))
+        self.assertIn('Processed 5 files (4 linked, 1 skipped)', result.output)
+
+        # Hardlinked to the objects, the siginfo to the target of its symlink
+        dst = os.path.join(self.output, os.path.relpath(self.foo, self.input))
+        self.assertTrue(os.path.samefile(dst, self.foo))
+        siginfo = dst + '.siginfo'
+        self.assertFalse(os.path.islink(siginfo))
+        self.assertTrue(os.path.samefile(siginfo, self.siginfo))
+
+        # Running again replaces the objects
+        self.run_script()
+        self.assertTrue(os.path.samefile(dst, self.foo))
+
+    def test_filter(self):
+        filterfile = self.write(os.path.join(self.tmpdir.name, 'filter'), 'foo:do_populate_sysroot\n')
+        result = runCmd('gen-lockedsig-cache %s %s %s %s %s' % (self.lockedsigs, self.input, self.output,
+                                                               self.nativelsbstring, filterfile))
+        self.assertIn('Filtering out bar:do_package_write_rpm', result.output)
+        self.assertEqual([os.path.basename(f) for f in self.outputs()],
+                         [os.path.basename(self.foo), os.path.basename(self.foo) + '.siginfo'])
+
+    def test_fixed_lsbstring(self):
+        self.run_script('--fixed-lsbstring=ubuntu-22.04')
+        native = os.path.relpath(self.object('quilt-native', 'x86_64', 'populate_sysroot.tgz'), self.input)
+        self.assertIn(os.path.join('ubuntu-22.04', native), self.outputs())
+        self.assertFalse(os.path.exists(os.path.join(self.output, self.nativelsbstring)))
+        # The other objects are where they were
+        self.assertIn(os.path.relpath(self.foo, self.input), self.outputs())
+
+    def test_copy_fallback(self):
+        dst = os.path.join(self.tmpdir.name, 'copy.tgz')
+        with mock.patch.object(gen_lockedsig_cache.fcntl, 'ioctl', side_effect=OSError(95, 'Operation not supported')):
+            self.assertEqual(gen_lockedsig_cache.clone_or_copy(self.foo, dst), 'copied')
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'foo')
+        self.assertFalse(os.path.samefile(dst, self.foo))
+
+        with mock.patch.object(gen_lockedsig_cache.fcntl, 'ioctl'):
+            self.assertEqual(gen_lockedsig_cache.clone_or_copy(self.foo, dst), 'reflinked')
+
+    def test_link_fallback(self):
+        # Hardlinking fails, the objects are reflinked or copied
+        args = mock.Mock(input_cachedir=self.input, output_cachedir=self.output, fixed_lsbstring=None,
+                         nativelsbstring=self.nativelsbstring, verbose=False)
+        stats = gen_lockedsig_cache.Stats()
+        with mock.patch.object(gen_lockedsig_cache.os, 'link', side_effect=OSError(18, 'Invalid cross-device link')):
+            gen_lockedsig_cache.process_file(self.object('foo', 'core2-64', 'populate_sysroot.tgz.siginfo'), args, stats)
+        siginfo = os.path.join(self.output, os.path.relpath(self.foo, self.input)) + '.siginfo'
+        with open(siginfo) as f:
+            self.assertEqual(f.read(), 'foo siginfo')
+        self.assertFalse(os.path.samefile(siginfo, self.siginfo))
+        self.assertEqual(stats.size, len('foo siginfo'))
+        self.assertEqual(sum(stats.counts.values()), 1)
+        self.assertIn(list(stats.counts)[0], ('reflinked', 'copied'))
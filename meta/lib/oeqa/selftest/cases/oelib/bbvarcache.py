@@ -0,0 +1,102 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+from unittest import mock
+from oeqa.utils import commands
+import os
+import shutil
+import tempfile
+
+class TestBBVarCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-bbvarcache-")
+        builddir = os.path.join(self.tempdir, "build")
+        self.layer = os.path.join(self.tempdir, "meta-test")
+        self.localconf = self.write(os.path.join(builddir, "conf", "local.conf"), 'MACHINE = "qemux86-64"\n')
+        self.inc = self.write(os.path.join(self.layer, "conf", "distro", "test.inc"), 'DISTRO_FEATURES = ""\n')
+        self.recipe = self.write(os.path.join(self.layer, "recipes-test", "foo", "foo_1.0.bb"), 'LICENSE = "MIT"\n')
+        self.values = {
+            "BBINCLUDED": "%s %s" % (self.localconf, self.inc),
+            "FILE": self.recipe,
+            "BBFILES": "%s/recipes-*/*/*.bb %s/recipes-*/*/*.bbappend" % (self.layer, self.layer),
+            "PN": "foo",
+        }
+        self.environ = mock.patch.dict(os.environ, {"BUILDDIR": builddir})
+        self.environ.start()
+        self.cache = commands.BBVarCache()
+        self.cache.put("foo", None, self.values)
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.tempdir)
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(content)
+        return path
+
+    def touch(self, path):
+        # Make the change visible whatever the timestamp granularity
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+
+    def test_hit(self):
+        self.assertEqual(self.cache.get("foo", None), self.values)
+        self.assertIsNone(self.cache.get("bar", None))
+        self.assertIsNone(self.cache.get("foo", 'MACHINE = "qemuarm"'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_conf(self):
+        self.write(self.localconf, 'INHERIT += "rm_work"\n')
+        self.assertIsNone(self.cache.get("foo", None))
+
+        self.cache.put("foo", None, self.values)
+        self.write(os.path.join(os.path.dirname(self.localconf), "auto.conf"), 'DISTRO = "test"\n')
+        self.assertIsNone(self.cache.get("foo", None))
+
+    def test_included(self):
+        self.touch(self.inc)
+        self.assertIsNone(self.cache.get("foo", None))
+
+        self.cache.put("foo", None, self.values)
+        self.write(self.recipe, 'PR = "r1"\n')
+        self.assertIsNone(self.cache.get("foo", None))
+
+    def test_new_append(self):
+        # In the directory of an existing recipe
+        recipedir = os.path.dirname(self.recipe)
+        self.write(os.path.join(recipedir, "foo_%.bbappend"), 'PR = "r1"\n')
+        self.touch(recipedir)
+        self.assertIsNone(self.cache.get("foo", None))
+
+        # In a new directory
+        self.cache.put("foo", None, self.values)
+        self.write(os.path.join(self.layer, "recipes-test", "bar", "foo_1.0.bbappend"), 'PR = "r2"\n')
+        self.assertIsNone(self.cache.get("foo", None))
+
+    def test_new_recipe(self):
+        self.write(os.path.join(self.layer, "recipes-other", "bar", "bar_1.0.bb"), 'LICENSE = "MIT"\n')
+        self.assertIsNone(self.cache.get("foo", None))
+
+        # Files that aren't matched by BBFILES don't matter
+        self.cache.put("foo", None, self.values)
+        self.write(os.path.join(self.tempdir, "notes.txt"), "unrelated\n")
+        self.assertEqual(self.cache.get("foo", None), self.values)
+
+    def test_environment(self):
+        os.environ["MACHINE"] = "qemuarm"
+        self.assertIsNone(self.cache.get("foo", None))
+
+    def test_runcmd_invalidate(self):
+        with mock.patch.object(commands, "bb_var_cache", self.cache):
+            commands.runCmd("true")
+            self.assertEqual(self.cache.get("foo", None), self.values)
+            commands.runCmd("recipetool --help", ignore_status=True)
+            self.assertIsNone(self.cache.get("foo", None))
+
+            self.cache.put("foo", None, self.values)
+            commands.runCmd(["devtool", "--help"], ignore_status=True)
+            self.assertIsNone(self.cache.get("foo", None))
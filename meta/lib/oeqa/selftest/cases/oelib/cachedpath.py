@@ -0,0 +1,81 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import oe.cachedpath
+import os
+import shutil
+import tempfile
+
+class TestLRUCache(TestCase):
+    def test_eviction(self):
+        cache = oe.cachedpath.LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache.get("a"), 1)
+        cache["c"] = 3
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 1, "misses": 1, "evictions": 1})
+
+    def test_unbounded(self):
+        cache = oe.cachedpath.LRUCache(None)
+        for i in range(1000):
+            cache[i] = i
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.evictions, 0)
+
+class TestCachedPath(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-cachedpath-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_bounded(self):
+        cpath = oe.cachedpath.CachedPath(maxsize=4)
+        for i in range(10):
+            path = os.path.join(self.tempdir, str(i))
+            open(path, "w").close()
+            self.assertTrue(cpath.isfile(path))
+        for cache in (cpath.statcache, cpath.lstatcache, cpath.normpathcache):
+            self.assertEqual(len(cache), 4)
+        # Evicted stat results are read again
+        self.assertTrue(cpath.isfile(os.path.join(self.tempdir, "0")))
+        self.assertFalse(cpath.islink(os.path.join(self.tempdir, "0")))
+        self.assertGreater(cpath.stats()["stat"]["evictions"], 0)
+
+    def test_invalidate(self):
+        cpath = oe.cachedpath.CachedPath()
+        subdir = os.path.join(self.tempdir, "a/b")
+        self.assertFalse(cpath.exists(subdir))
+        self.assertFalse(cpath.exists(os.path.join(self.tempdir, "a")))
+        os.makedirs(subdir)
+        self.assertFalse(cpath.exists(subdir))
+        cpath.invalidate(subdir)
+        self.assertTrue(cpath.isdir(subdir))
+        self.assertFalse(cpath.exists(os.path.join(self.tempdir, "a")))
+
+        cpath.invalidate(self.tempdir, recursive=True)
+        self.assertTrue(cpath.isdir(os.path.join(self.tempdir, "a")))
+
+        link = os.path.join(self.tempdir, "a/c")
+        os.symlink("b", link)
+        cpath.invalidate(link)
+        self.assertEqual(cpath.realpath(link, self.tempdir), subdir)
+        self.assertEqual(cpath.stats()["realpath"]["size"], 1)
+        cpath.invalidate(link)
+        self.assertEqual(cpath.stats()["realpath"]["size"], 0)
+
+    def test_stats(self):
+        cpath = oe.cachedpath.CachedPath(name="test")
+        path = os.path.join(self.tempdir, "file")
+        open(path, "w").close()
+        for i in range(3):
+            cpath.exists(path)
+        stats = cpath.stats()
+        self.assertEqual(stats["stat"]["misses"], 1)
+        self.assertEqual(stats["stat"]["hits"], 2)
+        self.assertEqual(stats["lstat"]["misses"], 1)
+        self.assertIn(cpath, oe.cachedpath.instances())
@@ -0,0 +1,74 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import oe.compress
+import gzip
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+class TestParallelGzip(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-compress-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def roundtrip(self, data, writes=1, **kwargs):
+        path = os.path.join(self.tempdir, "out.gz")
+        with oe.compress.open_compressed(path, "gz", **kwargs) as f:
+            step = max(1, len(data) // writes)
+            for i in range(0, len(data), step):
+                f.write(data[i:i + step])
+        with gzip.open(path, "rb") as f:
+            self.assertEqual(f.read(), data)
+        return os.path.getsize(path)
+
+    def test_empty(self):
+        self.roundtrip(b"")
+
+    def test_blocks(self):
+        rand = random.Random(0)
+        words = [bytes(rand.choice(b"abcdefghij") for i in range(8)) for j in range(500)]
+        data = b" ".join(rand.choice(words) for i in range(200000))
+        # Not a multiple of the block size, written in uneven chunks
+        size = self.roundtrip(data, writes=7, threads=4)
+        # The dictionaries keep the ratio close to that of a single stream
+        self.assertLess(size, len(gzip.compress(data, 6)) * 1.05)
+
+    def test_single_thread(self):
+        self.roundtrip(os.urandom(300000), threads=1)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            oe.compress.open_compressed(os.path.join(self.tempdir, "out"), "lzma")
+
+    def test_tarball(self):
+        src = os.path.join(self.tempdir, "src")
+        os.makedirs(os.path.join(src, "sub"))
+        for name in ("a", "sub/b"):
+            with open(os.path.join(src, name), "w") as f:
+                f.write(name * 1000)
+        tarname = os.path.join(self.tempdir, "src.tar.gz")
+        oe.compress.create_tarball(tarname, src, threads=2)
+        with tarfile.open(tarname, "r:gz") as tar:
+            self.assertEqual(sorted(tar.getnames()), ["src", "src/a", "src/sub", "src/sub/b"])
+            self.assertEqual(tar.extractfile("src/sub/b").read(), b"sub/b" * 1000)
+
+    def test_xz_options(self):
+        src = os.path.join(self.tempdir, "src")
+        os.makedirs(src)
+        with open(os.path.join(src, "a"), "w") as f:
+            f.write("a" * 1000)
+        tarname = os.path.join(self.tempdir, "src.tar.xz")
+        oe.compress.create_tarball(tarname, src, compression="xz", threads=2, xz_options=["--memlimit=50%", "--threads=1"])
+        with tarfile.open(tarname, "r:xz") as tar:
+            self.assertEqual(tar.extractfile("src/a").read(), b"a" * 1000)
+        # The options are passed to xz, a memory limit too low makes it fail
+        with self.assertRaises(subprocess.CalledProcessError):
+            oe.compress.create_tarball(tarname, src, compression="xz", threads=2, xz_options=["--memlimit=1KiB"])
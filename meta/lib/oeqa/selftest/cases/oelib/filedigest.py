@@ -0,0 +1,105 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import bb.data_smart
+import oe.compress
+import oe.filedigest
+import hashlib
+import os
+import shutil
+import tempfile
+
+class TestFileDigestCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-filedigest-")
+        self.cachefile = os.path.join(self.tempdir, "file-digests.json")
+        self.src = os.path.join(self.tempdir, "src")
+        os.makedirs(self.src)
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.src, "file%d" % i)
+            with open(path, "w") as f:
+                f.write("content %d\n" % i * 1000)
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def sha1(self, path):
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def test_persisted(self):
+        cache = oe.filedigest.FileDigestCache(self.cachefile, jobs=4)
+        self.assertEqual(cache.digests(self.files, "sha1"), [self.sha1(p) for p in self.files])
+        self.assertEqual((cache.hits, cache.misses), (0, 10))
+        cache.save()
+
+        # Another task gets the md5 digests without reading the files again
+        cache = oe.filedigest.FileDigestCache(self.cachefile, jobs=4)
+        with open(self.files[0], "rb") as f:
+            md5 = hashlib.md5(f.read()).hexdigest()
+        self.assertEqual(cache.digest(self.files[0], "md5"), md5)
+        self.assertEqual(cache.digests(self.files, "sha1"), [self.sha1(p) for p in self.files])
+        self.assertEqual((cache.hits, cache.misses), (11, 0))
+
+    def test_modified(self):
+        cache = oe.filedigest.FileDigestCache(self.cachefile)
+        cache.digests(self.files)
+        cache.save()
+
+        # As patch does, replace a file with a new one
+        path = self.files[3]
+        with open(path + ".new", "w") as f:
+            f.write("patched\n")
+        os.rename(path + ".new", path)
+        os.unlink(self.files[4])
+
+        cache = oe.filedigest.FileDigestCache(self.cachefile)
+        self.assertEqual(cache.digest(path), self.sha1(path))
+        self.assertIsNone(cache.digest(self.files[4]))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        cache.save()
+        self.assertNotIn(self.files[4], cache.entries)
+        self.assertEqual(len(cache.entries), 9)
+
+    def test_tarball(self):
+        cache = oe.filedigest.FileDigestCache(self.cachefile)
+        oe.compress.create_tarball(os.path.join(self.tempdir, "src.tar.gz"), self.src, threads=2, digests=cache)
+        self.assertEqual(cache.recorded, 10)
+        self.assertEqual(cache.digests(self.files), [self.sha1(p) for p in self.files])
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+
+    def test_symlinked(self):
+        # The tarball of S made through a symlinked directory, the digests
+        # then asked with the real path and the other way round
+        link = os.path.join(self.tempdir, "work-shared")
+        os.symlink(self.tempdir, link)
+        cache = oe.filedigest.FileDigestCache(self.cachefile)
+        oe.compress.create_tarball(os.path.join(self.tempdir, "src.tar.gz"), os.path.join(link, "src"), threads=2, digests=cache)
+        self.assertEqual(cache.recorded, 10)
+        self.assertEqual(cache.digests(self.files), [self.sha1(p) for p in self.files])
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+
+        cache.save()
+        cache = oe.filedigest.FileDigestCache(self.cachefile)
+        self.assertEqual(cache.digest(os.path.join(link, "src", "file0")), self.sha1(self.files[0]))
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_cache_path(self):
+        tmpdir = os.path.join(os.path.realpath(self.tempdir), "tmp")
+        def recipe(pn, s):
+            d = bb.data_smart.DataSmart()
+            d.setVar("TMPDIR", tmpdir)
+            d.setVar("FILE_DIGEST_CACHE", os.path.join(tmpdir, "work", pn, "file-digests.json"))
+            d.setVar("S", s)
+            return d
+
+        self.assertEqual(oe.filedigest.cache_path(recipe("zlib", os.path.join(tmpdir, "work", "zlib", "zlib-1.2"))),
+                         os.path.join(tmpdir, "work", "zlib", "file-digests.json"))
+        # The recipes building the shared gcc sources share their digests
+        shared = os.path.join(tmpdir, "work-shared", "gcc-10.2.0-r0", "gcc-10.2.0")
+        self.assertEqual(oe.filedigest.cache_path(recipe("gcc-cross", shared)), shared + ".file-digests.json")
+        self.assertEqual(oe.filedigest.cache_path(recipe("libgcc", shared)), shared + ".file-digests.json")
@@ -0,0 +1,94 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import oe.package_manager
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+class TestInterceptScheduling(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-intercepts-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_script(self, name, lines=()):
+        with open(os.path.join(self.tempdir, name), "w") as f:
+            f.write("#!/bin/sh\n")
+            for line in lines:
+                f.write(line + "\n")
+
+    def test_dependencies(self):
+        self.write_script("update_font_cache")
+        self.write_script("update_font_cache-lib32")
+        self.write_script("update_pixbuf_cache")
+        self.write_script("update_pixbuf_cache-lib32")
+        self.write_script("update_gtk_icon_cache", ["##DEPENDS: update_pixbuf_cache"])
+        self.write_script("update_mime_database")
+        # Only the multilib variant is registered
+        self.write_script("update_gio_module_cache")
+        self.write_script("update_gio_module_cache-lib32")
+        self.write_script("update_gio_module_cache-lib64")
+
+        scripts = ["update_font_cache", "update_font_cache-lib32", "update_gio_module_cache-lib32",
+                   "update_gio_module_cache-lib64", "update_gtk_icon_cache", "update_mime_database",
+                   "update_pixbuf_cache", "update_pixbuf_cache-lib32"]
+        deps = oe.package_manager.intercept_dependencies(self.tempdir, scripts)
+        self.assertEqual(deps, {
+            "update_font_cache": set(),
+            "update_font_cache-lib32": {"update_font_cache"},
+            "update_gio_module_cache-lib32": set(),
+            "update_gio_module_cache-lib64": {"update_gio_module_cache-lib32"},
+            "update_gtk_icon_cache": {"update_pixbuf_cache", "update_pixbuf_cache-lib32"},
+            "update_mime_database": set(),
+            "update_pixbuf_cache": set(),
+            "update_pixbuf_cache-lib32": {"update_pixbuf_cache"},
+        })
+
+    def test_schedule(self):
+        deps = {"c": {"a", "b"}, "d": {"c"}, "e": set()}
+        lock = threading.Lock()
+        running = set()
+        started = []
+        concurrency = []
+
+        def run(script):
+            with lock:
+                self.assertFalse(deps.get(script, set()) & running)
+                running.add(script)
+                started.append(script)
+                concurrency.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.discard(script)
+            return script.upper()
+
+        results = list(oe.package_manager.run_intercept_scripts(["a", "b", "c", "d", "e"], deps, run, 4))
+        self.assertEqual(sorted(results), [(s, s.upper()) for s in "abcde"])
+        order = [s for s, _ in results]
+        self.assertLess(order.index("a"), order.index("c"))
+        self.assertLess(order.index("b"), order.index("c"))
+        self.assertLess(order.index("c"), order.index("d"))
+        self.assertEqual(max(concurrency), 3)
+
+    def test_circular(self):
+        deps = {"a": {"b"}, "b": {"a"}, "c": set()}
+        with self.assertRaises(ValueError):
+            list(oe.package_manager.run_intercept_scripts(["a", "b", "c"], deps, lambda s: None, 2))
+
+    def test_failure_stops_scheduling(self):
+        deps = {"b": {"a"}}
+        ran = []
+
+        def run(script):
+            ran.append(script)
+            return script
+
+        for script, result in oe.package_manager.run_intercept_scripts(["a", "b"], deps, run, 2):
+            break
+        self.assertEqual(ran, ["a"])
@@ -0,0 +1,107 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import bb.data_smart
+import oe.package_manager
+import os
+import shutil
+import tempfile
+
+# Stands for cross-localedef: appends the names of the locales to the
+# archive and logs each invocation
+FAKE_LOCALEDEF = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "localedef (fake) 1.0"
+    exit 0
+fi
+echo "$@" >> %s
+for arg in "$@"; do
+    case $arg in
+        -*) ;;
+        *) echo "$(basename $arg)" >> "$LOCALEARCHIVE" ;;
+    esac
+done
+"""
+
+class TestLocaleArchive(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-localearchive-")
+        bindir = os.path.join(self.tempdir, "bin")
+        os.makedirs(bindir)
+        self.calls = os.path.join(self.tempdir, "calls")
+        localedef = os.path.join(bindir, "cross-localedef")
+        with open(localedef, "w") as f:
+            f.write(FAKE_LOCALEDEF % self.calls)
+        os.chmod(localedef, 0o755)
+        self.origpath = os.environ["PATH"]
+        os.environ["PATH"] = bindir + ":" + self.origpath
+
+        self.d = bb.data_smart.DataSmart()
+        self.d.setVar("LOCALE_ARCHIVE_CACHE", os.path.join(self.tempdir, "cache"))
+
+    def tearDown(self):
+        os.environ["PATH"] = self.origpath
+        shutil.rmtree(self.tempdir)
+
+    def make_localedir(self, name, locales):
+        localedir = os.path.join(self.tempdir, name, "usr/lib/locale")
+        for locale in locales:
+            os.makedirs(os.path.join(localedir, locale, "LC_MESSAGES"))
+            with open(os.path.join(localedir, locale, "LC_CTYPE"), "w") as f:
+                f.write("ctype of %s\n" % locale)
+        return localedir
+
+    def generate(self, localedir):
+        oe.package_manager.generate_locale_archive(self.d, os.path.dirname(localedir), "x86_64", localedir)
+        with open(os.path.join(localedir, "locale-archive")) as f:
+            return f.read().split()
+
+    def ncalls(self):
+        if not os.path.exists(self.calls):
+            return 0
+        with open(self.calls) as f:
+            return len(f.readlines())
+
+    def test_single_sorted_invocation(self):
+        localedir = self.make_localedir("rootfs", ["fr_FR.utf8", "de_DE.utf8", "en_US.utf8"])
+        self.assertEqual(self.generate(localedir), ["de_DE.utf8", "en_US.utf8", "fr_FR.utf8"])
+        self.assertEqual(self.ncalls(), 1)
+
+    def test_cache(self):
+        locales = ["en_US.utf8", "fr_FR.utf8"]
+        archive = self.generate(self.make_localedir("image1", locales))
+        self.assertEqual(self.ncalls(), 1)
+
+        # A sibling image with the same locales reuses the archive
+        self.assertEqual(self.generate(self.make_localedir("image2", locales)), archive)
+        self.assertEqual(self.ncalls(), 1)
+
+        # Different locale data
+        localedir = self.make_localedir("image3", locales)
+        with open(os.path.join(localedir, "fr_FR.utf8", "LC_CTYPE"), "a") as f:
+            f.write("changed\n")
+        self.generate(localedir)
+        self.assertEqual(self.ncalls(), 2)
+
+        # Another endianness
+        localedir = self.make_localedir("image4", locales)
+        oe.package_manager.generate_locale_archive(self.d, os.path.dirname(localedir), "powerpc", localedir)
+        self.assertEqual(self.ncalls(), 3)
+
+    def test_existing_archive(self):
+        locales = ["en_US.utf8"]
+        for name, existing in (("image1", "de_DE.utf8"), ("image2", "fr_FR.utf8")):
+            localedir = self.make_localedir(name, locales)
+            with open(os.path.join(localedir, "locale-archive"), "w") as f:
+                f.write(existing + "\n")
+            self.assertEqual(self.generate(localedir), [existing, "en_US.utf8"])
+        # The different existing archives don't share a cached archive
+        self.assertEqual(self.ncalls(), 2)
+
+    def test_no_cache(self):
+        self.d.setVar("LOCALE_ARCHIVE_CACHE", "")
+        self.generate(self.make_localedir("image1", ["en_US.utf8"]))
+        self.generate(self.make_localedir("image2", ["en_US.utf8"]))
+        self.assertEqual(self.ncalls(), 2)
@@ -0,0 +1,81 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+from oeqa.runtime.cases import parselogs
+import os
+import subprocess
+import tempfile
+
+class TestParseLogs(TestCase):
+    log = ["[    0.000000] Linux version 5.15.0 (oe-user@oe-host)",
+           "[    0.100000] ACPI: _OSC failed (AE_SUPPORT); disabling ASPM",
+           "[    0.200000] usb 1-1: device descriptor read/64, error -71",
+           "[    0.300000] Failed to load module \"vesa\"",
+           "[    0.400000] GPT: 3 errors corrected",
+           "systemd[1]: Failed to start foo.service.",
+           "[    1.100000] systemd[1]: Starting bar.service...",
+           "systemd[1]: Failed to start foo.service.",
+           "[    2.000000] EXT4-fs (vda): mounted filesystem",
+           "[    2.500000] can't open /dev/fb0",
+           "ERROR: cannot resolve host",
+           "retrying, last ERROR: cannot resolve host",
+           ] + ["[    3.%06d] random: crng init" % i for i in range(30)] + [
+           "systemd[1]: Failed to start foo.service.",
+           "[    5.000000] Reached target Multi-User System.",
+           ]
+
+    def setUp(self):
+        self.test = parselogs.ParseLogsTest('test_parselogs')
+        self.test.td = {'MACHINE': 'qemux86-64'}
+        self.test.msg = ''
+        self.tempdir = tempfile.TemporaryDirectory(prefix='oelib-parselogs-')
+        self.addCleanup(self.tempdir.cleanup)
+        self.logfile = os.path.join(self.tempdir.name, 'dmesg_output.log')
+        with open(self.logfile, 'w') as f:
+            f.write('\n'.join(self.log) + '\n')
+
+    def grep(self, *args, input=None):
+        result = subprocess.run(('grep',) + args, input=input, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        # No line selected
+        self.assertIn(result.returncode, (0, 1))
+        return result.stdout
+
+    def test_build_matchers(self):
+        error_re, ignore_re = self.test.build_matchers(parselogs.errors, parselogs.ignore_errors)
+        self.assertEqual(self.test.msg, '')
+        self.assertTrue(error_re.search("usb 1-1: device descriptor read/64, ERROR -71"))
+        self.assertFalse(error_re.search("GPT: 3 errors corrected"))
+        self.assertTrue(ignore_re.search("ACPI: _OSC failed (AE_SUPPORT); disabling ASPM"))
+        self.assertFalse(ignore_re.search("systemd[1]: Failed to start foo.service."))
+
+        self.test.td = {'MACHINE': 'unknown'}
+        error_re, ignore_re = self.test.build_matchers(parselogs.errors, parselogs.ignore_errors)
+        self.assertIn('No ignore list found for this machine, using default', self.test.msg)
+
+        self.assertIsNone(self.test.build_matchers(parselogs.errors, {'default': []})[1])
+
+    def test_parse_logs(self):
+        results = self.test.parse_logs(parselogs.errors, parselogs.ignore_errors, [self.logfile])
+        self.assertEqual(list(results[self.logfile]),
+                         [self.log[2], self.log[5], self.log[9], self.log[10], self.log[11]])
+
+    def test_grep(self):
+        # What the test found running grep on the logs
+        error_re, ignore_re = self.test.build_matchers(parselogs.errors, parselogs.ignore_errors)
+        found = self.grep('-Ei', '|'.join(r'\<%s\>' % error for error in parselogs.errors), self.logfile)
+        found = self.grep('-Eiv', ignore_re.pattern, input=found).splitlines()
+
+        for before, after in ((10, 10), (2, 1), (0, 0)):
+            results = self.test.parse_logs(parselogs.errors, parselogs.ignore_errors, [self.logfile], before, after)
+            self.assertEqual(list(results[self.logfile]), list(dict.fromkeys(found)))
+            for line, context in results[self.logfile].items():
+                self.assertEqual(context, self.grep('-F', '-B', str(before), '-A', str(after),
+                                                    '-e', line, self.logfile))
+
+    def test_no_errors(self):
+        with open(self.logfile, 'w') as f:
+            f.write('\n'.join(self.log[:2] + self.log[3:5]) + '\n')
+        self.assertEqual(self.test.parse_logs(parselogs.errors, parselogs.ignore_errors, [self.logfile]), {})
@@ -87,3 +87,118 @@ class TestRealPath(TestCase):
         for e in self.EXCEPTIONS:
             self.assertRaisesRegex(OSError, r'\[Errno %u\]' % e[1],
                                     self.__realpath, e[0], False, False)
+
+class TestNativeCopyTree(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "oe-test_copytree")
+        self.src = os.path.join(self.tmpdir, "src")
+
+        os.makedirs(os.path.join(self.src, "a", "b"))
+        os.makedirs(os.path.join(self.src, "empty"))
+        with open(os.path.join(self.src, "a", "file"), "w") as f:
+            f.write("contents")
+        os.chmod(os.path.join(self.src, "a", "file"), 0o640)
+        os.link(os.path.join(self.src, "a", "file"), os.path.join(self.src, "a", "b", "hardlink"))
+        os.symlink("../file", os.path.join(self.src, "a", "b", "symlink"))
+        os.symlink("dangling", os.path.join(self.src, "broken"))
+
+        # 4MB sparse file with a little data in the middle
+        with open(os.path.join(self.src, "sparse"), "wb") as f:
+            f.truncate(4 * 1024 * 1024)
+            f.seek(2 * 1024 * 1024)
+            f.write(b"data")
+
+        self.xattrs = True
+        try:
+            os.setxattr(os.path.join(self.src, "a", "file"), "user.oetest", b"testing liboe")
+            os.setxattr(os.path.join(self.src, "a", "b"), "user.oetest", b"dir")
+        except OSError:
+            self.xattrs = False
+
+        os.utime(os.path.join(self.src, "a"), (1000000000, 1000000000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def manifest(self, top):
+        inodes = {}
+        result = {}
+        for root, dirs, files in os.walk(top):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, top)
+                st = os.lstat(path)
+                entry = [st.st_mode, st.st_size, st.st_mtime_ns]
+                if os.path.islink(path):
+                    entry.append(os.readlink(path))
+                else:
+                    entry.append(sorted((x, os.getxattr(path, x)) for x in os.listxattr(path)))
+                    if not os.path.isdir(path):
+                        entry.append(inodes.setdefault(st.st_ino, rel))
+                        with open(path, "rb") as f:
+                            entry.append(f.read())
+                result[rel] = entry
+        return result
+
+    def copy(self, func, name, **kwargs):
+        dst = os.path.join(self.tmpdir, name)
+        os.mkdir(dst)
+        func(self.src, dst, **kwargs)
+        return dst
+
+    def test_parity(self):
+        tar = self.copy(oe.path._tar_copytree, "tar")
+        native = self.copy(oe.path.native_copytree, "native")
+
+        self.assertEqual(self.manifest(tar), self.manifest(native))
+        self.assertEqual(self.manifest(self.src), self.manifest(native))
+
+        # Hardlinks between files of the source tree are kept, but not to the source
+        ist = os.stat(os.path.join(native, "a", "file"))
+        self.assertEqual(ist.st_ino, os.stat(os.path.join(native, "a", "b", "hardlink")).st_ino)
+        self.assertNotEqual(ist.st_ino, os.stat(os.path.join(self.src, "a", "file")).st_ino)
+
+        if self.xattrs:
+            self.assertEqual(os.getxattr(os.path.join(native, "a", "file"), "user.oetest"), b"testing liboe")
+            self.assertEqual(os.getxattr(os.path.join(native, "a", "b"), "user.oetest"), b"dir")
+
+        # Holes are preserved
+        sst = os.stat(os.path.join(self.src, "sparse"))
+        nst = os.stat(os.path.join(native, "sparse"))
+        self.assertEqual(sst.st_size, nst.st_size)
+        self.assertLessEqual(nst.st_blocks, sst.st_blocks)
+
+    def test_overwrite(self):
+        dst = self.copy(oe.path.native_copytree, "native")
+        os.chmod(os.path.join(dst, "a", "file"), 0o444)
+        oe.path.native_copytree(self.src, dst)
+        self.assertEqual(self.manifest(self.src), self.manifest(dst))
+
+    def test_hardlink(self):
+        dst = self.copy(oe.path.native_copytree, "hardlink", hardlink=True)
+        self.assertEqual(os.stat(os.path.join(self.src, "a", "file")).st_ino,
+                         os.stat(os.path.join(dst, "a", "file")).st_ino)
+        self.assertEqual(os.readlink(os.path.join(dst, "a", "b", "symlink")), "../file")
+        self.assertTrue(os.path.isdir(os.path.join(dst, "empty")))
+
+    def test_hardlink_symlinked_dir(self):
+        # usrmerge: the destination already has lib -> usr/lib
+        dst = os.path.join(self.tmpdir, "usrmerge")
+        os.makedirs(os.path.join(dst, "usr", "lib"))
+        os.symlink("usr/lib", os.path.join(dst, "lib"))
+        os.makedirs(os.path.join(self.src, "lib"))
+        with open(os.path.join(self.src, "lib", "libfoo.so"), "w") as f:
+            f.write("foo")
+
+        oe.path.native_copytree(self.src, dst, hardlink=True)
+        self.assertEqual(os.readlink(os.path.join(dst, "lib")), "usr/lib")
+        self.assertEqual(os.stat(os.path.join(self.src, "lib", "libfoo.so")).st_ino,
+                         os.stat(os.path.join(dst, "usr", "lib", "libfoo.so")).st_ino)
+
+        # The symlink may point to a directory copied later on
+        dst = os.path.join(self.tmpdir, "usrmerge-empty")
+        os.makedirs(dst)
+        os.symlink("usr/lib", os.path.join(dst, "lib"))
+        oe.path.native_copytree(self.src, dst, hardlink=True)
+        self.assertTrue(os.path.islink(os.path.join(dst, "lib")))
+        self.assertTrue(os.path.isfile(os.path.join(dst, "usr", "lib", "libfoo.so")))
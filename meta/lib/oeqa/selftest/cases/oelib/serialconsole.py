@@ -0,0 +1,134 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+from oeqa.utils.qemurunner import SerialConsole
+import re
+import socket
+import threading
+import time
+
+class FakeTarget(threading.Thread):
+    """
+    Shell on the other end of a socket pair: it echoes the command lines it
+    receives and answers the framed commands with the output and exit status
+    set in 'commands', sending its replies in chunks of 'chunk' bytes
+    """
+    prompt = "root@qemux86-64:~# "
+    framed_re = re.compile(r'echo "(\w+)""B"; (.*); echo "\1""E\$\?"$')
+
+    def __init__(self, sock, commands, chunk=None):
+        super(FakeTarget, self).__init__(daemon=True)
+        self.sock = sock
+        self.commands = commands
+        self.chunk = chunk
+
+    def send(self, data):
+        data = data.encode("utf-8")
+        step = self.chunk or len(data) or 1
+        for i in range(0, len(data), step):
+            self.sock.sendall(data[i:i + step])
+            if self.chunk:
+                # Let the reader get each chunk on its own
+                time.sleep(0.001)
+
+    def reply(self, line):
+        m = self.framed_re.match(line)
+        if not m:
+            output, status = self.commands.get(line, ("", 0))
+            self.send(line + "\r\n" + output + self.prompt)
+            return
+        marker, command = m.groups()
+        if command not in self.commands:
+            # Hangs, as a command waiting forever would
+            self.send(line + "\r\n" + marker + "B\r\n")
+            return
+        output, status = self.commands[command]
+        self.send(line + "\r\n" + marker + "B\r\n" + output + marker + "E%d\r\n" % status + self.prompt)
+
+    def run(self):
+        data = b""
+        try:
+            while True:
+                received = self.sock.recv(4096)
+                if not received:
+                    break
+                data += received
+                while b"\n" in data:
+                    line, data = data.split(b"\n", 1)
+                    self.reply(line.decode("utf-8"))
+        except BrokenPipeError:
+            # The test is over
+            pass
+
+class TestSerialConsole(TestCase):
+    commands = {
+        "uname -n": ("qemux86-64\r\n", 0),
+        "false": ("", 1),
+        "exit 12": ("", 12),
+        # Output looking like a sentinel and a prompt
+        "cat fake": ("OEQAE0\r\nroot@qemux86-64:~# not a prompt\r\n", 0),
+        "cat big": ("".join("line %d\r\n" % i for i in range(20000)), 0),
+    }
+
+    def console(self, chunk=None):
+        ours, theirs = socket.socketpair()
+        target = FakeTarget(theirs, self.commands, chunk)
+        target.start()
+        # Closing our end stops the target
+        self.addCleanup(theirs.close)
+        self.addCleanup(target.join)
+        self.addCleanup(ours.close)
+        return SerialConsole(ours, tailsize=64, bufsize=128)
+
+    def test_run(self):
+        console = self.console()
+        self.assertEqual(console.run("uname -n"), (1, "qemux86-64"))
+        self.assertEqual(console.run("cat fake"), (1, "OEQAE0\r\nroot@qemux86-64:~# not a prompt"))
+
+    def test_status(self):
+        console = self.console()
+        self.assertEqual(console.run("false"), (0, ""))
+        self.assertEqual(console.run("exit 12"), (0, ""))
+        self.assertEqual(console.run("uname -n"), (1, "qemux86-64"))
+
+    def test_split_reads(self):
+        # Sentinels and prompts straddle the chunks
+        console = self.console(chunk=3)
+        self.assertEqual(console.run("uname -n"), (1, "qemux86-64"))
+        self.assertEqual(console.run("cat fake"), (1, "OEQAE0\r\nroot@qemux86-64:~# not a prompt"))
+        self.assertEqual(console.run("false"), (0, ""))
+
+    def test_large_output(self):
+        console = self.console(chunk=4093)
+        status, output = console.run("cat big")
+        self.assertEqual(status, 1)
+        self.assertEqual(output, self.commands["cat big"][0][:-2])
+
+    def test_multiple(self):
+        console = self.console(chunk=5)
+        self.assertEqual(console.run_multiple(["uname -n", "false", "cat fake", "exit 12"]),
+                         [(1, "qemux86-64"), (0, ""), (1, "OEQAE0\r\nroot@qemux86-64:~# not a prompt"), (0, "")])
+        # The prompt following the last command was consumed, a raw
+        # command gets its own output
+        status, output = console.run_raw("uname -n\n", timeout=5)
+        self.assertEqual(output, "uname -n\r\nqemux86-64\r\n" + FakeTarget.prompt.rstrip())
+
+    def test_raw(self):
+        console = self.console(chunk=2)
+        status, output = console.run_raw("uname -n\n", timeout=5)
+        self.assertEqual(status, 1)
+        self.assertEqual(output, "uname -n\r\nqemux86-64\r\n" + FakeTarget.prompt.rstrip())
+
+    def test_timeout(self):
+        console = self.console()
+        start = time.time()
+        status, output = console.run("sleep 3600", timeout=1)
+        self.assertGreaterEqual(time.time() - start, 1)
+        self.assertEqual(status, 0)
+        self.assertIn("command timed out after 1 seconds", output)
+        self.assertFalse(output.startswith('echo "'))
+
+        # Nothing is left over from the command that timed out
+        self.assertEqual(console.run("uname -n"), (1, "qemux86-64"))
@@ -0,0 +1,90 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import bb.data_smart
+import oe.recipeutils
+import os
+import shutil
+import tempfile
+import time
+
+class TestUpstreamProbes(TestCase):
+    def recipe(self, **values):
+        d = bb.data_smart.DataSmart()
+        d.setVar("PV", "1.0")
+        for var, value in values.items():
+            d.setVar(var, value)
+        return d
+
+    def test_key(self):
+        tarball = self.recipe(SRC_URI="https://example.com/releases/foo-1.0.tar.gz file://fix.patch")
+        key = oe.recipeutils._upstream_probe_key(tarball)
+        self.assertIsNotNone(key)
+        self.assertEqual(oe.recipeutils._upstream_probe_key(self.recipe(SRC_URI="https://example.com/releases/foo-1.0.tar.gz")), key)
+        self.assertNotEqual(oe.recipeutils._upstream_probe_key(self.recipe(SRC_URI="https://example.com/releases/foo-1.0.tar.gz",
+                                                                           UPSTREAM_CHECK_REGEX="foo-(?P<pver>\\d+)")), key)
+        self.assertNotEqual(oe.recipeutils._upstream_probe_key(self.recipe(SRC_URI="https://example.com/releases/foo-1.0.tar.gz",
+                                                                           PV="1.1")), key)
+
+        # Nothing to probe
+        self.assertIsNone(oe.recipeutils._upstream_probe_key(self.recipe()))
+        self.assertIsNone(oe.recipeutils._upstream_probe_key(self.recipe(SRC_URI="file://foo.c")))
+        self.assertIsNone(oe.recipeutils._upstream_probe_key(self.recipe(SRC_URI="https://example.com/foo-1.0.tar.gz",
+                                                                          RECIPE_UPSTREAM_VERSION="1.2")))
+
+    def test_group(self):
+        group = oe.recipeutils._upstream_probe_group
+        self.assertEqual(group(self.recipe(SRC_URI="git://git.example.com/foo.git;branch=main")),
+                         group(self.recipe(SRC_URI="git://git.example.com/foo.git;branch=next;name=foo")))
+        self.assertNotEqual(group(self.recipe(SRC_URI="git://git.example.com/foo.git")),
+                            group(self.recipe(SRC_URI="git://git.example.com/bar.git")))
+        self.assertEqual(group(self.recipe(SRC_URI="https://example.com/foo/foo-1.0.tar.gz")),
+                         group(self.recipe(SRC_URI="https://example.com/bar/bar-2.0.tar.xz")))
+        self.assertEqual(group(self.recipe(SRC_URI="https://mirror.example.org/foo-1.0.tar.gz",
+                                           UPSTREAM_CHECK_URI="https://example.com/foo/")),
+                         group(self.recipe(SRC_URI="https://example.com/bar/bar-2.0.tar.xz")))
+
+    def test_found(self):
+        found = oe.recipeutils._upstream_probe_found
+        tarball = self.recipe(SRC_URI="https://example.com/releases/foo-1.0.tar.gz")
+        self.assertTrue(found(tarball, ("1.2", "")))
+        # What the fetchers return when upstream can't be reached
+        self.assertFalse(found(tarball, ("", "")))
+        commits = self.recipe(SRC_URI="git://git.example.com/foo.git", UPSTREAM_CHECK_COMMITS="1")
+        self.assertTrue(found(commits, ("", "abcdef")))
+        self.assertFalse(found(commits, ("", "")))
+
+    def test_chunks(self):
+        mirror = [("gnu%d" % i, None) for i in range(10)]
+        repo = [("git%d" % i, None) for i in range(2)]
+        chunks = oe.recipeutils._upstream_probe_chunks([repo, mirror], 4)
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 3, 2, 1])
+        self.assertIn(repo, chunks)
+        self.assertEqual(sorted(sum(chunks, [])), sorted(mirror + repo))
+        self.assertEqual(len(oe.recipeutils._upstream_probe_chunks([mirror], 1)), 1)
+
+class TestUpstreamCheckCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="oelib-upstreamcheck-")
+        self.path = os.path.join(self.tempdir, "cache", "upstream-check.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_expiry(self):
+        now = time.time()
+        oe.recipeutils._save_upstream_check_cache(self.path, {
+            "old": {"time": now - 7200, "version": "1.0", "revision": ""},
+            "new": {"time": now, "version": "2.0", "revision": "abc"},
+        })
+        self.assertEqual(list(oe.recipeutils._load_upstream_check_cache(self.path, 3600)), ["new"])
+        self.assertEqual(len(oe.recipeutils._load_upstream_check_cache(self.path, 86400)), 2)
+
+    def test_missing_or_broken(self):
+        self.assertEqual(oe.recipeutils._load_upstream_check_cache(self.path, 3600), {})
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{")
+        self.assertEqual(oe.recipeutils._load_upstream_check_cache(self.path, 3600), {})
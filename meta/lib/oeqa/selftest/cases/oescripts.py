@@ -65,6 +65,11 @@ class OEPybootchartguyTests(OEScriptTests):
         runCmd('%s/pybootchartgui/pybootchartgui.py  %s -o %s/charts -f pdf' % (self.scripts_dir, self.buildstats, self.tmpdir))
         self.assertTrue(os.path.exists(self.tmpdir + "/charts.pdf"))
 
+    def test_pybootchartguy_to_generate_compact_tiled_png_output(self):
+        runCmd('%s/pybootchartgui/pybootchartgui.py  %s -o %s/charts-compact -f png --show-all --compact --tile-height 200' % (self.scripts_dir, self.buildstats, self.tmpdir))
+        self.assertTrue(os.path.exists(self.tmpdir + "/charts-compact-1.png"))
+        self.assertFalse(os.path.exists(self.tmpdir + "/charts-compact.png"))
+
 
 class OEGitproxyTests(OESelftestTestCase):
 
@@ -2,15 +2,22 @@
 # SPDX-License-Identifier: MIT
 #
 
+import io
+import json
 import os
 import sys
+import tempfile
+import threading
 basepath = os.path.abspath(os.path.dirname(__file__) + '/../../../../../')
 lib_path = basepath + '/scripts/lib'
 sys.path = sys.path + [lib_path]
 from resulttool.report import ResultsTextReport
 from resulttool import regression as regression
 from resulttool import resultutils as resultutils
+from resulttool import resultsdb as resultsdb
+from resulttool import gitresults as gitresults
 from oeqa.selftest.case import OESelftestTestCase
+from oeqa.utils.git import GitRepo
 
 class ResultToolTests(OESelftestTestCase):
     base_results_data = {'base_result1': {'configuration': {"TEST_TYPE": "runtime",
@@ -96,3 +103,56 @@ class ResultToolTests(OESelftestTestCase):
         resultutils.append_resultsdata(results, ResultToolTests.target_results_data, configmap=resultutils.flatten_map)
         self.assertEqual(len(results[''].keys()), 5, msg="Flattened results not correct %s" % str(results))
 
+    def test_resultsdb_regression_and_logs(self):
+        base_data = {'base': {'configuration': ResultToolTests.base_results_data['base_result1']['configuration'],
+                              'result': {'test1': {'status': 'PASSED'},
+                                         'test2': {'status': 'PASSED'},
+                                         'ptestresult.rawlogs': {'log': 'raw log'},
+                                         'ptestresult.sections': {'zlib': {'duration': '1', 'log': 'zlib log'}}}}}
+        target_data = {'target': {'configuration': ResultToolTests.target_results_data['target_result1']['configuration'],
+                                  'result': {'test1': {'status': 'PASSED'},
+                                             'test2': {'status': 'FAILED'}}}}
+        db = resultsdb.ResultsDB()
+        db.import_data(base_data, 'base/testresults.json')
+        db.import_data(target_data, 'target/testresults.json')
+        runs = db.testruns(resultutils.regression_map)['series1/runtime/image/qemux86/ipk/mydistro']
+        result, text = regression.compare_result(self.logger, 'base', 'target', runs['base'], runs['target'])
+        self.assertEqual(result, {'test2': {'base': 'PASSED', 'target': 'FAILED'}})
+        # The logs are not part of the results, they are loaded on demand
+        self.assertEqual(runs['base'].result()['ptestresult.sections'], {'zlib': {'duration': '1'}})
+        self.assertEqual(runs['base'].log('ptestresult.rawlogs'), 'raw log')
+        self.assertEqual(runs['base'].log('ptestresult.sections', 'zlib'), 'zlib log')
+
+    def test_gitresults_summary_parser_skips_logs(self):
+        data = {'run1': {'configuration': ResultToolTests.base_results_data['base_result1']['configuration'],
+                         'result': {'ptestresult.zlib.test1': {'status': 'PASSED', 'duration': 1.5},
+                                    'oetest.test': {'status': 'FAILED', 'log': 'kept'},
+                                    'ptestresult.rawlogs': {'log': 'raw \\ "log" \u00e9' * 100},
+                                    'ptestresult.sections': {'zlib': {'duration': '1', 'log': '\\"' * 100},
+                                                             'empty': {}}}}}
+        expected = resultutils.strip_ptestresults(data)
+        for indent in (None, 4):
+            document = json.dumps(data, indent=indent).encode('utf-8')
+            parser = gitresults.SummaryParser(io.BytesIO(document + b'trailing'), len(document))
+            # Small chunks to split strings, escapes and numbers
+            parser.chunksize = 3
+            self.assertEqual(parser.parse(), expected)
+
+    def test_gitresults_read_blobs_stopped(self):
+        data = {'run1': {'result': dict(('test%d' % i, {'status': 'PASSED'}) for i in range(1000))}}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            repo = GitRepo.init(tmpdir)
+            with open(os.path.join(tmpdir, 'testresults.json'), 'w') as f:
+                json.dump(data, f)
+            sha = repo.run_cmd(['hash-object', '-w', 'testresults.json'])
+            # More requests and blobs than the pipes to and from git hold
+            blobs = gitresults.GitResultsLoader(repo, cache=False).read_blobs([sha] * 5000, logs=True)
+            self.assertEqual(next(blobs), (sha, data))
+            # Stopping after the first blob doesn't wait for git to be done
+            closer = threading.Thread(target=blobs.close, daemon=True)
+            closer.start()
+            closer.join(60)
+            self.assertFalse(closer.is_alive(), msg='Stopping the read of the blobs is blocked')
+
+            self.assertEqual([blob for sha, blob in gitresults.GitResultsLoader(repo, cache=False).read_blobs([sha] * 3)],
+                             [data] * 3)
@@ -0,0 +1,101 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import tempfile
+from oeqa.selftest.case import OESelftestTestCase
+
+# scripts/runqemu has no .py suffix
+basepath = os.path.abspath(os.path.dirname(__file__) + '/../../../../../')
+loader = importlib.machinery.SourceFileLoader('runqemu', basepath + '/scripts/runqemu')
+spec = importlib.util.spec_from_loader('runqemu', loader)
+runqemu = importlib.util.module_from_spec(spec)
+loader.exec_module(runqemu)
+FastBoot = runqemu.FastBoot
+
+class RunqemuFastBootTests(OESelftestTestCase):
+    """Keys and store of the runqemu fastboot snapshots"""
+
+    def setUp(self):
+        super(RunqemuFastBootTests, self).setUp()
+        self.tempdir = tempfile.mkdtemp(prefix='runqemu-fastboot-')
+        self.storedir = os.path.join(self.tempdir, 'store')
+        self.files = {}
+        for name in ('qemu-system-x86_64', 'bzImage'):
+            self.files[name] = os.path.join(self.tempdir, name)
+            with open(self.files[name], 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(RunqemuFastBootTests, self).tearDown()
+
+    def command(self, fastboot, port, pid):
+        return ('qemu-system-x86_64 -pidfile /tmp/pid%d -netdev user,id=net0,hostfwd=tcp::%d-:22 '
+                '-serial tcp:127.0.0.1:%d -drive file=%s/disk.qcow2,if=virtio,format=qcow2  -m 256'
+                % (pid, port, port + 1, fastboot.rundir))
+
+    def prepare(self, command):
+        fastboot = FastBoot(self.storedir)
+        # No VM to resume or to serve the control socket for
+        fastboot.resume = fastboot.serve = lambda: None
+        options = fastboot.prepare(command(fastboot), self.files['qemu-system-x86_64'], [self.files['bzImage'], None])
+        return fastboot, options
+
+    def test_normalize(self):
+        fastboot = FastBoot(self.storedir)
+        self.assertEqual(fastboot.normalize(self.command(fastboot, 2222, 1)),
+                         'qemu-system-x86_64 -netdev user,id=net0,hostfwd=tcp::@PORT@-:22 '
+                         '-serial tcp:127.0.0.1:@PORT@ -drive file=@RUNDIR@/disk.qcow2,if=virtio,format=qcow2 -m 256')
+        self.assertEqual(fastboot.normalize(self.command(fastboot, 2222, 1)),
+                         fastboot.normalize(self.command(fastboot, 5555, 2)))
+
+    def test_key(self):
+        first, options = self.prepare(lambda f: self.command(f, 2222, 1))
+        self.assertNotIn('-incoming', options)
+        # Another run of the same VM on other ports
+        second, options = self.prepare(lambda f: self.command(f, 5555, 2))
+        self.assertEqual(first.key, second.key)
+
+        # Other options or another kernel
+        other, options = self.prepare(lambda f: self.command(f, 2222, 1) + ' -smp 4')
+        self.assertNotEqual(other.key, first.key)
+        with open(self.files['bzImage'], 'w') as f:
+            f.write('rebuilt')
+        other, options = self.prepare(lambda f: self.command(f, 2222, 1))
+        self.assertNotEqual(other.key, first.key)
+
+    def test_restore(self):
+        first, options = self.prepare(lambda f: self.command(f, 2222, 1))
+        os.makedirs(first.keydir)
+        with open(os.path.join(first.keydir, 'info.json'), 'w') as f:
+            f.write('{"boottime": 10.0}')
+        second, options = self.prepare(lambda f: self.command(f, 5555, 2))
+        self.assertTrue(second.restoring)
+        self.assertIn('-incoming', options)
+        self.assertIn(os.path.join(first.keydir, 'state'), options)
+
+    def test_prune(self):
+        fastboot = FastBoot(self.storedir)
+        for i in range(5):
+            path = os.path.join(self.storedir, 'key%d' % i)
+            os.makedirs(path)
+            with open(os.path.join(path, 'info.json'), 'w') as f:
+                f.write('{}')
+            os.utime(os.path.join(path, 'info.json'), (1000 + i, 1000 + i))
+        # Left behind by a killed run, its pid being above pid_max
+        os.makedirs(os.path.join(self.storedir, 'run-%d-x' % (1 << 23)))
+
+        fastboot.prune()
+        self.assertEqual(sorted(os.listdir(self.storedir)),
+                         sorted(['key2', 'key3', 'key4', os.path.basename(fastboot.rundir)]))
+
+    def test_has_drives(self):
+        self.assertFalse(FastBoot.has_drives(' -m 256 -device virtio-rng-pci'))
+        self.assertFalse(FastBoot.has_drives('-netdev user,id=net0 -device e1000,drive-letter=1'))
+        self.assertTrue(FastBoot.has_drives(' -drive file=data.img,if=virtio'))
+        self.assertTrue(FastBoot.has_drives('-m 256 -hdb data.img'))
@@ -0,0 +1,154 @@
+#
+# SPDX-License-Identifier: MIT
+#
+
+import os
+import shutil
+import tempfile
+import time
+
+from oeqa.selftest.case import OESelftestTestCase
+from oeqa.utils.commands import runCmd
+
+from sstatecache import SstateCache, SstateCacheError, remove_files
+
+DAY = 24 * 3600
+
+class SstateCacheManagementTests(OESelftestTestCase):
+    """Pruning policies of sstate-cache-management on a synthetic cache"""
+
+    def setUp(self):
+        super(SstateCacheManagementTests, self).setUp()
+        self.tempdir = tempfile.mkdtemp(prefix='sstate-cache-management-')
+        self.cache_dir = os.path.join(self.tempdir, 'sstate-cache')
+        os.makedirs(self.cache_dir)
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(SstateCacheManagementTests, self).tearDown()
+
+    def add(self, pn, task, hashchar, age=0, link_to=None):
+        """Add the archive and siginfo of an artifact used age days ago,
+        returns the path of the archive"""
+        sthash = hashchar * 64
+        name = 'sstate:%s:core2-64-poky-linux:1.0:r0:core2-64:3:%s_%s.tgz' % (pn, sthash, task)
+        path = os.path.join(self.cache_dir, sthash[:2], name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if link_to:
+            os.symlink(link_to, path)
+        else:
+            with open(path, 'w') as f:
+                f.write(name)
+        with open(path + '.siginfo', 'w') as f:
+            f.write(name)
+        mtime = self.now - age * DAY
+        for p in (path, path + '.siginfo'):
+            os.utime(p, (mtime, mtime), follow_symlinks=False)
+        return path
+
+    def populate(self):
+        self.old = self.add('zlib', 'package', '1', age=10)
+        self.new = self.add('zlib', 'package', '2', age=1)
+        self.lic_old = self.add('zlib', 'populate_lic', '3', age=10)
+        self.lic_new = self.add('zlib', 'populate_lic', '4', age=1)
+        # The newest populate_sysroot artifact links to an older one
+        self.target = self.add('bzip2', 'populate_sysroot', '5', age=20)
+        self.link = self.add('bzip2', 'populate_sysroot', '6', link_to=self.target)
+        self.legacy = os.path.join(self.cache_dir, 'sstate-zlib-core2-64-poky-linux-1.0-r0-core2-64-2-%s_package.tgz' % ('7' * 32))
+        open(self.legacy, 'w').close()
+
+    def existing(self):
+        paths = set()
+        for root, dirs, files in os.walk(self.cache_dir):
+            paths.update(os.path.join(root, f) for f in files)
+        return paths
+
+    def removed(self, files):
+        return sorted(f.path for f in files)
+
+    def test_scan(self):
+        self.populate()
+        cache = SstateCache(self.cache_dir, jobs=2).scan()
+        self.assertEqual(len(cache.files), 12)
+        self.assertEqual(cache.other, [self.legacy])
+        artifacts = cache.artifacts()
+        self.assertEqual(sorted(artifacts[('zlib', 'core2-64', 'package')]), ['1' * 64, '2' * 64])
+        self.assertEqual([f.islink for f in artifacts[('bzip2', 'core2-64', 'populate_sysroot')]['6' * 64] if f.ext == ''], [True])
+
+    def test_duplicates(self):
+        self.populate()
+        cache = SstateCache(self.cache_dir).scan()
+        # populate_lic is shared between hashes and the target of the
+        # newest populate_sysroot is kept, with its siginfo
+        self.assertEqual(self.removed(cache.duplicates()), sorted([self.old, self.old + '.siginfo']))
+        self.assertEqual(cache.duplicates(archs=set(['allarch'])), [])
+        self.assertEqual(self.removed(cache.duplicates(archs=set(['core2-64']))), sorted([self.old, self.old + '.siginfo']))
+
+    def test_stamps(self):
+        self.populate()
+        stamps = os.path.join(self.tempdir, 'stamps', 'core2-64-poky-linux', 'zlib')
+        os.makedirs(stamps)
+        open(os.path.join(stamps, '1.0-r0.do_package.sigdata.%s' % ('2' * 64)), 'w').close()
+        open(os.path.join(stamps, '1.0-r0.do_populate_lic_setscene.%s.%s' % ('4' * 64, 'f' * 64)), 'w').close()
+        open(os.path.join(stamps, '1.0-r0.do_compile'), 'w').close()
+
+        cache = SstateCache(self.cache_dir).scan()
+        hashes = cache.stamp_hashes([os.path.join(self.tempdir, 'stamps')])
+        self.assertEqual(hashes, {'2' * 64, '4' * 64})
+        self.assertEqual(self.removed(cache.unused(hashes)),
+                         sorted(p + ext for p in (self.old, self.lic_old, self.target, self.link) for ext in ('', '.siginfo')))
+
+        # Stamps of an unrelated build must not empty the cache
+        with self.assertRaises(SstateCacheError):
+            cache.unused({'0' * 64})
+
+    def test_age(self):
+        self.populate()
+        cache = SstateCache(self.cache_dir).scan()
+        self.assertEqual(self.removed(cache.older_than(5 * DAY, now=self.now)),
+                         sorted(p + ext for p in (self.old, self.lic_old) for ext in ('', '.siginfo')))
+        self.assertEqual(cache.older_than(30 * DAY, now=self.now), [])
+
+    def test_symlink_targets(self):
+        self.populate()
+        cache = SstateCache(self.cache_dir).scan()
+        links = [f for f in cache.files if f.islink]
+        self.assertEqual(sorted(cache.link_targets(links)), sorted([self.target, self.target + '.siginfo']))
+
+        removed = remove_files([self.link, self.link + '.siginfo', self.link], jobs=2)
+        self.assertEqual(removed, 2)
+        self.assertTrue(os.path.exists(self.target))
+
+    def test_script(self):
+        self.populate()
+        before = self.existing()
+        result = runCmd('sstate-cache-management.py --cache-dir=%s --remove-duplicated --dry-run' % self.cache_dir)
+        self.assertIn('3 out of 13 files would be removed', result.output)
+        self.assertEqual(self.existing(), before)
+
+        # Only the duplicates of the listed archs are removed
+        result = runCmd('sstate-cache-management.py --cache-dir=%s --remove-duplicated --extra-archs=qemux86 --dry-run' % self.cache_dir)
+        self.assertIn('1 out of 13 files would be removed', result.output)
+
+        runCmd('sstate-cache-management.py --cache-dir=%s --remove-duplicated -y' % self.cache_dir)
+        self.assertEqual(self.existing(), before - set([self.old, self.old + '.siginfo', self.legacy]))
+        # The kept symlink still resolves, and the siginfo of its target is kept
+        self.assertTrue(os.path.exists(self.link))
+        self.assertTrue(os.path.exists(self.target + '.siginfo'))
+
+        # The shell wrapper accepts the same options
+        result = runCmd('sstate-cache-management.sh --cache-dir=%s --older-than=5 --dry-run' % self.cache_dir)
+        self.assertIn('2 out of 10 files would be removed', result.output)
+
+    def test_script_stamps(self):
+        self.populate()
+        unknown = os.path.join(self.cache_dir, '22', 'sstate-unknown-name')
+        open(unknown, 'w').close()
+        stamps = os.path.join(self.tempdir, 'stamps', 'core2-64-poky-linux', 'zlib')
+        os.makedirs(stamps)
+        open(os.path.join(stamps, '1.0-r0.do_package.sigdata.%s' % ('2' * 64)), 'w').close()
+
+        # Files with the old or unknown names are removed with the unused ones
+        runCmd('sstate-cache-management.py --cache-dir=%s --stamps-dir=%s -y' % (self.cache_dir, os.path.join(self.tempdir, 'stamps')))
+        self.assertEqual(self.existing(), set([self.new, self.new + '.siginfo']))
@@ -19,7 +19,7 @@ import oe
 from oeqa.core.context import OETestContext, OETestContextExecutor
 from oeqa.core.exception import OEQAPreRun, OEQATestNotFound
 
-from oeqa.utils.commands import runCmd, get_bb_vars, get_test_layer
+from oeqa.utils.commands import runCmd, get_bb_vars, get_test_layer, bb_var_cache
 
 class OESelftestTestContext(OETestContext):
     def __init__(self, td=None, logger=None, machines=None, config_paths=None):
@@ -29,14 +29,14 @@ class OESelftestTestContext(OETestContext):
         self.custommachine = None
         self.config_paths = config_paths
 
-    def runTests(self, processes=None, machine=None, skips=[]):
+    def runTests(self, processes=None, machine=None, skips=[], durations=None):
         if machine:
             self.custommachine = machine
             if machine == 'random':
                 self.custommachine = choice(self.machines)
             self.logger.info('Run tests with custom MACHINE set to: %s' % \
                     self.custommachine)
-        return super(OESelftestTestContext, self).runTests(processes, skips)
+        return super(OESelftestTestContext, self).runTests(processes, skips, durations)
 
     def listTests(self, display_type, machine=None):
         return super(OESelftestTestContext, self).listTests(display_type)
@@ -270,15 +270,29 @@ class OESelftestTestContextExecutor(OETestContextExecutor):
             rc = self.tc.listTests(args.list_tests, **self.tc_kwargs['list'])
         else:
             self._pre_run()
+            if self.tc_kwargs['run']['processes']:
+                from oeqa.core.runner import OETestResultJSONHelper
+                from oeqa.core.utils.concurrencytest import load_test_durations
+                json_file = os.path.join(self.get_json_result_dir(args), OETestResultJSONHelper.testresult_filename)
+                self.tc_kwargs['run']['durations'] = load_test_durations(json_file)
             rc = self.tc.runTests(**self.tc_kwargs['run'])
             configuration = self.get_configuration(args)
             rc.logDetails(self.get_json_result_dir(args),
                           configuration,
                           self.get_result_id(configuration))
             rc.logSummary(self.name)
+            self.log_bb_var_cache_stats(rc)
 
         return rc
 
+    def log_bb_var_cache_stats(self, rc):
+        hits, misses = getattr(rc, 'bbvarcache', [0, 0])
+        hits += bb_var_cache.hits
+        misses += bb_var_cache.misses
+        if hits + misses:
+            self.tc.logger.info("bitbake variable cache: %d hits, %d misses (%.1f%% hit rate)" %
+                                (hits, misses, 100.0 * hits / (hits + misses)))
+
     def _signal_clean_handler(self, signum, frame):
         sys.exit(1)
     
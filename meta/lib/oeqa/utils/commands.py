@@ -17,10 +17,12 @@ import subprocess
 import threading
 import time
 import logging
+import hashlib
 from oeqa.utils import CommandError
 from oeqa.utils import ftools
 import re
 import contextlib
+import glob
 # Export test doesn't require bb
 try:
     import bb
@@ -179,6 +181,14 @@ def runCmd(command, ignore_status=False, timeout=None, assert_error=True,
         nenv['LD_LIBRARY_PATH'] = extra_libpaths + ':' + nenv.get('LD_LIBRARY_PATH', '')
         options['env'] = nenv
 
+    # devtool and recipetool write recipes and appends into the layers
+    if isinstance(command, str):
+        program = command.split(None, 1)[0] if command.strip() else ''
+    else:
+        program = command[0] if command else ''
+    if os.path.basename(program) in ('devtool', 'recipetool'):
+        bb_var_cache.invalidate()
+
     cmd = Command(command, timeout=timeout, output_log=output_log, **options)
     cmd.run()
 
@@ -230,12 +240,8 @@ def get_bb_env(target=None, postconfig=None):
     else:
         return bitbake("-e", postconfig=postconfig).output
 
-def get_bb_vars(variables=None, target=None, postconfig=None):
-    """Get values of multiple bitbake variables"""
-    bbenv = get_bb_env(target, postconfig=postconfig)
-
-    if variables is not None:
-        variables = list(variables)
+def parse_bb_env(bbenv):
+    """Parse the output of bitbake -e into a dict of variable values"""
     var_re = re.compile(r'^(export )?(?P<var>\w+(_.*)?)="(?P<value>.*)"$')
     unset_re = re.compile(r'^unset (?P<var>\w+)$')
     lastline = None
@@ -252,23 +258,101 @@ def get_bb_vars(variables=None, target=None, postconfig=None):
                 if lastline.startswith('#   "'):
                     val = lastline.split('"')[1]
         if val:
-            var = match.group('var')
-            if variables is None:
-                values[var] = val
-            else:
-                if var in variables:
-                    values[var] = val
-                    variables.remove(var)
-                # Stop after all required variables have been found
-                if not variables:
-                    break
+            values[match.group('var')] = val
         lastline = line
-    if variables:
-        # Fill in missing values
-        for var in variables:
-            values[var] = None
     return values
 
+class BBVarCache(object):
+    """
+    Cache of parsed bitbake -e output. Entries are keyed on the target, the
+    postconfig and the environment and are only reused while none of the
+    configuration files, nor the files bitbake reported as parsed
+    (BBINCLUDED and FILE), nor the directories holding them, nor the
+    directories BBFILES matches recipes and appends in, have changed.
+    Running devtool or recipetool through runCmd() drops all the entries.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, target, postconfig):
+        envhash = hashlib.sha256(repr(sorted(os.environ.items())).encode("utf-8")).hexdigest()
+        postconfighash = None
+        if postconfig:
+            postconfighash = hashlib.sha256(postconfig.encode("utf-8")).hexdigest()
+        return (target, postconfighash, envhash)
+
+    def _stamp(self, paths):
+        stamp = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def _conffiles(self):
+        builddir = os.environ.get('BUILDDIR')
+        if not builddir:
+            return []
+        paths = []
+        for root, dirs, files in os.walk(os.path.join(builddir, 'conf')):
+            paths.append(root)
+            paths.extend(os.path.join(root, f) for f in files)
+        return paths
+
+    def _bbfilesdirs(self, patterns):
+        # Recipes and appends added to new directories show up as new
+        # matches, those added to existing directories change their mtime
+        dirs = []
+        for pattern in patterns:
+            dirs.extend(sorted(glob.glob(pattern)))
+        return dirs, self._stamp(dirs)
+
+    def get(self, target, postconfig):
+        entry = self.entries.get(self._key(target, postconfig))
+        if entry:
+            paths, patterns, stamp, values = entry
+            if self._stamp(self._conffiles()) == stamp[0] and self._stamp(paths) == stamp[1] and \
+                    self._bbfilesdirs(patterns) == stamp[2]:
+                self.hits += 1
+                return values
+        self.misses += 1
+        return None
+
+    def put(self, target, postconfig, values):
+        paths = values.get('BBINCLUDED', '').split()
+        if values.get('FILE'):
+            paths.append(values['FILE'])
+        paths.extend(set(os.path.dirname(p) for p in paths))
+        patterns = sorted(set(os.path.dirname(p) for p in values.get('BBFILES', '').split()))
+        stamp = (self._stamp(self._conffiles()), self._stamp(paths), self._bbfilesdirs(patterns))
+        self.entries[self._key(target, postconfig)] = (paths, patterns, stamp, values)
+
+    def invalidate(self):
+        self.entries = {}
+
+    def hitrate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return 100.0 * self.hits / total
+
+bb_var_cache = BBVarCache()
+
+def get_bb_vars(variables=None, target=None, postconfig=None):
+    """Get values of multiple bitbake variables"""
+    values = bb_var_cache.get(target, postconfig)
+    if values is None:
+        values = parse_bb_env(get_bb_env(target, postconfig=postconfig))
+        bb_var_cache.put(target, postconfig, values)
+
+    if variables is None:
+        return dict(values)
+    return dict((var, values.get(var)) for var in variables)
+
 def get_bb_var(var, target=None, postconfig=None):
     return get_bb_vars([var], target, postconfig)[var]
 
@@ -57,11 +57,16 @@ class QemuRunner:
         self.use_slirp = use_slirp
         self.serial_ports = serial_ports
         self.msg = ''
+        # Seconds from the launch of runqemu to the shell prompt and whether
+        # the VM was restored from a runqemu fastboot snapshot
+        self.boot_to_prompt = None
+        self.restored = False
 
         self.runqemutime = 120
         self.qemu_pidfile = 'pidfile_'+str(os.getpid())
         self.host_dumper = HostDumper(dump_host_cmds, dump_dir)
         self.monitorpipe = None
+        self.serial = None
 
         self.logger = logger
 
@@ -171,6 +176,7 @@ class QemuRunner:
         signal.signal(signal.SIGCHLD, self.handleSIGCHLD)
 
         self.logger.debug('launchcmd=%s'%(launch_cmd))
+        launchtime = time.time()
 
         # FIXME: We pass in stdin=subprocess.PIPE here to work around stty
         # blocking at the end of the runqemu script when using this within
@@ -239,6 +245,10 @@ class QemuRunner:
         # We are alive: qemu is running
         out = self.getOutput(output)
         netconf = False # network configuration is not required by default
+        # With the fastboot option runqemu either restores the VM as it was
+        # once logged in, or does a cold boot and saves it when asked to
+        self.restored = 'Fast boot: restoring snapshot' in out
+        fastboot_control = re.search(r'Fast boot: cold boot, control socket (\S+)', out)
         self.logger.debug("qemu started in %s seconds - qemu procces pid is %s (%s)" %
                           (time.time() - (endtime - self.runqemutime),
                            self.qemupid, time.strftime("%D %H:%M:%S")))
@@ -312,6 +322,11 @@ class QemuRunner:
                     socklist.append(qemusock)
                     socklist.remove(self.server_socket)
                     self.logger.debug("Connection from %s:%s" % addr)
+                    if self.restored:
+                        # Already logged in, there is no banner to wait for
+                        self.server_socket = qemusock
+                        stopread = True
+                        reachedlogin = True
                 else:
                     data = data + sock.recv(1024)
                     if data:
@@ -353,10 +368,17 @@ class QemuRunner:
 
         # If we are not able to login the tests can continue
         try:
-            (status, output) = self.run_serial("root\n", raw=True)
+            (status, output) = self.run_serial("\n" if self.restored else "root\n", raw=True)
             if re.search(r"root@[a-zA-Z0-9\-]+:~#", output):
                 self.logged = True
-                self.logger.debug("Logged as root in serial console")
+                self.boot_to_prompt = time.time() - launchtime
+                self.logger.debug("Logged as root in serial console, boot to prompt took %.2f seconds (%s)" %
+                                  (self.boot_to_prompt, "restored snapshot" if self.restored else "cold boot"))
+                if self.restored:
+                    # The clock of the guest stopped when it was saved
+                    self.run_serial('date -u -s "%s"' % time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()))
+                elif fastboot_control:
+                    self.save_fastboot(fastboot_control.group(1))
                 if netconf:
                     # configure guest networking
                     cmd = "ifconfig eth0 %s netmask %s up\n" % (self.ip, self.netmask)
@@ -373,6 +395,19 @@ class QemuRunner:
             self.logger.warning("Serial console failed while trying to login")
         return True
 
+    def save_fastboot(self, control):
+        """Ask runqemu to save the logged in VM so that the next boots
+        restore it"""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.runqemutime)
+                sock.connect(control)
+                sock.sendall(b"save %.2f\n" % self.boot_to_prompt)
+                reply = sock.makefile().readline().strip()
+            self.logger.debug("runqemu fastboot snapshot: %s" % reply)
+        except OSError as e:
+            self.logger.warning("Couldn't save the runqemu fastboot snapshot: %s" % e)
+
     def stop(self):
         if hasattr(self, "origchldhandler"):
             signal.signal(signal.SIGCHLD, self.origchldhandler)
@@ -400,6 +435,7 @@ class QemuRunner:
         if hasattr(self, 'server_socket') and self.server_socket:
             self.server_socket.close()
             self.server_socket = None
+        self.serial = None
         if hasattr(self, 'threadsock') and self.threadsock:
             self.threadsock.close()
             self.threadsock = None
@@ -452,51 +488,18 @@ class QemuRunner:
         return False
 
     def run_serial(self, command, raw=False, timeout=60):
-        # We assume target system have echo to get command status
-        if not raw:
-            command = "%s; echo $?\n" % command
-
-        data = ''
-        status = 0
-        self.server_socket.sendall(command.encode('utf-8'))
-        start = time.time()
-        end = start + timeout
-        while True:
-            now = time.time()
-            if now >= end:
-                data += "<<< run_serial(): command timed out after %d seconds without output >>>\r\n\r\n" % timeout
-                break
-            try:
-                sread, _, _ = select.select([self.server_socket],[],[], end - now)
-            except InterruptedError:
-                continue
-            if sread:
-                answer = self.server_socket.recv(1024)
-                if answer:
-                    data += answer.decode('utf-8')
-                    # Search the prompt to stop
-                    if re.search(r"[a-zA-Z0-9]+@[a-zA-Z0-9\-]+:~#", data):
-                        break
-                else:
-                    raise Exception("No data on serial console socket")
-
-        if data:
-            if raw:
-                status = 1
-            else:
-                # Remove first line (command line) and last line (prompt)
-                data = data[data.find('$?\r\n')+4:data.rfind('\r\n')]
-                index = data.rfind('\r\n')
-                if index == -1:
-                    status_cmd = data
-                    data = ""
-                else:
-                    status_cmd = data[index+2:]
-                    data = data[:index]
-                if (status_cmd == "0"):
-                    status = 1
-        return (status, str(data))
-
+        if not self.serial or self.serial.sock is not self.server_socket:
+            self.serial = SerialConsole(self.server_socket)
+        if raw:
+            return self.serial.run_raw(command, timeout)
+        return self.serial.run(command, timeout)
+
+    def run_serial_multiple(self, commands, timeout=60):
+        """Pipeline several commands on the serial console, returning a
+        (status, output) tuple for each of them"""
+        if not self.serial or self.serial.sock is not self.server_socket:
+            self.serial = SerialConsole(self.server_socket)
+        return self.serial.run_multiple(commands, timeout)
 
     def _dump_host(self):
         self.host_dumper.create_dir("qemu")
@@ -504,6 +507,144 @@ class QemuRunner:
                 " is in %s" % self.host_dumper.dump_dir)
         self.host_dumper.dump_host()
 
+# A shell session on the serial console of the target. Data read from the
+# socket is decoded incrementally and only a bounded tail of it is searched
+# for the prompt or for the sentinels framing each command, so the cost of a
+# command is linear in the size of its output.
+class SerialConsole(object):
+    prompt_re = re.compile(r"[a-zA-Z0-9]+@[a-zA-Z0-9\-]+:~#")
+    # Seconds to wait for the prompt after the end sentinel of a command
+    prompt_timeout = 5
+
+    def __init__(self, sock, tailsize=4096, bufsize=65536):
+        self.sock = sock
+        self.tailsize = tailsize
+        self.bufsize = bufsize
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending = ''
+        self.counter = 0
+        self.token = os.urandom(4).hex()
+
+    def read_until(self, regex, end):
+        """
+        Read from the console until regex matches, returning the data up to
+        the end of the match and the match itself. Anything read beyond the
+        match is kept for the next call. On timeout the data read so far is
+        returned with no match.
+        """
+        chunks = [self.pending]
+        window = self.pending
+        consumed = 0
+        self.pending = ''
+        while True:
+            m = regex.search(window)
+            if m:
+                data = ''.join(chunks)
+                split = consumed + m.end()
+                self.pending = data[split:]
+                return data[:split], m
+
+            # Only the tail can contain the start of a later match
+            if len(window) > self.tailsize:
+                consumed += len(window) - self.tailsize
+                window = window[-self.tailsize:]
+
+            text = None
+            while text is None:
+                now = time.time()
+                if now >= end:
+                    return ''.join(chunks), None
+                try:
+                    sread, _, _ = select.select([self.sock], [], [], end - now)
+                except InterruptedError:
+                    continue
+                if sread:
+                    answer = self.sock.recv(self.bufsize)
+                    if not answer:
+                        raise Exception("No data on serial console socket")
+                    text = self.decoder.decode(answer)
+            chunks.append(text)
+            window += text
+
+    def timedout(self, data, timeout):
+        return data + "<<< run_serial(): command timed out after %d seconds without output >>>\r\n\r\n" % timeout
+
+    def drain(self):
+        """Discard anything already received from the console"""
+        self.pending = ''
+        while select.select([self.sock], [], [], 0)[0]:
+            if not self.sock.recv(self.bufsize):
+                raise Exception("No data on serial console socket")
+
+    def run_raw(self, command, timeout=60):
+        """Send command and wait for the shell prompt"""
+        self.drain()
+        self.sock.sendall(command.encode('utf-8'))
+        data, m = self.read_until(self.prompt_re, time.time() + timeout)
+        if not m:
+            data = self.timedout(data, timeout)
+        return (1 if data else 0, data)
+
+    def frame(self, command):
+        """
+        Wrap command between two unique sentinels. They are split by quotes
+        on the command line so the echo of the command itself never matches.
+        """
+        self.counter += 1
+        marker = "OEQA%s%d" % (self.token, self.counter)
+        line = 'echo "%s""B"; %s; echo "%s""E$?"\n' % (marker, command, marker)
+        return line, marker
+
+    def collect(self, marker, end, timeout):
+        """
+        Read the output of the framed command with the given marker, returns
+        the (status, output) tuple and whether the end sentinel was found
+        """
+        endre = re.compile(r"%sE(\d+)\r?\n" % marker)
+        data, m = self.read_until(endre, end)
+
+        # The returned data ends with the end sentinel when it was found
+        begin = data.find(marker + "B")
+        if begin != -1:
+            begin = data.find("\n", begin) + 1
+        else:
+            begin = 0
+        if not m:
+            return (0, self.timedout(data[begin:], timeout)), False
+
+        output = data[begin:len(data) - len(m.group(0))]
+        if output.endswith('\r\n'):
+            output = output[:-2]
+        elif output.endswith('\n'):
+            output = output[:-1]
+        return (1 if m.group(1) == "0" else 0, output), True
+
+    def run(self, command, timeout=60):
+        """
+        Run command and return a (status, output) tuple, where status is 1
+        if the command exited with 0 and 0 otherwise
+        """
+        return self.run_multiple([command], timeout)[0]
+
+    def run_multiple(self, commands, timeout=60):
+        """
+        Send all the commands in one go and collect the output of each of
+        them in turn. The timeout applies to each command.
+        """
+        self.pending = ''
+        framed = [self.frame(c) for c in commands]
+        self.sock.sendall("".join(line for line, _ in framed).encode('utf-8'))
+        results = []
+        for line, marker in framed:
+            result, found = self.collect(marker, time.time() + timeout, timeout)
+            results.append(result)
+        # Read through the prompt following the last command so that it
+        # isn't taken for the prompt of a later raw command. It comes right
+        # after the end sentinel, unless the command took the shell away.
+        if found:
+            self.read_until(self.prompt_re, time.time() + min(timeout, self.prompt_timeout))
+        return results
+
 # This class is for reading data from a socket and passing it to logfunc
 # to be processed. It's completely event driven and has a straightforward
 # event loop. The mechanism for stopping the thread is a simple pipe which
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Benchmark loading of buildstats directories: the serial parser, the
+# parallel loader and the parallel loader's cache
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+sys.path.insert(0, scripts_path + '/lib')
+from buildstats import BuildStats
+
+
+TASKS = ('do_fetch', 'do_unpack', 'do_patch', 'do_configure', 'do_compile',
+         'do_install', 'do_package', 'do_packagedata', 'do_package_write_rpm',
+         'do_populate_sysroot')
+RUSAGES = ('ru_utime', 'ru_stime', 'ru_maxrss', 'ru_minflt', 'ru_majflt',
+           'ru_inblock', 'ru_oublock', 'ru_nvcsw', 'ru_nivcsw')
+
+
+def populate(path, recipes):
+    """Create a synthetic buildstats directory"""
+    os.makedirs(path)
+    with open(os.path.join(path, 'build_stats'), 'w') as f:
+        f.write('Build Started: 1000.00\n')
+    for i in range(recipes):
+        pf = 'recipe%05d-1.0-r0' % i
+        os.makedirs(os.path.join(path, pf))
+        for j, task in enumerate(TASKS):
+            with open(os.path.join(path, pf, task), 'w') as f:
+                f.write('Started: %0.2f\n' % (1000 + i + j))
+                f.write('%s: %s\nElapsed time: 1.00 seconds\n' % (pf, task))
+                for key in ('utime', 'stime', 'cutime', 'cstime'):
+                    f.write('%s: %d\n' % (key, i + j))
+                for key in ('rchar', 'wchar', 'syscr', 'syscw', 'read_bytes',
+                            'write_bytes', 'cancelled_write_bytes'):
+                    f.write('IO %s: %d\n' % (key, i * j))
+                for prefix in ('rusage', 'Child rusage'):
+                    for key in RUSAGES:
+                        f.write('%s %s: %s\n' % (prefix, key, '0.5' if key in ('ru_utime', 'ru_stime') else i))
+                f.write('Status: PASSED \nEnded: %0.2f \n' % (1001 + i + j))
+
+
+def timed(func, *args, **kwargs):
+    start = time.monotonic()
+    func(*args, **kwargs)
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark buildstats loading')
+    parser.add_argument('-s', '--source', help='Existing buildstats directory (default: generate one)')
+    parser.add_argument('-w', '--workdir', help='Directory to run the benchmark in')
+    parser.add_argument('--recipes', type=int, default=3000,
+                        help='Recipes to generate, with {} tasks each'.format(len(TASKS)))
+    parser.add_argument('-j', '--jobs', type=int, help='Processes of the parallel loader')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs of each loader')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='buildstats-bench-', dir=args.workdir)
+    try:
+        path = os.path.join(workdir, 'buildstats')
+        if args.source:
+            shutil.copytree(args.source, path)
+        else:
+            populate(path, args.recipes)
+        cache = os.path.join(path, BuildStats.cache_file)
+
+        def uncached():
+            BuildStats.from_dir_parallel(path, jobs=args.jobs, use_cache=False)
+
+        def cached():
+            BuildStats.from_dir_parallel(path, jobs=args.jobs)
+
+        loaders = [
+            ('from_dir', lambda: BuildStats.from_dir(path)),
+            ('parallel', uncached),
+            ('cached', cached),
+        ]
+        print('%d tasks' % BuildStats.from_dir(path).num_tasks)
+        cached()
+        for name, func in loaders:
+            times = [timed(func) for i in range(args.repeat)]
+            print('%-9s best %.3fs  mean %.3fs' % (name, min(times), sum(times) / len(times)))
+        print('cache size %d bytes' % os.path.getsize(cache))
+    finally:
+        shutil.rmtree(workdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
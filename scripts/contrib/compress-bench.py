@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+# Benchmark the creation of source tarballs: tarfile's single threaded gzip
+# against the parallel compression of oe.compress, e.g. on a kernel tree
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+sys.path.insert(0, scripts_path + '/../meta/lib')
+import oe.compress
+
+
+def timed(func, *args, **kwargs):
+    start = time.monotonic()
+    func(*args, **kwargs)
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tarball compression')
+    parser.add_argument('source', help='Directory to archive, e.g. a kernel source tree')
+    parser.add_argument('-w', '--workdir', help='Directory to write the tarballs to')
+    parser.add_argument('-j', '--threads', type=int, default=os.cpu_count(),
+                        help='Compression threads (default: %(default)s)')
+    parser.add_argument('-l', '--level', type=int, default=6,
+                        help='gzip compression level of both methods (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Number of runs of each method')
+    parser.add_argument('--xz', action='store_true', help='Also time multithreaded xz')
+    args = parser.parse_args()
+
+    source = os.path.realpath(args.source)
+    arcname = os.path.basename(source)
+    workdir = tempfile.mkdtemp(prefix='compress-bench-', dir=args.workdir)
+    try:
+        out = os.path.join(workdir, 'out.tar')
+
+        def tarfile_gz():
+            with tarfile.open(out + '.gz', 'w:gz', compresslevel=args.level) as tar:
+                tar.add(source, arcname=arcname)
+
+        methods = [
+            ('tarfile w:gz', tarfile_gz, out + '.gz'),
+            ('parallel gz', lambda: oe.compress.create_tarball(out + '.gz', source, arcname, 'gz', args.threads, args.level), out + '.gz'),
+        ]
+        if args.xz:
+            methods.append(('xz -T%d' % args.threads,
+                            lambda: oe.compress.create_tarball(out + '.xz', source, arcname, 'xz', args.threads), out + '.xz'))
+
+        # Warm the page cache so that all the methods read the tree from memory
+        tarfile.open(os.devnull, 'w').add(source, arcname=arcname)
+        baseline = None
+        for name, func, path in methods:
+            times = [timed(func) for i in range(args.repeat)]
+            best = min(times)
+            baseline = baseline or best
+            print('%-14s best %7.2fs  %6.2fx  %d bytes' % (name, best, baseline / best, os.path.getsize(path)))
+    finally:
+        shutil.rmtree(workdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
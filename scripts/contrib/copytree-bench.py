@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Benchmark the native oe.path tree copy engine against the tar pipeline
+# it replaces
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+sys.path.insert(0, scripts_path + '/lib')
+import scriptpath
+scriptpath.add_oe_lib_path()
+
+import oe.path
+
+
+def populate(topdir, dirs, files, size):
+    """Create a synthetic tree with some hardlinks and symlinks in it"""
+    payload = os.urandom(size)
+    for d in range(dirs):
+        ddir = os.path.join(topdir, 'd%04d' % d, 'sub')
+        os.makedirs(ddir)
+        for f in range(files):
+            fpath = os.path.join(ddir, 'f%04d' % f)
+            with open(fpath, 'wb') as fobj:
+                fobj.write(payload)
+            if f % 10 == 0:
+                os.link(fpath, fpath + '.hl')
+            if f % 10 == 1:
+                os.symlink('f%04d' % f, fpath + '.sl')
+
+
+def timed(func, *args, **kwargs):
+    start = time.monotonic()
+    func(*args, **kwargs)
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark oe.path copytree engines')
+    parser.add_argument('-s', '--source', help='Existing tree to copy (default: generate one)')
+    parser.add_argument('-w', '--workdir', help='Directory to run the benchmark in')
+    parser.add_argument('--dirs', type=int, default=200, help='Directories to generate')
+    parser.add_argument('--files', type=int, default=50, help='Files per generated directory')
+    parser.add_argument('--size', type=int, default=4096, help='Size of each generated file')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs of each engine')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='copytree-bench-', dir=args.workdir)
+    try:
+        src = args.source
+        if not src:
+            src = os.path.join(workdir, 'src')
+            os.makedirs(src)
+            populate(src, args.dirs, args.files, args.size)
+
+        engines = [
+            ('tar', oe.path._tar_copytree),
+            ('native', oe.path.native_copytree),
+            ('native-hardlink', lambda s, d: oe.path.native_copytree(s, d, hardlink=True)),
+        ]
+        for name, func in engines:
+            times = []
+            for i in range(args.repeat):
+                dst = os.path.join(workdir, 'dst')
+                os.makedirs(dst)
+                subprocess.call(['sync'])
+                times.append(timed(func, src, dst))
+                shutil.rmtree(dst)
+            print('%-16s best %.3fs  mean %.3fs' % (name, min(times), sum(times) / len(times)))
+    finally:
+        shutil.rmtree(workdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+#
+# Benchmark the relocation done by the SDK installer on a synthetic SDK tree:
+# the relocation scripts of a previous revision against those of the working
+# tree, checking that both relocate the tree the same way
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import filecmp
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+corebase = os.path.dirname(scripts_path)
+
+RELOCATE_SH = 'meta/files/toolchain-shar-relocate.sh'
+RELOCATE_PY = 'scripts/relocate_sdk.py'
+OLD_PREFIX = '/opt/relocate-sdk-bench/1.0'
+NATIVE_SYSROOT = 'sysroots/x86_64-pokysdk-linux'
+ENV_SETUP = 'environment-setup-core2-64-poky-linux'
+
+
+def timed(func, *args, **kwargs):
+    start = time.monotonic()
+    func(*args, **kwargs)
+    return time.monotonic() - start
+
+
+def make_elf(interp, size, sections=None):
+    """A 64 bit ELF executable with a PT_INTERP segment, a .text section of
+    size bytes and the given extra PROGBITS sections"""
+    sections = [('.interp', interp.encode() + b'\0' * (512 - len(interp)))] + list((sections or {}).items())
+    sections.append(('.text', bytes(range(256)) * (size // 256)))
+    shstrtab = b'\0'
+    names = []
+    for name, _ in sections + [('.shstrtab', None)]:
+        names.append(len(shstrtab))
+        shstrtab += name.encode() + b'\0'
+
+    body = b''
+    offsets = []
+    offset = 64 + 56
+    for name, data in sections:
+        offsets.append(offset + len(body))
+        body += data
+    offsets.append(offset + len(body))
+    body += shstrtab
+    body += b'\0' * (-len(body) % 8)
+    shoff = offset + len(body)
+
+    shdrs = struct.pack('<IIQQQQIIQQ', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    for (name, data), nameoff, dataoff in zip(sections, names, offsets):
+        shdrs += struct.pack('<IIQQQQIIQQ', nameoff, 1, 2, 0, dataoff, len(data), 0, 0, 1, 0)
+    shdrs += struct.pack('<IIQQQQIIQQ', names[-1], 3, 0, 0, offsets[-1], len(shstrtab), 0, 0, 1, 0)
+
+    ehdr = struct.pack('<4sBBBBB7sHHIQQQIHHHHHH', b'\x7fELF', 2, 1, 1, 0, 0, b'\0' * 7,
+                       2, 62, 1, 0, 64, shoff, 0, 64, 56, 1, 64, len(sections) + 2, len(sections) + 1)
+    phdr = struct.pack('<IIQQQQQQ', 3, 4, offsets[0], 0, 0, 512, 512, 1)
+    return ehdr + phdr + body + shdrs
+
+
+def write(path, data, mode=0o644):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.chmod(path, mode)
+
+
+def make_sdk(top, args):
+    """Create a synthetic SDK installed in OLD_PREFIX in top"""
+    sysroot = os.path.join(top, NATIVE_SYSROOT)
+    loader = OLD_PREFIX + '/' + NATIVE_SYSROOT + '/lib/ld-linux-x86-64.so.2'
+    ldsocache = (OLD_PREFIX + '/' + NATIVE_SYSROOT + '/etc/ld.so.cache').encode()
+    write(os.path.join(sysroot, 'lib/ld-linux-x86-64.so.2'),
+          make_elf(loader, 64 * 1024, {'.ldsocache': ldsocache + b'\0' * (4096 - len(ldsocache))}), 0o755)
+    for i in range(args.binaries):
+        write(os.path.join(sysroot, 'usr/bin/tool%d' % i), make_elf(loader, args.size * 1024), 0o755)
+        write(os.path.join(sysroot, 'usr/lib/libtool%d.so.1' % i), make_elf(loader, args.size * 1024), 0o755)
+        os.symlink('libtool%d.so.1' % i, os.path.join(sysroot, 'usr/lib/libtool%d.so' % i))
+        os.symlink(OLD_PREFIX + '/' + NATIVE_SYSROOT + '/usr/lib/libtool%d.so.1' % i,
+                   os.path.join(sysroot, 'usr/lib/libtool%d-abs.so' % i))
+    for i in range(args.scripts):
+        write(os.path.join(sysroot, 'usr/bin/script%d' % i),
+              ('#!/usr/bin/perl -w\n# installed in %s\nexec %s/%s/usr/bin/tool0 "$@"\n' %
+               (OLD_PREFIX, OLD_PREFIX, NATIVE_SYSROOT)).encode() * 20, 0o755)
+        write(os.path.join(sysroot, 'usr/share/data/conf%d.txt' % i),
+              ('prefix = %s\n' % OLD_PREFIX).encode() + b'x = 1\n' * 200)
+        write(os.path.join(sysroot, 'usr/share/data/blob%d.bin' % i), bytes(range(256)) * 64)
+    write(os.path.join(top, 'site-config-core2-64-poky-linux'), ('%s\n' % OLD_PREFIX).encode())
+    write(os.path.join(top, 'version-core2-64-poky-linux'), b'Distro: bench\n')
+
+
+def git_show(rev, path):
+    return subprocess.check_output(['git', '-C', corebase, 'show', '%s:%s' % (rev, path)])
+
+
+def relocation_scripts(rev):
+    """Contents of the relocation scripts, of the working tree if rev is None"""
+    if rev is None:
+        with open(os.path.join(corebase, RELOCATE_SH), 'rb') as f:
+            sh = f.read()
+        with open(os.path.join(corebase, RELOCATE_PY), 'rb') as f:
+            py = f.read()
+    else:
+        sh = git_show(rev, RELOCATE_SH)
+        py = git_show(rev, RELOCATE_PY)
+    # As create_sdk_files does
+    escaped = re.sub(r'([+.])', r'\\\1', OLD_PREFIX)
+    return sh, py.replace(b'##DEFAULT_INSTALL_DIR##', escaped.encode())
+
+
+def install(template, target, scripts):
+    """Copy the SDK to target and run the relocation part of the installer,
+    its wall time"""
+    sh, py = scripts
+    shutil.copytree(template, target, symlinks=True)
+    env_setup_script = os.path.join(target, ENV_SETUP)
+    write(env_setup_script, ('export OECORE_NATIVE_SYSROOT="%s/%s"\n' % (target, NATIVE_SYSROOT)).encode())
+    write(os.path.join(target, 'relocate_sdk.py'), py, 0o755)
+    installer = os.path.join(os.path.dirname(target), 'installer.sh')
+    with open(installer, 'wb') as f:
+        f.write(('env_setup_script="%s"\ntarget_sdk_dir="%s"\nDEFAULT_INSTALL_DIR="%s"\nSUDO_EXEC=""\nrelocate=1\n' %
+                 (env_setup_script, target, OLD_PREFIX)).encode())
+        f.write(sh)
+    return timed(subprocess.check_call, ['sh', installer], stdout=subprocess.DEVNULL)
+
+
+def compare_trees(a, b):
+    """Relative paths whose content differs between a and b, but for the
+    relocation scripts"""
+    differ = []
+    for root, dirs, files in os.walk(a):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if root == a and name.startswith('relocate_sdk'):
+                continue
+            other = os.path.join(b, os.path.relpath(path, a))
+            if os.path.islink(path):
+                same = os.path.islink(other) and os.readlink(path) == os.readlink(other)
+            elif os.path.isfile(path):
+                same = os.path.isfile(other) and filecmp.cmp(path, other, shallow=False)
+            else:
+                continue
+            if not same:
+                differ.append(os.path.relpath(path, a))
+    return differ
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the relocation of the SDK installer')
+    parser.add_argument('-b', '--baseline',
+                        help='Revision of the relocation scripts to compare against (default: the one before the last change of %s)' % RELOCATE_PY)
+    parser.add_argument('-w', '--workdir', help='Directory to create the SDK trees in')
+    parser.add_argument('-n', '--binaries', type=int, default=500, help='Number of executables and of libraries (default: %(default)s)')
+    parser.add_argument('-s', '--scripts', type=int, default=500, help='Number of scripts, text and data files (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=256, help='Size of the executables in KiB (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Number of runs of each method')
+    args = parser.parse_args()
+
+    baseline = args.baseline
+    if not baseline:
+        last = subprocess.check_output(['git', '-C', corebase, 'log', '-1', '--format=%H', '--', RELOCATE_PY]).decode().strip()
+        baseline = last + '^'
+
+    differ = []
+    workdir = tempfile.mkdtemp(prefix='relocate-sdk-bench-', dir=args.workdir)
+    try:
+        template = os.path.join(workdir, 'template')
+        make_sdk(template, args)
+        methods = [
+            ('baseline', relocation_scripts(baseline)),
+            ('working tree', relocation_scripts(None)),
+        ]
+        # The trees are installed at the same path so that they can be
+        # compared once relocated
+        target = os.path.join(workdir, 'sdk')
+        base = None
+        for name, scripts in methods:
+            times = []
+            for i in range(args.repeat):
+                times.append(install(template, target, scripts))
+                if i:
+                    shutil.rmtree(target)
+                else:
+                    os.rename(target, os.path.join(workdir, name.replace(' ', '-')))
+            best = min(times)
+            base = base or best
+            print('%-14s best %7.2fs  %6.2fx' % (name, best, base / best))
+
+        differ = compare_trees(os.path.join(workdir, 'baseline'), os.path.join(workdir, 'working-tree'))
+        for path in differ:
+            print('Relocated differently: %s' % path)
+    finally:
+        shutil.rmtree(workdir)
+
+    return 1 if differ else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Benchmark the oeqa serial console reader against the previous
+# implementation of QemuRunner.run_serial() using a local shell connected
+# to a socket in place of a qemu serial port
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import re
+import select
+import socket
+import subprocess
+import sys
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+sys.path.insert(0, scripts_path + '/lib')
+import scriptpath
+scriptpath.add_oe_lib_path()
+
+from oeqa.utils.qemurunner import SerialConsole
+
+
+def legacy_run_serial(sock, command, timeout=60):
+    """The run_serial() loop this benchmark compares against"""
+    command = "%s; echo $?\n" % command
+    data = ''
+    sock.sendall(command.encode('utf-8'))
+    end = time.time() + timeout
+    while True:
+        now = time.time()
+        if now >= end:
+            break
+        sread, _, _ = select.select([sock], [], [], end - now)
+        if sread:
+            answer = sock.recv(1024)
+            if not answer:
+                raise Exception("No data on serial console socket")
+            data += answer.decode('utf-8')
+            if re.search(r"[a-zA-Z0-9]+@[a-zA-Z0-9\-]+:~#", data):
+                break
+    return data
+
+
+def start_shell():
+    parent, child = socket.socketpair()
+    env = {'PS1': 'root@qemubench:~# ', 'PATH': os.environ['PATH']}
+    proc = subprocess.Popen(['sh', '-i'], stdin=child, stdout=child, stderr=child, env=env)
+    child.close()
+    # Wait for the first prompt
+    SerialConsole(parent).run_raw('\n', 10)
+    return proc, parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark oeqa serial console reading')
+    parser.add_argument('-s', '--size', type=int, default=50, help='Output size in MB for the new reader')
+    parser.add_argument('-l', '--legacy-size', type=int, default=1, help='Output size in MB for the legacy reader (0 to skip)')
+    args = parser.parse_args()
+
+    proc, sock = start_shell()
+    try:
+        console = SerialConsole(sock)
+        for name, size in (('legacy', args.legacy_size), ('sentinel', args.size)):
+            if not size:
+                continue
+            # 64 character lines so there are many prompt-free reads
+            command = "head -c %d /dev/zero | tr '\\0' 'x' | fold -w 63" % (size * 1024 * 1024)
+            start = time.monotonic()
+            if name == 'legacy':
+                output = legacy_run_serial(sock, command, timeout=3600)
+            else:
+                status, output = console.run(command, timeout=3600)
+            elapsed = time.monotonic() - start
+            print('%-9s %4d MB in %8.2fs (%.1f MB/s), %d bytes returned' %
+                  (name, size, elapsed, size / elapsed, len(output)))
+
+        start = time.monotonic()
+        results = console.run_multiple(['echo %d' % i for i in range(100)])
+        print('pipelined 100 commands in %.3fs, all ok: %s' %
+              (time.monotonic() - start, all(r == (1, str(i)) for i, r in enumerate(results))))
+    finally:
+        sock.close()
+        proc.wait()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
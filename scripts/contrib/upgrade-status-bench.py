@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#
+# Benchmark the recipe upgrade status report on a synthetic layer whose
+# recipes point to a local stand-in upstream: git repositories accessed
+# through file:// and release directories served over HTTP from 127.0.0.1
+#
+# Needs an initialised build directory: the layer is added to its
+# bblayers.conf for the duration of the run.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import functools
+import http.server
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/..')
+sys.path.insert(0, scripts_path + '/lib')
+import scriptpath
+scriptpath.add_oe_lib_path()
+scriptpath.add_bitbake_lib_path()
+
+import oe.recipeutils
+
+LAYER_CONF = '''BBPATH .= ":${LAYERDIR}"
+BBFILES += "${LAYERDIR}/recipes/*.bb"
+BBFILE_COLLECTIONS += "upgrade-status-bench"
+BBFILE_PATTERN_upgrade-status-bench = "^${LAYERDIR}/"
+BBFILE_PRIORITY_upgrade-status-bench = "1"
+LAYERSERIES_COMPAT_upgrade-status-bench = "${LAYERSERIES_CORENAMES}"
+UPSTREAM_CHECK_CACHE = "%s"
+'''
+
+GIT_RECIPE = '''LICENSE = "MIT"
+SRC_URI = "git://%s;protocol=file;branch=master"
+SRCREV = "%s"
+PV = "1.0+git${SRCPV}"
+UPSTREAM_CHECK_GITTAGREGEX = "v(?P<pver>\\d+(\\.\\d+)+)"
+'''
+
+HTTP_RECIPE = '''LICENSE = "MIT"
+SRC_URI = "http://127.0.0.1:%d/%s/%s-1.0.tar.gz"
+UPSTREAM_CHECK_URI = "http://127.0.0.1:%d/%s/"
+'''
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', '-C', repo] + list(args), stderr=subprocess.STDOUT).decode().strip()
+
+
+def make_upstream(topdir, args):
+    """Git repositories and release directories, each with releases 1.0 to
+    1.<releases>; returns the git repositories -> first revision"""
+    repos = {}
+    for i in range(args.repos):
+        repo = os.path.join(topdir, 'git', 'project%d.git' % i)
+        os.makedirs(repo)
+        git(repo, 'init', '-q')
+        git(repo, 'checkout', '-q', '-b', 'master')
+        for r in range(args.releases + 1):
+            with open(os.path.join(repo, 'version'), 'w') as f:
+                f.write('1.%d\n' % r)
+            git(repo, 'add', 'version')
+            git(repo, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost', 'commit', '-q', '-m', '1.%d' % r)
+            git(repo, 'tag', 'v1.%d' % r)
+            if r == 0:
+                repos[repo] = git(repo, 'rev-parse', 'HEAD')
+    for i in range(args.hosted):
+        name = 'tarball%d' % i
+        releases = os.path.join(topdir, 'http', name)
+        os.makedirs(releases)
+        for r in range(args.releases + 1):
+            open(os.path.join(releases, '%s-1.%d.tar.gz' % (name, r)), 'w').close()
+    return repos
+
+
+def make_layer(layerdir, repos, port, args, cache):
+    """Recipes spread over the repositories, so that several recipes share
+    each repository, and one recipe per release directory"""
+    recipes = []
+    os.makedirs(os.path.join(layerdir, 'conf'))
+    os.makedirs(os.path.join(layerdir, 'recipes'))
+    with open(os.path.join(layerdir, 'conf', 'layer.conf'), 'w') as f:
+        f.write(LAYER_CONF % cache)
+    repo_list = sorted(repos)
+    for i in range(args.recipes):
+        repo = repo_list[i % len(repo_list)]
+        recipes.append(os.path.join(layerdir, 'recipes', 'bench-git%d.bb' % i))
+        with open(recipes[-1], 'w') as f:
+            f.write(GIT_RECIPE % (repo, repos[repo]))
+    for i in range(args.hosted):
+        name = 'tarball%d' % i
+        recipes.append(os.path.join(layerdir, 'recipes', '%s_1.0.bb' % name))
+        with open(recipes[-1], 'w') as f:
+            f.write(HTTP_RECIPE % (port, name, name, port, name))
+    return recipes
+
+
+def serve(directory):
+    """Serve directory on a free port of 127.0.0.1 from a thread"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def report(recipes):
+    start = time.monotonic()
+    results = list(oe.recipeutils.get_recipe_upgrade_status(recipes))
+    return time.monotonic() - start, sorted(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the recipe upgrade status report against a local upstream')
+    parser.add_argument('-w', '--workdir', help='Directory to create the upstream and the layer in')
+    parser.add_argument('-n', '--recipes', type=int, default=200, help='Number of git recipes (default: %(default)s)')
+    parser.add_argument('-g', '--repos', type=int, default=50, help='Number of git repositories they share (default: %(default)s)')
+    parser.add_argument('-t', '--hosted', type=int, default=100, help='Number of tarball recipes checked over HTTP (default: %(default)s)')
+    parser.add_argument('-r', '--releases', type=int, default=20, help='Number of releases upstream (default: %(default)s)')
+    args = parser.parse_args()
+
+    if 'BUILDDIR' not in os.environ:
+        print('The build environment must be set up first')
+        return 1
+    bblayersconf = os.path.join(os.environ['BUILDDIR'], 'conf', 'bblayers.conf')
+
+    workdir = tempfile.mkdtemp(prefix='upgrade-status-bench-', dir=args.workdir)
+    server = None
+    shutil.copyfile(bblayersconf, bblayersconf + '.backup')
+    try:
+        repos = make_upstream(os.path.join(workdir, 'upstream'), args)
+        server = serve(os.path.join(workdir, 'upstream', 'http'))
+        layerdir = os.path.join(workdir, 'meta-upgrade-status-bench')
+        cache = os.path.join(workdir, 'upstream-check.json')
+        recipes = make_layer(layerdir, repos, server.server_address[1], args, cache)
+        with open(bblayersconf, 'a') as f:
+            f.write('\nBBLAYERS += "%s"\n' % layerdir)
+
+        cold, results = report(recipes)
+        warm, cached_results = report(recipes)
+        print('%d recipes, %d git repositories, %d release directories' % (len(recipes), args.repos, args.hosted))
+        print('%-6s %7.2fs' % ('cold', cold))
+        print('%-6s %7.2fs  %6.2fx' % ('cached', warm, cold / warm))
+
+        wrong = [r for r in results if r[1] != 'UPDATE' or not r[3].startswith('1.%d' % args.releases)]
+        for r in wrong:
+            print('Unexpected status: %s' % (r,))
+        if cached_results != results:
+            print('The cached run reported different results')
+            return 1
+        return 1 if wrong else 0
+    finally:
+        if server:
+            server.shutdown()
+        shutil.copyfile(bblayersconf + '.backup', bblayersconf)
+        os.unlink(bblayersconf + '.backup')
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
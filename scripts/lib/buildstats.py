@@ -4,11 +4,13 @@
 # SPDX-License-Identifier: GPL-2.0-only
 #
 """Functionality for analyzing buildstats"""
+import concurrent.futures
 import json
 import logging
 import os
 import re
-from collections import namedtuple,OrderedDict
+import struct
+from collections import namedtuple,OrderedDict,deque
 from statistics import mean
 
 
@@ -78,36 +80,34 @@ class BSTask(dict):
         else:
             return self['rusage']['ru_oublock']
 
+    # Matches the lines of a task buildstats file that are of interest, the
+    # groups being: key, IO counter, rusage field, child rusage field, value
+    line_re = re.compile(r'^(Started|Ended|Status|IO (\S+)|rusage (\S+)|Child rusage (\S+)):[ \t]*(.*?)[ \t]*$',
+                         re.MULTILINE)
+
     @classmethod
     def from_file(cls, buildstat_file):
         """Read buildstat text file"""
         bs_task = cls()
         log.debug("Reading task buildstats from %s", buildstat_file)
+        start_time = None
         end_time = None
         with open(buildstat_file) as fobj:
-            for line in fobj.readlines():
-                key, val = line.split(':', 1)
-                val = val.strip()
-                if key == 'Started':
-                    start_time = float(val)
-                    bs_task['start_time'] = start_time
-                elif key == 'Ended':
-                    end_time = float(val)
-                elif key.startswith('IO '):
-                    split = key.split()
-                    bs_task['iostat'][split[1]] = int(val)
-                elif key.find('rusage') >= 0:
-                    split = key.split()
-                    ru_key = split[-1]
-                    if ru_key in ('ru_stime', 'ru_utime'):
-                        val = float(val)
-                    else:
-                        val = int(val)
-                    ru_type = 'rusage' if split[0] == 'rusage' else \
-                                                      'child_rusage'
-                    bs_task[ru_type][ru_key] = val
-                elif key == 'Status':
-                    bs_task['status'] = val
+            data = fobj.read()
+        for key, io_key, ru_key, child_key, val in cls.line_re.findall(data):
+            if io_key:
+                bs_task['iostat'][io_key] = int(val)
+            elif ru_key:
+                bs_task['rusage'][ru_key] = float(val) if ru_key in ('ru_stime', 'ru_utime') else int(val)
+            elif child_key:
+                bs_task['child_rusage'][child_key] = float(val) if child_key in ('ru_stime', 'ru_utime') else int(val)
+            elif key == 'Started':
+                start_time = float(val)
+                bs_task['start_time'] = start_time
+            elif key == 'Ended':
+                end_time = float(val)
+            else:
+                bs_task['status'] = val
         if end_time is not None and start_time is not None:
             bs_task['elapsed_time'] = end_time - start_time
         else:
@@ -115,6 +115,14 @@ class BSTask(dict):
         return bs_task
 
 
+def _read_recipe_dir(recipe_dir):
+    """Read the task buildstats files of one recipe directory"""
+    tasks = {}
+    for task in os.listdir(recipe_dir):
+        tasks[task] = BSTask.from_file(os.path.join(recipe_dir, task))
+    return tasks
+
+
 class BSTaskAggregate(object):
     """Class representing multiple runs of the same task"""
     properties = ('cputime', 'walltime', 'read_bytes', 'write_bytes',
@@ -252,6 +260,132 @@ class BuildStats(dict):
 
         return buildstats
 
+    # Cache of a parsed buildstats directory, see from_dir_parallel()
+    cache_file = '.buildstats-cache.json'
+    cache_version = 1
+
+    @staticmethod
+    def _dir_signature(path):
+        """Modification times identifying the content of a buildstats directory
+
+        New task files change the mtime of their recipe directory and the
+        build_stats file is appended to when the build completes.
+        """
+        signature = {'build_stats': os.stat(os.path.join(path, 'build_stats')).st_mtime_ns}
+        recipes = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    recipes[entry.name] = entry.stat().st_mtime_ns
+        signature['recipes'] = recipes
+        return signature
+
+    @classmethod
+    def _from_cache(cls, cache, path):
+        """Rebuild buildstats from the cache of from_dir_parallel()"""
+        layouts = cache['layouts']
+        recipes = {}
+        for dirname, tasks in cache['recipes'].items():
+            recipe_tasks = recipes[dirname] = {}
+            for task, (start, elapsed, status, io, ru, child) in tasks.items():
+                bs_task = BSTask()
+                bs_task['start_time'] = start
+                bs_task['elapsed_time'] = elapsed
+                bs_task['status'] = status
+                bs_task['iostat'] = dict(zip(layouts[io[0]], io[1:]))
+                bs_task['rusage'] = dict(zip(layouts[ru[0]], ru[1:]))
+                bs_task['child_rusage'] = dict(zip(layouts[child[0]], child[1:]))
+                recipe_tasks[task] = bs_task
+        return cls._from_recipe_tasks(recipes)
+
+    @staticmethod
+    def _to_cache(recipes, signature):
+        """Compact serialization of parsed recipe tasks
+
+        The key sets of the iostat and rusage dicts are the same for nearly
+        all tasks so they are stored once and referred to by index.
+        """
+        layouts = []
+        layout_index = {}
+        def pack(values):
+            keys = tuple(values.keys())
+            if keys not in layout_index:
+                layout_index[keys] = len(layouts)
+                layouts.append(keys)
+            return [layout_index[keys]] + list(values.values())
+
+        cache_recipes = {}
+        for dirname, tasks in recipes.items():
+            cache_recipes[dirname] = dict((task, [t['start_time'], t['elapsed_time'], t['status'],
+                                                  pack(t['iostat']), pack(t['rusage']),
+                                                  pack(t['child_rusage'])])
+                                          for task, t in tasks.items())
+        return {'version': BuildStats.cache_version, 'signature': signature,
+                'layouts': layouts, 'recipes': cache_recipes}
+
+    @classmethod
+    def _from_recipe_tasks(cls, recipes):
+        """Create new BuildStats object from the tasks of each recipe directory"""
+        buildstats = cls()
+        for dirname in sorted(recipes):
+            name, epoch, version, revision = cls.split_nevr(dirname)
+            if name in buildstats:
+                raise BSError("Cannot handle multiple versions of the same "
+                              "package ({})".format(name))
+            bsrecipe = BSRecipe(name, epoch, version, revision)
+            bsrecipe.tasks = recipes[dirname]
+            buildstats[name] = bsrecipe
+        return buildstats
+
+    @classmethod
+    def from_dir_parallel(cls, path, jobs=None, use_cache=True):
+        """Load buildstats from a buildstats directory using multiple processes
+
+        Gives the same result as from_dir(). The parsed data is cached in
+        the buildstats directory and reused as long as the modification
+        times of the recipe directories and the build_stats file match.
+        """
+        if not os.path.isfile(os.path.join(path, 'build_stats')):
+            raise BSError("{} does not look like a buildstats directory".format(path))
+
+        signature = cls._dir_signature(path)
+        cache_path = os.path.join(path, cls.cache_file)
+        if use_cache:
+            try:
+                with open(cache_path) as fobj:
+                    cache = json.load(fobj)
+                if cache.get('version') == cls.cache_version and cache.get('signature') == signature:
+                    log.debug("Using cached buildstats %s", cache_path)
+                    return cls._from_cache(cache, path)
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        log.debug("Reading buildstats directory %s", path)
+        dirnames = sorted(signature['recipes'])
+        recipe_dirs = [os.path.join(path, d) for d in dirnames]
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(recipe_dirs) < 2:
+            recipes = dict(zip(dirnames, map(_read_recipe_dir, recipe_dirs)))
+        else:
+            chunksize = max(1, len(recipe_dirs) // (jobs * 4))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                recipes = dict(zip(dirnames, executor.map(_read_recipe_dir, recipe_dirs,
+                                                          chunksize=chunksize)))
+        buildstats = cls._from_recipe_tasks(recipes)
+
+        if use_cache:
+            tmp_path = '{}.{}'.format(cache_path, os.getpid())
+            try:
+                with open(tmp_path, 'w') as fobj:
+                    json.dump(cls._to_cache(recipes, signature), fobj, separators=(',', ':'))
+                os.replace(tmp_path, cache_path)
+            except OSError as err:
+                log.debug("Unable to write buildstats cache %s: %s", cache_path, err)
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+        return buildstats
+
     def aggregate(self, buildstats):
         """Aggregate other buildstats into this"""
         if set(self.keys()) != set(buildstats.keys()):
@@ -310,6 +444,131 @@ def diff_buildstats(bs1, bs2, stat_attr, min_val=None, min_absdiff=None, only_ta
     return tasks_diff
 
 
+# Record formats of the resource_samples.bin file written by the buildstats
+# ResourceSampler (see meta/lib/buildstats.py, which can't be imported
+# without bitbake and has its own copy of them: keep them in sync)
+SAMPLES_MAGIC = b'OEBSSMP1'
+SAMPLES_NAME = struct.Struct('<cIH')
+SAMPLES_SYSTEM = struct.Struct('<cd14q')
+SAMPLES_TASK = struct.Struct('<cdIdqqq')
+
+
+class BSResourceSamples(object):
+    """Time series recorded by the buildstats resource sampler
+
+    Values are stored column wise, system wide samples in the 'system' dict
+    and the samples of each task in the 'tasks' dict, keyed by "PF:task".
+    CPU, I/O and pressure stall values are cumulative, see the methods for
+    rates derived from them.
+    """
+    system_fields = ('time', 'cpu_user', 'cpu_nice', 'cpu_system', 'cpu_idle',
+                     'cpu_iowait', 'cpu_irq', 'cpu_softirq', 'mem_total',
+                     'mem_available', 'psi_cpu_some', 'psi_memory_some',
+                     'psi_memory_full', 'psi_io_some', 'psi_io_full')
+    task_fields = ('time', 'cputime', 'rss', 'read_bytes', 'write_bytes')
+
+    def __init__(self):
+        self.system = OrderedDict((f, []) for f in self.system_fields)
+        self.tasks = {}
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a resource_samples.bin file"""
+        samples = cls()
+        names = {}
+        with open(path, 'rb') as fobj:
+            data = fobj.read()
+        if not data.startswith(SAMPLES_MAGIC):
+            raise BSError("{} is not a buildstats resource samples file".format(path))
+
+        offset = len(SAMPLES_MAGIC)
+        system = list(samples.system.values())
+        sizes = {b'S': SAMPLES_SYSTEM.size, b'T': SAMPLES_TASK.size, b'N': SAMPLES_NAME.size}
+        while offset < len(data):
+            rtype = data[offset:offset + 1]
+            size = sizes.get(rtype)
+            if rtype == b'N' and offset + size <= len(data):
+                size += SAMPLES_NAME.unpack_from(data, offset)[2]
+            if size is None or offset + size > len(data):
+                # Most likely a truncated file from an interrupted build
+                log.warning("Unexpected record in %s at offset %d", path, offset)
+                break
+            if rtype == b'S':
+                values = SAMPLES_SYSTEM.unpack_from(data, offset)
+                for column, value in zip(system, values[1:]):
+                    column.append(value)
+            elif rtype == b'T':
+                values = SAMPLES_TASK.unpack_from(data, offset)
+                columns = samples.tasks[names[values[2]]]
+                columns['time'].append(values[1])
+                for field, value in zip(cls.task_fields[1:], values[3:]):
+                    columns[field].append(value)
+            else:
+                _, taskid, length = SAMPLES_NAME.unpack_from(data, offset)
+                start = offset + SAMPLES_NAME.size
+                name = data[start:start + length].decode('utf-8')
+                names[taskid] = name
+                samples.tasks[name] = OrderedDict((f, []) for f in cls.task_fields)
+            offset += size
+        return samples
+
+    @classmethod
+    def from_dir(cls, path):
+        """Load the resource samples of a buildstats directory"""
+        return cls.from_file(os.path.join(path, 'resource_samples.bin'))
+
+    def cpu_utilization(self):
+        """Fraction of the CPU time spent busy between samples, as a list
+        of (time, user, system, iowait) tuples"""
+        result = []
+        cols = self.system
+        for i in range(1, len(cols['time'])):
+            delta = dict((f, cols[f][i] - cols[f][i - 1]) for f in self.system_fields[1:8])
+            total = sum(delta.values())
+            if total <= 0:
+                continue
+            result.append((cols['time'][i],
+                           (delta['cpu_user'] + delta['cpu_nice']) / total,
+                           (delta['cpu_system'] + delta['cpu_irq'] + delta['cpu_softirq']) / total,
+                           delta['cpu_iowait'] / total))
+        return result
+
+    def memory_used(self):
+        """Memory in use in kB, as a list of (time, used) tuples"""
+        cols = self.system
+        return [(t, total - avail) for t, total, avail in
+                zip(cols['time'], cols['mem_total'], cols['mem_available'])
+                if total >= 0 and avail >= 0]
+
+    def pressure(self, resource, kind='some'):
+        """Fraction of time stalled on resource ('cpu', 'memory' or 'io')
+        between samples, as a list of (time, stall) tuples. Empty if the
+        host doesn't provide pressure stall information."""
+        column = self.system['psi_{}_{}'.format(resource, kind)]
+        times = self.system['time']
+        result = []
+        for i in range(1, len(times)):
+            interval = times[i] - times[i - 1]
+            if column[i] < 0 or column[i - 1] < 0 or interval <= 0:
+                continue
+            result.append((times[i], (column[i] - column[i - 1]) / 1000000.0 / interval))
+        return result
+
+    def task_cpu(self, task):
+        """CPUs used by a task between samples, as a list of (time, cpus)"""
+        cols = self.tasks[task]
+        result = []
+        for i in range(1, len(cols['time'])):
+            interval = cols['time'][i] - cols['time'][i - 1]
+            if interval > 0:
+                result.append((cols['time'][i], max(0.0, cols['cputime'][i] - cols['cputime'][i - 1]) / interval))
+        return result
+
+    def peak_rss(self):
+        """Peak RSS in kB of each task"""
+        return dict((task, max(cols['rss'])) for task, cols in self.tasks.items() if cols['rss'])
+
+
 class BSVerDiff(object):
     """Class representing recipe version differences between two buildstats"""
     def __init__(self, bs1, bs2):
@@ -344,3 +603,216 @@ class BSVerDiff(object):
 
     def __bool__(self):
         return not self.empty_diff
+
+
+class BSTaskGraph(object):
+    """Task dependency graph, as written to task-depends.dot by bitbake -g
+
+    Nodes are named "<recipe>.<task>", deps maps each node to the set of
+    nodes it depends on.
+    """
+    edge_re = re.compile(r'^\s*"([^"]+)"\s*->\s*"([^"]+)"')
+    node_re = re.compile(r'^\s*"([^"]+)"\s*\[')
+
+    def __init__(self):
+        self.deps = {}
+
+    @classmethod
+    def from_dot(cls, path):
+        """Read a task-depends.dot file"""
+        graph = cls()
+        deps = graph.deps
+        edge_match = cls.edge_re.match
+        node_match = cls.node_re.match
+        with open(path) as fobj:
+            for line in fobj:
+                match = edge_match(line)
+                if match:
+                    node, dep = match.groups()
+                    if node in deps:
+                        deps[node].add(dep)
+                    else:
+                        deps[node] = set([dep])
+                    if dep not in deps:
+                        deps[dep] = set()
+                    continue
+                match = node_match(line)
+                if match and match.group(1) not in deps:
+                    deps[match.group(1)] = set()
+        return graph
+
+    @staticmethod
+    def split_node(node):
+        """Split a node name into recipe and task"""
+        return node.rsplit('.', 1)
+
+    def topological_order(self):
+        """Return the nodes ordered so that each comes after its dependencies"""
+        pending = dict((node, len(deps)) for node, deps in self.deps.items())
+        rdeps = dict((node, []) for node in self.deps)
+        for node, deps in self.deps.items():
+            for dep in deps:
+                rdeps[dep].append(node)
+        queue = deque(sorted(node for node, count in pending.items() if count == 0))
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for rdep in rdeps[node]:
+                pending[rdep] -= 1
+                if pending[rdep] == 0:
+                    queue.append(rdep)
+        if len(order) != len(self.deps):
+            raise BSError("Task dependency graph contains a loop")
+        return order
+
+
+CriticalPathTask = namedtuple('CriticalPathTask', 'node start duration slack')
+
+
+class BSCriticalPath(object):
+    """Critical path analysis of a build
+
+    Joins the start and end times of a build's tasks with the task
+    dependency graph. Tasks not present in the buildstats (not needed or
+    not run) take no time; tasks restored from sstate use the times of
+    their setscene variant.
+    """
+    def __init__(self, buildstats, graph):
+        self.graph = graph
+        self.order = graph.topological_order()
+        self.start = {}
+        self.end = {}
+        for recipe, bsrecipe in buildstats.items():
+            for task, bstask in bsrecipe.tasks.items():
+                if isinstance(bstask, BSTaskAggregate):
+                    continue
+                if task.endswith('_setscene'):
+                    node = '{}.{}'.format(recipe, task[:-len('_setscene')])
+                    if task[:-len('_setscene')] in bsrecipe.tasks:
+                        continue
+                else:
+                    node = '{}.{}'.format(recipe, task)
+                if bstask['start_time'] is None or bstask['elapsed_time'] is None:
+                    continue
+                self.start[node] = bstask['start_time']
+                self.end[node] = bstask['start_time'] + bstask['elapsed_time']
+        self.durations = dict((node, self.end[node] - self.start[node])
+                              for node in self.start if node in graph.deps)
+        if not self.durations:
+            raise BSError("No task of the dependency graph found in the buildstats")
+        self.build_start = min(self.start[n] for n in self.durations)
+        self.build_end = max(self.end[n] for n in self.durations)
+        self._analyse()
+
+    @property
+    def wall_time(self):
+        """Actual wall clock time of the build"""
+        return self.build_end - self.build_start
+
+    def _longest_path(self, durations):
+        """Earliest finish of every node given unlimited parallelism"""
+        finish = {}
+        deps = self.graph.deps
+        for node in self.order:
+            earliest = 0.0
+            for dep in deps[node]:
+                if finish[dep] > earliest:
+                    earliest = finish[dep]
+            finish[node] = earliest + durations.get(node, 0.0)
+        return finish
+
+    def _analyse(self):
+        deps = self.graph.deps
+        durations = self.durations
+        self.earliest_finish = finish = self._longest_path(durations)
+        self.length = max(finish.values())
+
+        # Latest finish of every node which doesn't delay the build
+        latest = dict((node, self.length) for node in self.order)
+        for node in reversed(self.order):
+            latest_start = latest[node] - durations.get(node, 0.0)
+            for dep in deps[node]:
+                if latest_start < latest[dep]:
+                    latest[dep] = latest_start
+        self.latest_finish = latest
+
+        # Walk back from the node finishing last through the dependency
+        # finishing last
+        node = max(self.order, key=lambda n: (finish[n], n))
+        path = []
+        while node is not None:
+            path.append(node)
+            node = max(deps[node], key=lambda n: (finish[n], n), default=None)
+        self.path = [n for n in reversed(path) if durations.get(n, 0.0) > 0]
+
+    def slack(self, node):
+        """How much longer a task could take without lengthening the critical path"""
+        return self.latest_finish[node] - self.earliest_finish[node]
+
+    def critical_path(self):
+        """Tasks on the critical path, as a list of CriticalPathTask"""
+        return [CriticalPathTask(n, self.start[n] - self.build_start,
+                                 self.durations[n], self.slack(n))
+                for n in self.path]
+
+    def parallelism(self, buckets=20):
+        """Achieved versus available parallelism over the build
+
+        Returns a list of (start time, running, available) tuples, one per
+        time bucket, where running is the average number of tasks which
+        were executing and available the average number of tasks which
+        could have been, i.e. were running or had all their dependencies
+        completed while waiting to start.
+        """
+        deps = self.graph.deps
+        events = []
+        for node in self.durations:
+            ready = max([self.end[d] for d in deps[node] if d in self.end] + [self.build_start])
+            ready = min(ready, self.start[node])
+            events.append((ready, 0, 1))
+            events.append((self.start[node], 1, 1))
+            events.append((self.end[node], 1, -1))
+            events.append((self.end[node], 0, -1))
+        events.sort()
+
+        width = self.wall_time / buckets if self.wall_time > 0 else 1.0
+        area = [[0.0, 0.0] for _ in range(buckets)]
+        counts = [0, 0]
+        last = self.build_start
+        for when, kind, delta in events:
+            # Spread the time since the previous event over the buckets
+            if when > last and (counts[0] or counts[1]):
+                first = min(int((last - self.build_start) / width), buckets - 1)
+                final = min(int((when - self.build_start) / width), buckets - 1)
+                for index in range(first, final + 1):
+                    lower = max(last, self.build_start + index * width)
+                    upper = when if index == final else self.build_start + (index + 1) * width
+                    if upper > lower:
+                        area[index][0] += counts[1] * (upper - lower)
+                        area[index][1] += counts[0] * (upper - lower)
+            last = when
+            counts[kind] += delta
+        return [(i * width, running / width, available / width)
+                for i, (running, available) in enumerate(area)]
+
+    def speedup_candidates(self, count=10):
+        """Recipes whose speedup would shorten the build the most
+
+        Returns a list of (recipe, time on the critical path, saving) tuples,
+        where saving is how much shorter the critical path would be if all
+        tasks of the recipe took no time.
+        """
+        oncp = {}
+        for node in self.path:
+            recipe = self.graph.split_node(node)[0]
+            oncp[recipe] = oncp.get(recipe, 0.0) + self.durations[node]
+        candidates = sorted(oncp.items(), key=lambda r: r[1], reverse=True)[:count]
+
+        result = []
+        for recipe, cptime in candidates:
+            durations = dict((n, d) for n, d in self.durations.items()
+                             if self.graph.split_node(n)[0] != recipe)
+            length = max(self._longest_path(durations).values())
+            result.append((recipe, cptime, self.length - length))
+        return sorted(result, key=lambda r: r[2], reverse=True)
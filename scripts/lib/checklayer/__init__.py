@@ -5,9 +5,13 @@
 # SPDX-License-Identifier: MIT
 #
 
+import collections
+import contextlib
+import hashlib
 import os
 import re
 import subprocess
+import time
 from enum import Enum
 
 import bb.tinfoil
@@ -234,9 +238,51 @@ def check_command(error_msg, cmd, cwd=None):
         raise RuntimeError(msg)
     return output
 
-def get_signatures(builddir, failsafe=False, machine=None):
-    import re
+# Signatures and dependency graphs only depend on the build configuration,
+# which is the same for several of the tests and layers checked in a run:
+# they are kept here by configuration
+_signatures_cache = {}
+_depgraph_cache = {}
+
+# phase -> [seconds, number of runs]
+_phase_times = collections.OrderedDict()
+
+def _record_phase(phase, seconds):
+    entry = _phase_times.setdefault(phase, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += 1
+
+@contextlib.contextmanager
+def _timed(phase):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        _record_phase(phase, time.monotonic() - start)
+
+def get_phase_times():
+    '''
+    Returns a list of (phase, seconds, number of runs) for the signature
+    generation and comparison phases run so far.
+    '''
+    return [(phase, seconds, count) for phase, (seconds, count) in _phase_times.items()]
 
+def _config_key(builddir, *extra):
+    '''
+    Identifies the configuration of builddir: the content of its
+    conf/*.conf files and the extra values.
+    '''
+    h = hashlib.sha256()
+    confdir = os.path.join(builddir, 'conf')
+    for f in sorted(os.listdir(confdir)):
+        if not f.endswith('.conf'):
+            continue
+        h.update(f.encode('utf-8') + b'\0')
+        with open(os.path.join(confdir, f), 'rb') as conf:
+            h.update(conf.read() + b'\0')
+    return (h.hexdigest(),) + extra
+
+def _parse_signatures(sigs_file):
     # some recipes needs to be excluded like meta-world-pkgdata
     # because a layer can add recipes to a world build so signature
     # will be change
@@ -245,6 +291,44 @@ def get_signatures(builddir, failsafe=False, machine=None):
     sigs = {}
     tune2tasks = {}
 
+    sig_regex = re.compile("^(?P<task>.*:.*):(?P<hash>.*) .$")
+    tune_regex = re.compile("(^|\s)SIGGEN_LOCKEDSIGS_t-(?P<tune>\S*)\s*=\s*")
+    current_tune = None
+    with open(sigs_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            t = tune_regex.search(line)
+            if t:
+                current_tune = t.group('tune')
+            s = sig_regex.match(line)
+            if s:
+                task = s.group('task')
+                if task.split(':')[0] in exclude_recipes:
+                    continue
+
+                sigs[task] = s.group('hash')
+                tune2tasks.setdefault(current_tune, []).append(task)
+
+    if not sigs:
+        raise RuntimeError('Can\'t load signatures from %s' % sigs_file)
+
+    return (sigs, tune2tasks)
+
+def get_signatures(builddir, failsafe=False, machine=None):
+    '''
+    Returns (task -> signature, tune -> [tasks]) for a world build in
+    builddir. The result of a configuration is reused by the later calls
+    for the same configuration instead of running bitbake again.
+    '''
+    key = _config_key(builddir, machine)
+    cached = _signatures_cache.get(key)
+    # A failsafe run which had errors tells nothing of the error a
+    # strict run should report
+    if cached and (failsafe or not cached[2]):
+        sigs, tune2tasks, _ = cached
+        _record_phase('reuse signatures', 0.0)
+        return (dict(sigs), {tune: list(tasks) for tune, tasks in tune2tasks.items()})
+
     cmd = 'BB_ENV_EXTRAWHITE="$BB_ENV_EXTRAWHITE BB_SIGNATURE_HANDLER" BB_SIGNATURE_HANDLER="OEBasicHash" '
     if machine:
         cmd += 'MACHINE=%s ' % machine
@@ -255,52 +339,49 @@ def get_signatures(builddir, failsafe=False, machine=None):
     sigs_file = os.path.join(builddir, 'locked-sigs.inc')
     if os.path.exists(sigs_file):
         os.unlink(sigs_file)
+    failed = False
     try:
-        check_command('Generating signatures failed. This might be due to some parse error and/or general layer incompatibilities.',
-                      cmd, builddir)
+        with _timed('generate signatures'):
+            check_command('Generating signatures failed. This might be due to some parse error and/or general layer incompatibilities.',
+                          cmd, builddir)
     except RuntimeError as ex:
         if failsafe and os.path.exists(sigs_file):
             # Ignore the error here. Most likely some recipes active
             # in a world build lack some dependencies. There is a
             # separate test_machine_world_build which exposes the
             # failure.
-            pass
+            failed = True
         else:
             raise
 
-    sig_regex = re.compile("^(?P<task>.*:.*):(?P<hash>.*) .$")
-    tune_regex = re.compile("(^|\s)SIGGEN_LOCKEDSIGS_t-(?P<tune>\S*)\s*=\s*")
-    current_tune = None
-    with open(sigs_file, 'r') as f:
-        for line in f.readlines():
-            line = line.strip()
-            t = tune_regex.search(line)
-            if t:
-                current_tune = t.group('tune')
-            s = sig_regex.match(line)
-            if s:
-                exclude = False
-                for er in exclude_recipes:
-                    (recipe, task) = s.group('task').split(':')
-                    if er == recipe:
-                        exclude = True
-                        break
-                if exclude:
-                    continue
+    with _timed('parse signatures'):
+        sigs, tune2tasks = _parse_signatures(sigs_file)
+    _signatures_cache[key] = (sigs, tune2tasks, failed)
 
-                sigs[s.group('task')] = s.group('hash')
-                tune2tasks.setdefault(current_tune, []).append(s.group('task'))
-
-    if not sigs:
-        raise RuntimeError('Can\'t load signatures from %s' % sigs_file)
-
-    return (sigs, tune2tasks)
+    return (dict(sigs), {tune: list(tasks) for tune, tasks in tune2tasks.items()})
 
 def get_depgraph(targets=['world'], failsafe=False):
     '''
     Returns the dependency graph for the given target(s).
-    The dependency graph is taken directly from DepTreeEvent.
+    The dependency graph is taken directly from DepTreeEvent and
+    reused by the later calls for the same configuration.
     '''
+    return _get_depgraph_entry(targets, failsafe)[0]
+
+def _get_depgraph_entry(targets, failsafe):
+    # [depgraph, task dependencies index built by _get_task_depends()]
+    builddir = os.environ.get('BUILDDIR', os.getcwd())
+    key = _config_key(builddir, tuple(targets), failsafe)
+    if key in _depgraph_cache:
+        _record_phase('reuse depgraph', 0.0)
+        return _depgraph_cache[key]
+
+    with _timed('depgraph'):
+        depgraph = _get_depgraph(targets, failsafe)
+    _depgraph_cache[key] = [depgraph, None]
+    return _depgraph_cache[key]
+
+def _get_depgraph(targets, failsafe):
     depgraph = None
     with bb.tinfoil.Tinfoil() as tinfoil:
         tinfoil.prepare(config_only=False)
@@ -331,34 +412,41 @@ def get_depgraph(targets=['world'], failsafe=False):
         raise RuntimeError('Could not retrieve the depgraph.')
     return depgraph
 
+def _get_task_depends():
+    '''
+    Returns task -> set of the tasks it depends on for a world build, using
+    the <pn>:<taskname> convention of get_signatures().
+    '''
+    # Beware, depgraph uses task=<pn>.<taskname> whereas get_signatures()
+    # uses <pn>:<taskname>. The output follows the convention from
+    # get_signatures() because that seems closer to normal bitbake output.
+    def graph2sig(task):
+        pn, taskname = task.rsplit('.', 1)
+        return pn + ':' + taskname
+
+    entry = _get_depgraph_entry(['world'], True)
+    if entry[1] is None:
+        with _timed('index depgraph'):
+            entry[1] = {graph2sig(task): frozenset(graph2sig(dep) for dep in deps)
+                        for task, deps in entry[0]['tdepends'].items()}
+    return entry[1]
+
 def compare_signatures(old_sigs, curr_sigs):
     '''
     Compares the result of two get_signatures() calls. Returns None if no
     problems found, otherwise a string that can be used as additional
     explanation in self.fail().
     '''
-    # task -> (old signature, new signature)
-    sig_diff = {}
-    for task in old_sigs:
-        if task in curr_sigs and \
-           old_sigs[task] != curr_sigs[task]:
-            sig_diff[task] = (old_sigs[task], curr_sigs[task])
+    with _timed('compare signatures'):
+        # task -> (old signature, new signature)
+        sig_diff = {task: (old_sigs[task], curr_sigs[task])
+                    for task in old_sigs.keys() & curr_sigs.keys()
+                    if old_sigs[task] != curr_sigs[task]}
 
     if not sig_diff:
         return None
 
-    # Beware, depgraph uses task=<pn>.<taskname> whereas get_signatures()
-    # uses <pn>:<taskname>. Need to convert sometimes. The output follows
-    # the convention from get_signatures() because that seems closer to
-    # normal bitbake output.
-    def sig2graph(task):
-        pn, taskname = task.rsplit(':', 1)
-        return pn + '.' + taskname
-    def graph2sig(task):
-        pn, taskname = task.rsplit('.', 1)
-        return pn + ':' + taskname
-    depgraph = get_depgraph(failsafe=True)
-    depends = depgraph['tdepends']
+    depends = _get_task_depends()
 
     # If a task A has a changed signature, but none of its
     # dependencies, then we need to report it because it is
@@ -368,15 +456,10 @@ def compare_signatures(old_sigs, curr_sigs):
     # its own changes, which will become apparent once the
     # issues that we do report are fixed and the test gets run
     # again.
-    sig_diff_filtered = []
-    for task, (old_sig, new_sig) in sig_diff.items():
-        deps_tainted = False
-        for dep in depends.get(sig2graph(task), ()):
-            if graph2sig(dep) in sig_diff:
-                deps_tainted = True
-                break
-        if not deps_tainted:
-            sig_diff_filtered.append((task, old_sig, new_sig))
+    with _timed('filter signature changes'):
+        sig_diff_filtered = [(task, old_sig, new_sig)
+                             for task, (old_sig, new_sig) in sig_diff.items()
+                             if depends.get(task, frozenset()).isdisjoint(sig_diff)]
 
     msg = []
     msg.append('%d signatures changed, initial differences (first hash before, second after):' %
@@ -388,8 +471,9 @@ def compare_signatures(old_sigs, curr_sigs):
         msg.append('   %s: %s -> %s' % diff)
         msg.append('      %s' % cmd)
         try:
-            output = check_command('Determining signature difference failed.',
-                                   cmd).decode('utf-8')
+            with _timed('diffsigs'):
+                output = check_command('Determining signature difference failed.',
+                                       cmd).decode('utf-8')
         except RuntimeError as error:
             output = str(error)
         if output:
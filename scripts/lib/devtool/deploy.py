@@ -6,8 +6,11 @@
 #
 """Devtool plugin containing the deploy subcommands"""
 
+import hashlib
+import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import tempfile
@@ -22,13 +25,18 @@ logger = logging.getLogger('devtool')
 
 deploylist_path = '/.devtool'
 
-def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=False, nopreserve=False, nocheckspace=False):
+def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=False, nopreserve=False, nocheckspace=False, delta=False, deployid=None):
     """
     Prepare a shell script for running on the target to
     deploy/undeploy files. We have to be careful what we put in this
     script - only commands that are likely to be available on the
     target are suitable (the target might be constrained, e.g. using
     busybox rather than bash with coreutils).
+
+    A delta deployment only receives the changed files, removes the files
+    listed in its fourth argument and installs its fifth argument as the
+    new manifest. deployid is recorded on the target to identify what was
+    deployed.
     """
     lines = []
     lines.append('#!/bin/sh')
@@ -43,9 +51,18 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
             lines.append('echo "Previously deployed files for $1:"')
     lines.append('manifest="%s/$1.list"' % deploylist_path)
     lines.append('preservedir="%s/$1.preserve"' % deploylist_path)
-    lines.append('if [ -f $manifest ] ; then')
+    lines.append('idfile="%s/$1.id"' % deploylist_path)
+    if not dryrun:
+        # Until the deployment completes, what is on the target is unknown
+        lines.append('rm -f $idfile')
+    if delta:
+        # Only the files which are no longer deployed
+        lines.append('removelist=$4')
+    else:
+        lines.append('removelist=$manifest')
+    lines.append('if [ -f $removelist ] ; then')
     # Read manifest in reverse and delete files / remove empty dirs
-    lines.append('    sed \'1!G;h;$!d\' $manifest | while read file')
+    lines.append('    sed \'1!G;h;$!d\' $removelist | while read file')
     lines.append('    do')
     if dryrun:
         lines.append('        if [ ! -d $file ] ; then')
@@ -62,7 +79,7 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
         lines.append('        fi')
     lines.append('    done')
     if not dryrun:
-        lines.append('    rm $manifest')
+        lines.append('    rm $removelist')
     if not deploy and not dryrun:
         # May as well remove all traces
         lines.append('    rmdir `dirname $manifest` > /dev/null 2>&1 || true')
@@ -104,11 +121,20 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
             lines.append('rm $3')
         lines.append('mkdir -p `dirname $manifest`')
         lines.append('mkdir -p $2')
-        if verbose:
-            lines.append('    tar xv -C $2 -f - | tee $manifest')
+        if delta:
+            if verbose:
+                lines.append('    tar xv -C $2 -f -')
+            else:
+                lines.append('    tar x -C $2 -f -')
+            lines.append('mv $5 $manifest')
         else:
-            lines.append('    tar xv -C $2 -f - > $manifest')
-        lines.append('sed -i "s!^./!$2!" $manifest')
+            if verbose:
+                lines.append('    tar xv -C $2 -f - | tee $manifest')
+            else:
+                lines.append('    tar xv -C $2 -f - > $manifest')
+            lines.append('sed -i "s!^./!$2!" $manifest')
+        if deployid:
+            lines.append('echo %s > $idfile' % deployid)
     elif not dryrun:
         # Put any preserved files back
         lines.append('if [ -d $preservedir ] ; then')
@@ -134,6 +160,48 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
     return '\n'.join(lines)
 
 
+def _deploy_state(rd, recipe_outdir):
+    """
+    Get the state of the files to deploy, as a list of
+    (path, type, owner, mode, digest) in the order find lists them
+    (directories before their content). The type, owner and mode are
+    read under pseudo; the digest is the sha256 of the content of a
+    file and the target of a symlink.
+    """
+    with tempfile.NamedTemporaryFile(prefix='devtool-deploy-') as listing:
+        ret = exec_fakeroot(rd, "find . -printf '%%y %%U:%%G %%m %%p\\0%%l\\0' > %s" % listing.name, cwd=recipe_outdir, shell=True)
+        if ret != 0:
+            raise DevtoolError('Failed to list the files to deploy in %s' % recipe_outdir)
+        fields = listing.read().decode('utf-8', errors='surrogateescape').split('\0')
+
+    state = []
+    for entry, linktarget in zip(fields[0::2], fields[1::2]):
+        ftype, owner, mode, path = entry.split(' ', 3)
+        digest = linktarget
+        if ftype == 'f':
+            h = hashlib.sha256()
+            try:
+                with open(os.path.join(recipe_outdir, path), 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        h.update(chunk)
+                digest = h.hexdigest()
+            except OSError:
+                # Always deployed
+                digest = None
+        state.append((path, ftype, owner, mode, digest))
+    return state
+
+def _deploy_cache_file(config, target, port, destdir, recipename):
+    """The file recording what was last deployed for a recipe to a target"""
+    name = re.sub(r'[^\w@.-]', '_', '%s:%s:%s' % (target, port or '', destdir))
+    return os.path.join(config.workspace_path, 'deploy-target', name, '%s.json' % recipename)
+
+def _target_path(destdir, path):
+    """The path on the target of a path listed by _deploy_state()"""
+    if path == '.':
+        return destdir
+    return os.path.join(destdir, path[2:])
+
 
 def deploy(args, config, basepath, workspace):
     """Entry point for the devtool 'deploy' subcommand"""
@@ -215,6 +283,36 @@ def deploy(args, config, basepath, workspace):
         if args.key:
             extraoptions += ' -i %s' % args.key
 
+        # Only send what changed since the last deployment to this target,
+        # which is identified by the id it recorded on the target
+        state = _deploy_state(rd, recipe_outdir)
+        deployid = hashlib.sha256(json.dumps([destdir, state]).encode('utf-8')).hexdigest()
+        cachefile = _deploy_cache_file(config, args.target, args.port, destdir, args.recipename)
+        previous = None
+        if not args.full and os.path.exists(cachefile):
+            with open(cachefile) as f:
+                cached = json.load(f)
+            cmd = '%s %s %s %s \'cat %s/%s.id 2>/dev/null || true\'' % (ssh_sshexec, ssh_port, extraoptions, args.target, deploylist_path, args.recipename)
+            remoteid = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+            if remoteid == cached['id']:
+                previous = dict((entry[0], tuple(entry[1:])) for entry in cached['state'])
+            else:
+                logger.info('Files deployed on %s differ from the last deployment, deploying all the files' % args.target)
+
+        changed = []
+        removed = []
+        if previous is not None:
+            current = dict((entry[0], tuple(entry[1:])) for entry in state)
+            changed = [entry for entry in state if previous.get(entry[0]) != entry[1:]]
+            removed = [path for path, entry in previous.items() if path not in current]
+            if any(path in previous and previous[path][0] != ftype for path, ftype, _, _, _ in changed):
+                # A file replaced by a directory or the reverse
+                previous = None
+            elif not changed and not removed:
+                logger.info('%s is already deployed on %s' % (args.recipename, args.target))
+                return 0
+        delta = previous is not None
+
         # In order to delete previously deployed files and have the manifest file on
         # the target, we write out a shell script and then copy it to the target
         # so we can then run it (piping tar output to it).
@@ -223,18 +321,40 @@ def deploy(args, config, basepath, workspace):
         try:
             tmpscript = '/tmp/devtool_deploy.sh'
             tmpfilelist = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.list')
+            tmpremovelist = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.remove')
+            tmpmanifest = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.manifest')
             shellscript = _prepare_remote_script(deploy=True,
                                                 verbose=args.show_status,
                                                 nopreserve=args.no_preserve,
-                                                nocheckspace=args.no_check_space)
+                                                nocheckspace=args.no_check_space,
+                                                delta=delta,
+                                                deployid=deployid)
             # Write out the script to a file
             with open(os.path.join(tmpdir, os.path.basename(tmpscript)), 'w') as f:
                 f.write(shellscript)
-            # Write out the file list
+            # Write out the file list, that of the new files for a delta
+            # deployment, with the total size of the files sent
+            if delta:
+                filelist = []
+                ftotalsize = 0
+                for path, ftype, _, _, _ in changed:
+                    if ftype != 'd':
+                        fsize = int(math.ceil(float(os.lstat(os.path.join(recipe_outdir, path)).st_size)/1024))
+                        ftotalsize += fsize
+                        # Only the new files may replace existing ones to preserve
+                        if path not in previous:
+                            filelist.append((_target_path(destdir, path), fsize))
             with open(os.path.join(tmpdir, os.path.basename(tmpfilelist)), 'w') as f:
                 f.write('%d\n' % ftotalsize)
                 for fpath, fsize in filelist:
                     f.write('%s %d\n' % (fpath, fsize))
+            if delta:
+                with open(os.path.join(tmpdir, os.path.basename(tmpremovelist)), 'w') as f:
+                    for path in removed:
+                        f.write('%s\n' % _target_path(destdir, path))
+                with open(os.path.join(tmpdir, os.path.basename(tmpmanifest)), 'w') as f:
+                    for entry in state:
+                        f.write('%s\n' % _target_path(destdir, entry[0]))
             # Copy them to the target
             ret = subprocess.call("scp %s %s %s %s/* %s:%s" % (scp_sshexec, scp_port, extraoptions, tmpdir, args.target, os.path.dirname(tmpscript)), shell=True)
             if ret != 0:
@@ -244,11 +364,24 @@ def deploy(args, config, basepath, workspace):
             shutil.rmtree(tmpdir)
 
         # Now run the script
-        ret = exec_fakeroot(rd, 'tar cf - . | %s  %s %s %s \'sh %s %s %s %s\'' % (ssh_sshexec, ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist), cwd=recipe_outdir, shell=True)
+        if delta:
+            logger.info('Deploying %d new or changed entries, removing %d' % (len(changed), len(removed)))
+            with tempfile.NamedTemporaryFile('wb', prefix='devtool-deploy-') as tarlist:
+                tarlist.write(b''.join(entry[0].encode('utf-8', errors='surrogateescape') + b'\0' for entry in changed))
+                tarlist.flush()
+                ret = exec_fakeroot(rd, 'tar cf - --no-recursion --null -T %s | %s  %s %s %s \'sh %s %s %s %s %s %s\'' % (tarlist.name, ssh_sshexec, ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist, tmpremovelist, tmpmanifest), cwd=recipe_outdir, shell=True)
+        else:
+            ret = exec_fakeroot(rd, 'tar cf - . | %s  %s %s %s \'sh %s %s %s %s\'' % (ssh_sshexec, ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist), cwd=recipe_outdir, shell=True)
         if ret != 0:
+            if os.path.exists(cachefile):
+                os.remove(cachefile)
             raise DevtoolError('Deploy failed - rerun with -s to get a complete '
                             'error message')
 
+        bb.utils.mkdirhier(os.path.dirname(cachefile))
+        with open(cachefile, 'w') as f:
+            json.dump({'id': deployid, 'state': state}, f)
+
         logger.info('Successfully deployed %s' % recipe_outdir)
 
         files_list = []
@@ -327,6 +460,7 @@ def register_commands(subparsers, context):
     parser_deploy.add_argument('-n', '--dry-run', help='List files to be deployed only', action='store_true')
     parser_deploy.add_argument('-p', '--no-preserve', help='Do not preserve existing files', action='store_true')
     parser_deploy.add_argument('--no-check-space', help='Do not check for available space before deploying', action='store_true')
+    parser_deploy.add_argument('--full', help='Deploy all the files rather than those changed since the last deployment to the target', action='store_true')
     parser_deploy.add_argument('-e', '--ssh-exec', help='Executable to use in place of ssh')
     parser_deploy.add_argument('-P', '--port', help='Specify port to use for connection to the target')
     parser_deploy.add_argument('-I', '--key',
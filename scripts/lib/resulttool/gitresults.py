@@ -0,0 +1,307 @@
+# resulttool - streaming load of test results archived in git
+#
+# Copyright (c) 2019, Intel Corporation.
+# Copyright (c) 2019, Linux Foundation
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import codecs
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+# Body of a JSON string, stopping at its closing quote or at the end of the
+# buffer
+string_body_re = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+string_re = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# Anything in a JSON value other than strings and brackets
+plain_re = re.compile(r'[^"{}\[\]]+')
+whitespace_re = re.compile(r'[ \t\n\r]*')
+
+class SummaryParser(object):
+    """Incremental parser of a testresults.json document skipping the logs
+
+    The document is read from fileobj in chunks, at most size bytes. The
+    ptestresult.rawlogs entries and the logs of the '.sections' entries
+    (ptest and ltp sections) are skipped without being decoded or kept in
+    memory, so that the memory used is bounded by the size of the results
+    without those logs.
+    """
+    chunksize = 256 * 1024
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+
+    def _fill(self, size=0):
+        """Read more data, False at the end of the document"""
+        if self.pos > self.chunksize:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        while self.remaining:
+            data = self.fileobj.read(min(max(size, self.chunksize), self.remaining))
+            if not data:
+                raise ValueError("Unexpected end of test results data")
+            self.remaining -= len(data)
+            text = self.decoder.decode(data, final=not self.remaining)
+            if text:
+                self.buf += text
+                return True
+        return False
+
+    def _peek(self):
+        """Next character which is not whitespace"""
+        while True:
+            self.pos = whitespace_re.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of test results data")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError("Expected '%s' in test results data" % char)
+        self.pos += 1
+
+    def _key(self):
+        self._peek()
+        while True:
+            m = string_re.match(self.buf, self.pos)
+            if m:
+                self.pos = m.end()
+                return json.loads(m.group(0))
+            if not self._fill():
+                raise ValueError("Invalid key in test results data")
+
+    def _decode(self):
+        """Decode the next value, reading as much as it needs"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+                # A number may continue in the next chunk
+                if end < len(self.buf) or not self.remaining:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self.remaining:
+                    raise
+            self._fill(len(self.buf) - self.pos)
+
+    def _skip_string(self):
+        self.pos += 1
+        while True:
+            self.pos = string_body_re.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            # End of the buffer, possibly before the backslash of an escape
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+            if not self._fill():
+                raise ValueError("Unterminated string in test results data")
+
+    def _skip(self):
+        """Skip the next value"""
+        char = self._peek()
+        if char == '"':
+            self._skip_string()
+            return
+        if char not in '{[':
+            # Number or literal
+            self._decode()
+            return
+        depth = 0
+        while True:
+            char = self._peek()
+            if char == '"':
+                self._skip_string()
+            elif char in '{[':
+                depth += 1
+                self.pos += 1
+            elif char in '}]':
+                depth -= 1
+                self.pos += 1
+                if not depth:
+                    return
+            else:
+                self.pos = plain_re.match(self.buf, self.pos).end()
+
+    @staticmethod
+    def _action(path):
+        """How to parse the value at path: 'object' to parse the members
+        of an object one by one, 'skip' or 'decode'"""
+        depth = len(path)
+        if depth <= 1 or (depth == 2 and path[1] == 'result'):
+            return 'object'
+        if depth == 3 and path[1] == 'result':
+            if path[2] == 'ptestresult.rawlogs':
+                return 'skip'
+            if path[2].endswith('.sections'):
+                return 'object'
+        elif depth == 4 and path[2].endswith('.sections'):
+            return 'object'
+        elif depth == 5 and path[4] == 'log':
+            return 'skip'
+        return 'decode'
+
+    def _object(self, path):
+        self._expect('{')
+        obj = {}
+        if self._peek() == '}':
+            self.pos += 1
+            return obj
+        while True:
+            key = self._key()
+            self._expect(':')
+            keypath = path + (key,)
+            action = self._action(keypath)
+            if action == 'skip':
+                self._skip()
+            elif action == 'object' and self._peek() == '{':
+                obj[key] = self._object(keypath)
+            else:
+                obj[key] = self._decode()
+            char = self._peek()
+            self.pos += 1
+            if char == '}':
+                return obj
+            if char != ',':
+                raise ValueError("Expected ',' or '}' in test results data")
+
+    def parse(self):
+        """Parse the document and read it to its end"""
+        data = self._object(())
+        while self.remaining:
+            self.fileobj.read(min(self.chunksize, self.remaining))
+            self.remaining -= min(self.chunksize, self.remaining)
+        return data
+
+class GitResultsLoader(object):
+    """Load testresults.json files of a git repository
+
+    All the blobs are read by a single 'git cat-file --batch' process. Unless
+    the logs are wanted, they are parsed by SummaryParser and the parsed
+    summaries are cached by blob SHA, in memory and in the git directory,
+    so that loading the same results again (e.g. when comparing many tags)
+    doesn't read the blobs.
+    """
+    version = 1
+
+    def __init__(self, repo, cache=True):
+        self.repo = repo
+        self.cachedir = None
+        if cache:
+            self.cachedir = os.path.join(repo.git_dir, 'resulttool', 'summaries-%d' % self.version)
+        self.summaries = {}
+
+    def list_files(self, tags):
+        """(tag, path, blob SHA) of the testresults.json files of tags"""
+        files = []
+        for tag in tags:
+            for line in self.repo.run_cmd(['ls-tree', '-r', tag]).splitlines():
+                info, path = line.split('\t', 1)
+                mode, objtype, sha = info.split()
+                if objtype == 'blob' and path.endswith('testresults.json'):
+                    files.append((tag, path, sha))
+        return files
+
+    def _cachefile(self, sha):
+        return os.path.join(self.cachedir, sha[:2], sha[2:] + '.json')
+
+    def _cached(self, sha):
+        if sha in self.summaries:
+            return self.summaries[sha]
+        if not self.cachedir:
+            return None
+        try:
+            with open(self._cachefile(sha)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.summaries[sha] = data
+        return data
+
+    def _store(self, sha, data):
+        self.summaries[sha] = data
+        if not self.cachedir:
+            return
+        cachefile = self._cachefile(sha)
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(cachefile), delete=False) as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(f.name, cachefile)
+
+    def read_blobs(self, shas, logs=False):
+        """Parse the blobs, yielding (sha, data)"""
+        proc = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.repo.top_dir,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def write_requests():
+            try:
+                with proc.stdin:
+                    for sha in shas:
+                        proc.stdin.write(sha.encode() + b'\n')
+            except BrokenPipeError:
+                # git was killed before it read all the requests
+                pass
+
+        writer = threading.Thread(target=write_requests)
+        writer.start()
+        completed = False
+        try:
+            for sha in shas:
+                header = proc.stdout.readline().split()
+                if len(header) != 3 or header[1] != b'blob':
+                    raise ValueError("Unable to read %s from git: %s" % (sha, b' '.join(header).decode()))
+                size = int(header[2])
+                if logs:
+                    data = json.loads(proc.stdout.read(size))
+                else:
+                    data = SummaryParser(proc.stdout, size).parse()
+                proc.stdout.read(1)
+                yield sha, data
+            completed = True
+        finally:
+            if not completed:
+                # git may be blocked writing the blobs not read and the
+                # writer blocked writing the requests git doesn't read
+                proc.kill()
+            proc.stdout.close()
+            writer.join()
+            proc.wait()
+
+    def load(self, tags, logs=False):
+        """(path, data) of the testresults.json files of tags, without the
+        ptest logs unless logs is True"""
+        files = self.list_files(tags)
+        data = {}
+        if not logs:
+            for tag, path, sha in files:
+                cached = self._cached(sha)
+                if cached is not None:
+                    data[sha] = cached
+        missing = list(dict.fromkeys(sha for tag, path, sha in files if sha not in data))
+        for sha, blobdata in self.read_blobs(missing, logs):
+            if not logs:
+                self._store(sha, blobdata)
+            data[sha] = blobdata
+        return [(path, copy_configurations(data[sha])) for tag, path, sha in files]
+
+def copy_configurations(data):
+    """Copy of the test runs of data with their own configuration dicts,
+    which are modified when the results are loaded"""
+    newdata = {}
+    for name, run in data.items():
+        newdata[name] = dict(run)
+        if isinstance(run.get('configuration'), dict):
+            newdata[name]['configuration'] = dict(run['configuration'])
+    return newdata
@@ -7,15 +7,23 @@
 #
 
 import resulttool.resultutils as resultutils
+import resulttool.resultsdb as resultsdb
 import json
 
 from oeqa.utils.git import GitRepo
 import oeqa.utils.gitarchive as gitarchive
 
 def compare_result(logger, base_name, target_name, base_result, target_result):
-    base_result = base_result.get('result')
-    target_result = target_result.get('result')
-    result = {}
+    if isinstance(base_result, resultsdb.TestRun) and isinstance(target_result, resultsdb.TestRun):
+        # Indexed query, the results of the test runs are not loaded
+        result, nostatus = base_result.compare(target_result)
+        for k in nostatus:
+            logger.error('Failed to retrieved base test case status: %s' % k)
+        base_result = target_result = None
+    else:
+        base_result = base_result.get('result')
+        target_result = target_result.get('result')
+        result = {}
     if base_result and target_result:
         for k in base_result:
             base_testcase = base_result[k]
@@ -35,12 +43,12 @@ def compare_result(logger, base_name, target_name, base_result, target_result):
         resultstring = "Match: %s\n       %s" % (base_name, target_name)
     return result, resultstring
 
-def get_results(logger, source):
-    return resultutils.load_resultsdata(source, configmap=resultutils.regression_map)
+def get_results(logger, source, use_cache=True):
+    return resultsdb.open_db(source, use_cache).testruns(resultutils.regression_map)
 
 def regression(args, logger):
-    base_results = get_results(logger, args.base_result)
-    target_results = get_results(logger, args.target_result)
+    base_results = get_results(logger, args.base_result, not args.no_cache)
+    target_results = get_results(logger, args.target_result, not args.no_cache)
 
     regression_common(args, logger, base_results, target_results)
 
@@ -140,8 +148,8 @@ def regression_git(args, logger):
 
     logger.info("Comparing:\n%s\nto\n%s\n" % (revs[index1], revs[index2]))
 
-    base_results = resultutils.git_get_result(repo, revs[index1][2])
-    target_results = resultutils.git_get_result(repo, revs[index2][2])
+    base_results = resultutils.git_get_result(repo, revs[index1][2], logs=False)
+    target_results = resultutils.git_get_result(repo, revs[index2][2], logs=False)
 
     regression_common(args, logger, base_results, target_results)
 
@@ -162,6 +170,8 @@ def register_commands(subparsers):
                               help='(optional) filter the base results to this result ID')
     parser_build.add_argument('-t', '--target-result-id', default='',
                               help='(optional) filter the target results to this result ID')
+    parser_build.add_argument('--no-cache', action='store_true',
+                              help='do not use or update the index of the results cached in the result directories')
 
     parser_build = subparsers.add_parser('regression-git', help='regression git analysis',
                                          description='regression analysis comparing base result set to target '
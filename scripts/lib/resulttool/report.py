@@ -10,6 +10,7 @@ import os
 import glob
 import json
 import resulttool.resultutils as resultutils
+import resulttool.resultsdb as resultsdb
 from oeqa.utils.git import GitRepo
 import oeqa.utils.gitarchive as gitarchive
 
@@ -212,7 +213,7 @@ class ResultsTextReport(object):
                                  maxlen=maxlen)
         print(output)
 
-    def view_test_report(self, logger, source_dir, branch, commit, tag, use_regression_map, raw_test):
+    def view_test_report(self, logger, source_dir, branch, commit, tag, use_regression_map, raw_test, use_cache=True):
         test_count_reports = []
         configmap = resultutils.store_map
         if use_regression_map:
@@ -224,12 +225,16 @@ class ResultsTextReport(object):
             repo = GitRepo(source_dir)
             revs = gitarchive.get_test_revs(logger, repo, tag_name, branch=branch)
             rev_index = gitarchive.rev_find(revs, 'commit', commit)
-            testresults = resultutils.git_get_result(repo, revs[rev_index][2], configmap=configmap)
+            testresults = resultutils.git_get_result(repo, revs[rev_index][2], configmap=configmap, logs=bool(raw_test))
         elif tag:
             repo = GitRepo(source_dir)
-            testresults = resultutils.git_get_result(repo, [tag], configmap=configmap)
-        else:
+            testresults = resultutils.git_get_result(repo, [tag], configmap=configmap, logs=bool(raw_test))
+        elif raw_test:
             testresults = resultutils.load_resultsdata(source_dir, configmap=configmap)
+        else:
+            # The logs are not needed, only load the results of each test
+            # run from the index when it is reported
+            testresults = resultsdb.open_db(source_dir, use_cache).testruns(configmap)
         if raw_test:
             raw_results = {}
             for testsuite in testresults:
@@ -245,6 +250,8 @@ class ResultsTextReport(object):
             for resultid in testresults[testsuite]:
                 skip = False
                 result = testresults[testsuite][resultid]
+                if isinstance(result, resultsdb.TestRun):
+                    result = result.data()
                 machine = result['configuration']['MACHINE']
 
                 # Check to see if there is already results for these kinds of tests for the machine
@@ -268,7 +275,7 @@ class ResultsTextReport(object):
 def report(args, logger):
     report = ResultsTextReport()
     report.view_test_report(logger, args.source_dir, args.branch, args.commit, args.tag, args.use_regression_map,
-                            args.raw_test_only)
+                            args.raw_test_only, not args.no_cache)
     return 0
 
 def register_commands(subparsers):
@@ -287,4 +294,6 @@ def register_commands(subparsers):
                               help='instead of the default "store_map", use the "regression_map" for report')
     parser_build.add_argument('-r', '--raw_test_only', default='',
                               help='output raw test result only for the user provided test result id')
+    parser_build.add_argument('--no-cache', action='store_true',
+                              help='do not use or update the index of the results cached in the source directory')
 
@@ -0,0 +1,229 @@
+# resulttool - indexed store of test results
+#
+# Copyright (c) 2019, Intel Corporation.
+# Copyright (c) 2019, Linux Foundation
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import json
+import os
+import sqlite3
+import resulttool.resultutils as resultutils
+
+class TestRun(object):
+    """A test run of a ResultsDB, its results and logs are loaded on demand"""
+    def __init__(self, db, runid, name, configuration):
+        self.db = db
+        self.id = runid
+        self.name = name
+        self.configuration = configuration
+
+    def result(self):
+        return self.db.result(self.id)
+
+    def data(self):
+        """The test run as loaded by resultutils, without the logs"""
+        return {'configuration': self.configuration, 'result': self.result()}
+
+    def statuses(self):
+        return self.db.statuses(self.id)
+
+    def compare(self, other):
+        if other.db is self.db:
+            return self.db.compare(self.id, other.id)
+        return self.db.compare(self.id, other.statuses())
+
+    def log(self, test, section=None):
+        return self.db.log(self.id, test, section)
+
+class ResultsDB(object):
+    """sqlite store of test results
+
+    Each test case is a row indexed by test run and name, so that comparing
+    or summarising test runs are queries which do not load anything else.
+    Logs (ptestresult.rawlogs, the logs of the ptest and ltp sections and
+    any other 'log' entry) are kept in a separate table and only read by
+    log().
+
+    load() imports the testresults.json files of a directory, only reading
+    again those which changed since the previous load when the database is
+    a file.
+    """
+    version = 1
+    cache_file = '.resulttool-results.sqlite'
+
+    def __init__(self, path=':memory:', configvars=resultutils.extra_configvars):
+        self.path = path
+        self.configvars = configvars
+        self.conn = sqlite3.connect(path)
+        self._create()
+
+    def _create(self):
+        signature = json.dumps([self.version, self.configvars], sort_keys=True)
+        c = self.conn
+        c.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = c.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        if row and row[0] != signature:
+            for table in ('files', 'runs', 'results', 'logs'):
+                c.execute('DROP TABLE IF EXISTS %s' % table)
+        c.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+        c.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)')
+        c.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, file TEXT, name TEXT, configuration TEXT)')
+        c.execute('CREATE INDEX IF NOT EXISTS runs_file ON runs (file)')
+        c.execute('CREATE TABLE IF NOT EXISTS results (run INTEGER, test TEXT, status TEXT, extra TEXT, '
+                  'PRIMARY KEY (run, test)) WITHOUT ROWID')
+        c.execute('CREATE TABLE IF NOT EXISTS logs (run INTEGER, test TEXT, section TEXT, data TEXT, '
+                  'PRIMARY KEY (run, test, section)) WITHOUT ROWID')
+        c.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _remove_file(self, path):
+        c = self.conn
+        runs = [(r[0],) for r in c.execute('SELECT id FROM runs WHERE file = ?', (path,))]
+        c.executemany('DELETE FROM results WHERE run = ?', runs)
+        c.executemany('DELETE FROM logs WHERE run = ?', runs)
+        c.execute('DELETE FROM runs WHERE file = ?', (path,))
+        c.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def import_data(self, data, source=''):
+        """Import a test results dict, as found in testresults.json"""
+        data = dict(data)
+        results = {}
+        resultutils.append_resultsdata(results, data, configvars=self.configvars,
+                                       testseries=os.path.basename(os.path.dirname(source)))
+        c = self.conn
+        for runs in results.values():
+            for name, run in runs.items():
+                cur = c.execute('INSERT INTO runs (file, name, configuration) VALUES (?, ?, ?)',
+                                (source, name, json.dumps(run['configuration'])))
+                runid = cur.lastrowid
+                rows = []
+                logs = []
+                for test, value in run['result'].items():
+                    if not isinstance(value, dict):
+                        rows.append((runid, test, None, json.dumps(value)))
+                        continue
+                    value = dict(value)
+                    status = value.pop('status', None)
+                    if 'log' in value:
+                        logs.append((runid, test, '', json.dumps(value.pop('log'))))
+                    if test.endswith('.sections'):
+                        sections = {}
+                        for section, sectiondata in value.items():
+                            if isinstance(sectiondata, dict) and 'log' in sectiondata:
+                                sectiondata = dict(sectiondata)
+                                logs.append((runid, test, section, json.dumps(sectiondata.pop('log'))))
+                            sections[section] = sectiondata
+                        value = sections
+                    rows.append((runid, test, status, json.dumps(value) if value else None))
+                c.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', rows)
+                c.executemany('INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?)', logs)
+
+    def import_file(self, path):
+        if resultutils.is_url(path):
+            self.import_data(resultutils.load_json(path), path)
+            return
+        st = os.stat(path)
+        row = self.conn.execute('SELECT size, mtime_ns FROM files WHERE path = ?', (path,)).fetchone()
+        if row == (st.st_size, st.st_mtime_ns):
+            return
+        self._remove_file(path)
+        self.import_data(resultutils.load_json(path), path)
+        self.conn.execute('INSERT INTO files VALUES (?, ?, ?)', (path, st.st_size, st.st_mtime_ns))
+
+    def load(self, source):
+        """Import the results of a file, URL or directory"""
+        source = source if resultutils.is_url(source) else os.path.abspath(source)
+        if resultutils.is_url(source) or os.path.isfile(source):
+            files = [source]
+        else:
+            files = []
+            for root, dirs, names in os.walk(source):
+                files.extend(os.path.join(root, name) for name in names if name == "testresults.json")
+        known = set(r[0] for r in self.conn.execute('SELECT path FROM files'))
+        for path in known - set(files):
+            self._remove_file(path)
+        for path in files:
+            self.import_file(path)
+        self.conn.commit()
+        return self
+
+    def testruns(self, configmap=resultutils.store_map):
+        """The test runs grouped as resultutils.load_resultsdata() does,
+        {testpath: {run name: TestRun}}"""
+        results = {}
+        for runid, name, configuration in self.conn.execute('SELECT id, name, configuration FROM runs ORDER BY id'):
+            configuration = json.loads(configuration)
+            testpath = resultutils.get_testpath(configuration, configmap)
+            results.setdefault(testpath, {})[name] = TestRun(self, runid, name, configuration)
+        return results
+
+    def result(self, runid):
+        """The 'result' section of a test run, without the logs"""
+        result = {}
+        for test, status, extra in self.conn.execute('SELECT test, status, extra FROM results WHERE run = ?', (runid,)):
+            value = json.loads(extra) if extra else {}
+            if not isinstance(value, dict):
+                result[test] = value
+                continue
+            if status is not None:
+                value['status'] = status
+            result[test] = value
+        return result
+
+    def log(self, runid, test, section=None):
+        """The decoded log of a test, or of a section of a '.sections' entry"""
+        row = self.conn.execute('SELECT data FROM logs WHERE run = ? AND test = ? AND section = ?',
+                                (runid, test, section or '')).fetchone()
+        if not row:
+            return None
+        return resultutils.decode_log(json.loads(row[0]))
+
+    def statuses(self, runid):
+        """{test: status} of a test run"""
+        return dict(self.conn.execute('SELECT test, status FROM results WHERE run = ?', (runid,)))
+
+    def compare(self, base, target):
+        """The test cases of base whose status differs in target,
+        {test: {'base': status, 'target': status}}, and the test cases of base
+        without a status
+
+        target is the id of another test run of this database, or the
+        statuses of a test run of another one.
+        """
+        changed = {}
+        if isinstance(target, dict):
+            for test, base_status in self.conn.execute(
+                    'SELECT test, status FROM results WHERE run = ? AND status IS NOT NULL', (base,)):
+                if target.get(test) != base_status:
+                    changed[test] = {'base': base_status, 'target': target.get(test)}
+        else:
+            for test, base_status, target_status in self.conn.execute(
+                    'SELECT b.test, b.status, t.status FROM results b '
+                    'LEFT JOIN results t ON t.run = ? AND t.test = b.test '
+                    'WHERE b.run = ? AND b.status IS NOT NULL AND t.status IS NOT b.status',
+                    (target, base)):
+                changed[test] = {'base': base_status, 'target': target_status}
+        nostatus = [r[0] for r in self.conn.execute(
+                    'SELECT test FROM results WHERE run = ? AND status IS NULL', (base,))]
+        return changed, nostatus
+
+def open_db(source, use_cache=True):
+    """ResultsDB loaded with the results of source
+
+    The database of a directory is cached in it when it is writable.
+    """
+    path = ':memory:'
+    if use_cache and not resultutils.is_url(source) and os.path.isdir(source) and os.access(source, os.W_OK):
+        path = os.path.join(source, ResultsDB.cache_file)
+    try:
+        return ResultsDB(path).load(source)
+    except sqlite3.DatabaseError:
+        if path == ':memory:':
+            raise
+        # Corrupt cache
+        os.unlink(path)
+        return ResultsDB(path).load(source)
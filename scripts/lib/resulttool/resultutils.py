@@ -11,7 +11,6 @@ import base64
 import zlib
 import json
 import scriptpath
-import copy
 import urllib.request
 import posixpath
 scriptpath.add_oe_lib_path()
@@ -46,19 +45,35 @@ def is_url(p):
 
 extra_configvars = {'TESTSERIES': ''}
 
+def load_json(f):
+    """
+    Load a json file or URL
+    """
+    if is_url(f):
+        with urllib.request.urlopen(f) as response:
+            return json.loads(response.read().decode('utf-8'))
+    with open(f, "r") as filedata:
+        return json.load(filedata)
+
+def get_testpath(configuration, configmap=store_map):
+    """
+    The path of the test results with this configuration, e.g. runtime/poky/qemux86/core-image-sato
+    """
+    testtype = configuration.get("TEST_TYPE")
+    if testtype not in configmap:
+        raise ValueError("Unknown test type %s" % testtype)
+    return "/".join(configuration.get(i) for i in configmap[testtype])
+
 #
 # Load the json file and append the results data into the provided results dict
 #
-def append_resultsdata(results, f, configmap=store_map, configvars=extra_configvars):
+def append_resultsdata(results, f, configmap=store_map, configvars=extra_configvars, testseries=None):
     if type(f) is str:
+        data = load_json(f)
         if is_url(f):
-            with urllib.request.urlopen(f) as response:
-                data = json.loads(response.read().decode('utf-8'))
             url = urllib.parse.urlparse(f)
             testseries = posixpath.basename(posixpath.dirname(url.path))
         else:
-            with open(f, "r") as filedata:
-                data = json.load(filedata)
             testseries = os.path.basename(os.path.dirname(f))
     else:
         data = f
@@ -71,10 +86,7 @@ def append_resultsdata(results, f, configmap=store_map, configvars=extra_configv
                 continue
             if config not in data[res]["configuration"]:
                 data[res]["configuration"][config] = configvars[config]
-        testtype = data[res]["configuration"].get("TEST_TYPE")
-        if testtype not in configmap:
-            raise ValueError("Unknown test type %s" % testtype)
-        testpath = "/".join(data[res]["configuration"].get(i) for i in configmap[testtype])
+        testpath = get_testpath(data[res]["configuration"], configmap)
         if testpath not in results:
             results[testpath] = {}
         results[testpath][res] = data[res]
@@ -99,24 +111,31 @@ def filter_resultsdata(results, resultid):
     newresults = {}
     for r in results:
         for i in results[r]:
-            if i == resultsid:
+            if i == resultid:
                  newresults[r] = {}
                  newresults[r][i] = results[r][i]
     return newresults
 
 def strip_ptestresults(results):
-    newresults = copy.deepcopy(results)
-    #for a in newresults2:
-    #  newresults = newresults2[a]
+    # Only copy the dicts which change rather than deep copying the
+    # results, which can be large with the logs
+    newresults = dict(results)
     for res in newresults:
         if 'result' not in newresults[res]:
             continue
-        if 'ptestresult.rawlogs' in newresults[res]['result']:
-            del newresults[res]['result']['ptestresult.rawlogs']
-        if 'ptestresult.sections' in newresults[res]['result']:
-            for i in newresults[res]['result']['ptestresult.sections']:
-                if 'log' in newresults[res]['result']['ptestresult.sections'][i]:
-                    del newresults[res]['result']['ptestresult.sections'][i]['log']
+        result = newresults[res]['result']
+        if 'ptestresult.rawlogs' not in result and 'ptestresult.sections' not in result:
+            continue
+        newresults[res] = dict(newresults[res])
+        result = newresults[res]['result'] = dict(result)
+        if 'ptestresult.rawlogs' in result:
+            del result['ptestresult.rawlogs']
+        if 'ptestresult.sections' in result:
+            sections = result['ptestresult.sections'] = dict(result['ptestresult.sections'])
+            for i in sections:
+                if 'log' in sections[i]:
+                    sections[i] = dict(sections[i])
+                    del sections[i]['log']
     return newresults
 
 def decode_log(logdata):
@@ -177,30 +196,17 @@ def save_resultsdata(results, destdir, fn="testresults.json", ptestjson=False, p
                             with open(dst.replace(fn, "ptest-%s.log" % i), "w+") as f:
                                 f.write(sectionlog)
 
-def git_get_result(repo, tags, configmap=store_map):
-    git_objs = []
-    for tag in tags:
-        files = repo.run_cmd(['ls-tree', "--name-only", "-r", tag]).splitlines()
-        git_objs.extend([tag + ':' + f for f in files if f.endswith("testresults.json")])
-
-    def parse_json_stream(data):
-        """Parse multiple concatenated JSON objects"""
-        objs = []
-        json_d = ""
-        for line in data.splitlines():
-            if line == '}{':
-                json_d += '}'
-                objs.append(json.loads(json_d))
-                json_d = '{'
-            else:
-                json_d += line
-        objs.append(json.loads(json_d))
-        return objs
-
-    # Optimize by reading all data with one git command
+def git_get_result(repo, tags, configmap=store_map, logs=True):
+    """
+    Load the results of tags of a git repository, without the ptest logs
+    unless logs is True
+    """
+    import resulttool.gitresults as gitresults
+
     results = {}
-    for obj in parse_json_stream(repo.run_cmd(['show'] + git_objs + ['--'])):
-        append_resultsdata(results, obj, configmap=configmap)
+    for path, data in gitresults.GitResultsLoader(repo).load(tags, logs):
+        append_resultsdata(results, data, configmap=configmap,
+                           testseries=posixpath.basename(posixpath.dirname(path)))
 
     return results
 
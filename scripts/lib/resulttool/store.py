@@ -15,6 +15,7 @@ import scriptpath
 scriptpath.add_bitbake_lib_path()
 scriptpath.add_oe_lib_path()
 import resulttool.resultutils as resultutils
+import resulttool.resultsdb as resultsdb
 import oeqa.utils.gitarchive as gitarchive
 
 
@@ -36,7 +37,7 @@ def store(args, logger):
                     f = os.path.join(root, name)
                     if name == "testresults.json":
                         resultutils.append_resultsdata(results, f, configvars=configvars)
-                    elif args.all:
+                    elif args.all and name != resultsdb.ResultsDB.cache_file:
                         dst = f.replace(args.source, tempdir + "/")
                         os.makedirs(os.path.dirname(dst), exist_ok=True)
                         shutil.copyfile(f, dst)
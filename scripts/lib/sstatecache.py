@@ -0,0 +1,237 @@
+# Indexing and pruning of shared state caches
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+"""Indexing and pruning of shared state caches"""
+import concurrent.futures
+import os
+import re
+import stat
+import time
+from collections import namedtuple
+
+
+# SSTATE_PKGSPEC followed by the hash, the task and the file type suffix,
+# e.g. sstate:zlib:core2-64-poky-linux:1.2.11:r0:core2-64:3:<hash>_package.tgz.siginfo
+sstate_name_re = re.compile(r'^sstate:(?P<pn>[^:]*):(?P<arch>[^:]*):(?P<pv>[^:]*):(?P<pr>[^:]*):'
+                            r'(?P<pkgarch>[^:]*):(?P<version>[^:]*):(?P<hash>[^_:]*)_(?P<task>[^:]*?)'
+                            r'\.tgz(?P<ext>(\.[a-z]+)*)$')
+
+# Matches the hash in stamp file names such as
+# zlib-1.2.11-r0.do_package.sigdata.<hash> or
+# zlib-1.2.11-r0.do_package_setscene.<hash>.<taskhash>
+stamp_hash_re = re.compile(r'\.do_[^.]+?(?:\.sigdata|_setscene)\.([^.]+)')
+
+SstateFile = namedtuple('SstateFile', 'path pn arch pv pr pkgarch version hash task ext mtime size islink')
+
+
+class SstateCacheError(Exception):
+    """Error handling of sstate caches"""
+    pass
+
+
+def _scan_tree(topdir, recursive=True):
+    """Return (parsed, other) lists of the sstate files below topdir"""
+    parsed = []
+    other = []
+    dirs = [topdir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        dirs.append(entry.path)
+                    continue
+                if not entry.name.startswith('sstate'):
+                    continue
+                match = sstate_name_re.match(entry.name)
+                if not match:
+                    other.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                parsed.append(SstateFile(entry.path, match.group('pn'), match.group('arch'),
+                                         match.group('pv'), match.group('pr'),
+                                         match.group('pkgarch'), match.group('version'),
+                                         match.group('hash'), match.group('task'),
+                                         match.group('ext'), st.st_mtime, st.st_size,
+                                         stat.S_ISLNK(st.st_mode)))
+    return parsed, other
+
+
+class SstateCache(object):
+    """In memory index of the files of an sstate cache directory
+
+    Files are scanned in parallel over the prefix directories of the cache
+    (the 256 two character hash prefixes, and those of any SSTATE_EXTRAPATH
+    directory). Files named like an sstate archive are parsed into
+    SstateFile entries, other 'sstate*' files (such as the old 'sstate-*'
+    naming) are listed in 'other'.
+    """
+    def __init__(self, cache_dir, jobs=None):
+        if not os.path.isdir(cache_dir):
+            raise SstateCacheError("Invalid cache directory '{}'".format(cache_dir))
+        self.cache_dir = os.path.realpath(cache_dir)
+        self.jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+        self.files = []
+        self.other = []
+
+    def _scan_roots(self):
+        roots = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if re.match(r'^[0-9a-f]{2}$', entry.name):
+                    roots.append(entry.path)
+                else:
+                    # SSTATE_EXTRAPATH, e.g. NATIVELSBSTRING
+                    with os.scandir(entry.path) as subentries:
+                        roots.extend(e.path for e in subentries if e.is_dir(follow_symlinks=False))
+        return roots
+
+    def scan(self):
+        """Index the files of the cache"""
+        # Files at the top of the cache, such as old style sstate-* files
+        self.files, self.other = _scan_tree(self.cache_dir, recursive=False)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for parsed, other in executor.map(_scan_tree, self._scan_roots()):
+                self.files.extend(parsed)
+                self.other.extend(other)
+        return self
+
+    def artifacts(self):
+        """Group the files by recipe, SSTATE_PKGARCH, task and hash
+
+        Returns a dict of (pn, pkgarch, task) -> {hash: [SstateFile, ...]}
+        """
+        groups = {}
+        for f in self.files:
+            groups.setdefault((f.pn, f.pkgarch, f.task), {}).setdefault(f.hash, []).append(f)
+        return groups
+
+    @staticmethod
+    def _newest(files):
+        """Modification time of an artifact, that of its archive if present"""
+        archives = [f.mtime for f in files if f.ext == '']
+        return max(archives or [f.mtime for f in files])
+
+    def _with_kept_links(self, remove, keep):
+        """Drop from remove the files that kept symlinks point to, and the
+        .siginfo, .sig and .done files of those"""
+        targets = set()
+        for f in keep:
+            if f.islink:
+                targets.add(os.path.realpath(f.path))
+        return [f for f in remove if f.path[:len(f.path) - len(f.ext)] not in targets]
+
+    def duplicates(self, skip_tasks=('populate_lic',), archs=None):
+        """Files of all but the newest artifact of each (pn, pkgarch, task)
+
+        populate_lic is skipped by default, the same license output is
+        shared by different hashes. If archs is given, only the artifacts
+        whose SSTATE_PKGARCH is in it are considered.
+        """
+        remove = []
+        keep = []
+        for (pn, pkgarch, task), hashes in self.artifacts().items():
+            if task in skip_tasks or (archs is not None and pkgarch not in archs):
+                continue
+            ordered = sorted(hashes.values(), key=self._newest, reverse=True)
+            keep.extend(ordered[0])
+            for files in ordered[1:]:
+                remove.extend(files)
+        return self._with_kept_links(remove, keep)
+
+    @staticmethod
+    def stamp_hashes(stamps_dirs, maxdepth=3):
+        """Hashes referenced by the stamp files of build directories"""
+        hashes = set()
+        for stamps in stamps_dirs:
+            if not os.path.isdir(stamps):
+                raise SstateCacheError("Invalid stamps directory '{}'".format(stamps))
+            dirs = [(stamps, 1)]
+            while dirs:
+                path, depth = dirs.pop()
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if depth < maxdepth:
+                                dirs.append((entry.path, depth + 1))
+                            continue
+                        match = stamp_hash_re.search(entry.name)
+                        if match:
+                            hashes.add(match.group(1))
+        return hashes
+
+    def unused(self, hashes):
+        """Files of the artifacts whose hash is not in hashes"""
+        if not any(f.hash in hashes for f in self.files):
+            raise SstateCacheError("None of the files in the cache are used by the stamps, refusing to remove all of them")
+        remove = [f for f in self.files if f.hash not in hashes]
+        keep = [f for f in self.files if f.hash in hashes]
+        return self._with_kept_links(remove, keep)
+
+    def older_than(self, seconds, now=None):
+        """Files of the artifacts last used more than seconds ago
+
+        sstate touches the archives it fetches or restores, so the
+        modification time tells when an artifact was last used.
+        """
+        limit = (now or time.time()) - seconds
+        remove = []
+        keep = []
+        for hashes in self.artifacts().values():
+            for files in hashes.values():
+                if self._newest(files) < limit:
+                    remove.extend(files)
+                else:
+                    keep.extend(files)
+        return self._with_kept_links(remove, keep)
+
+    def link_targets(self, files):
+        """Paths of the files the symlinks among files point to, and their
+        siginfo"""
+        targets = []
+        for f in files:
+            if f.islink:
+                dest = os.path.realpath(f.path)
+                if os.path.exists(dest):
+                    targets.append(dest)
+                    if os.path.exists(dest + '.siginfo'):
+                        targets.append(dest + '.siginfo')
+        return targets
+
+
+def remove_files(paths, jobs=None):
+    """Unlink paths, in parallel per directory
+
+    Each directory is opened once and its files unlinked relative to it,
+    avoiding a full path lookup per file. Returns the number of files
+    removed.
+    """
+    bydir = {}
+    for path in set(paths):
+        dirname, name = os.path.split(path)
+        bydir.setdefault(dirname, []).append(name)
+
+    def unlink_in(item):
+        dirname, names = item
+        removed = 0
+        try:
+            dirfd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+        except FileNotFoundError:
+            return 0
+        try:
+            for name in names:
+                try:
+                    os.unlink(name, dir_fd=dirfd)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.close(dirfd)
+        return removed
+
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return sum(executor.map(unlink_in, bydir.items()))
@@ -13,6 +13,7 @@
 #  You should have received a copy of the GNU General Public License
 #  along with pybootchartgui. If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import cairo
 from . import draw
 from .draw import RenderOptions
@@ -38,6 +39,25 @@ def render(writer, trace, app_options, filename):
     options = RenderOptions (app_options)
     (w, h) = draw.extents (options, 1.0, trace)
     w = max (w, draw.MIN_IMG_W)
+
+    tile_h = getattr(app_options, 'tile_height', 0)
+    if fmt == "png" and tile_h and h > tile_h:
+        # Render the chart in horizontal strips so that memory use is
+        # bounded by the size of a tile
+        root, ext = os.path.splitext(filename)
+        ntiles = (h + tile_h - 1) // tile_h
+        width = len(str(ntiles))
+        for i in range(ntiles):
+            tilename = "%s-%0*d%s" % (root, width, i + 1, ext)
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, w, min(tile_h, h - i * tile_h))
+            ctx = cairo.Context (surface)
+            ctx.translate (0, -i * tile_h)
+            draw.render (ctx, options, 1.0, trace)
+            surface.write_to_png(tilename)
+            surface.finish()
+        writer.status ("bootchart written to %d tiles '%s'" % (ntiles, "%s-*%s" % (root, ext)))
+        return
+
     surface = make_surface (w, h)
     ctx = cairo.Context (surface)
     draw.render (ctx, options, 1.0, trace)
@@ -15,6 +15,7 @@
 
 
 import cairo
+import heapq
 import math
 import re
 import random
@@ -133,6 +134,8 @@ TASK_COLOR_SYSROOT = (0.0, 0.00, 1.00, 1.0)
 TASK_COLOR_PACKAGE = (0.0, 1.00, 1.00, 1.0)
 # Package Write RPM/DEB/IPK task color
 TASK_COLOR_PACKAGE_WRITE = (0.0, 0.50, 0.50, 1.0)
+# Color of boxes merging several short tasks in compact mode
+TASK_COLOR_MERGED = (0.6, 0.6, 0.6, 1.0)
 
 # Distinct colors used for different disk volumnes.
 # If we have more volumns, colors get re-used.
@@ -308,29 +311,116 @@ sec_w_base = 1 # the width of a second
 proc_h = 16 # the height of a process
 leg_s = 10
 MIN_IMG_W = 800
+# In compact mode, tasks narrower than this (in pixels) are merged with
+# their neighbours
+LOD_MIN_W = 3
+# Distance from the visible area at which task boxes may still have their
+# label drawn in it
+LABEL_MARGIN = 500
 CUML_HEIGHT = 2000 # Increased value to accomodate CPU and I/O Graphs
 OPTIONS = None
 
+def task_color(task):
+    if task == "do_compile":
+        return TASK_COLOR_COMPILE
+    elif task == "do_configure":
+        return TASK_COLOR_CONFIGURE
+    elif task == "do_install":
+        return TASK_COLOR_INSTALL
+    elif task == "do_populate_sysroot":
+        return TASK_COLOR_SYSROOT
+    elif task == "do_package":
+        return TASK_COLOR_PACKAGE
+    elif task == "do_package_write_rpm" or \
+             task == "do_package_write_deb" or \
+             task == "do_package_write_ipk":
+        return TASK_COLOR_PACKAGE_WRITE
+    else:
+        return WHITE
+
+def merge_short_boxes(boxes, min_duration):
+    """Merge runs of boxes shorter than min_duration, separated by less
+       than min_duration, into a single box."""
+    merged = []
+    run = []
+    def flush():
+        if len(run) == 1:
+            merged.append(run[0])
+        elif run:
+            merged.append((run[0][0], run[-1][1], "%d tasks" % len(run), TASK_COLOR_MERGED))
+    for box in boxes:
+        short = box[1] - box[0] < min_duration
+        if short and run and box[0] - run[-1][1] < min_duration:
+            run.append(box)
+            continue
+        flush()
+        if short:
+            run = [box]
+        else:
+            run = []
+            merged.append(box)
+    flush()
+    return merged
+
+def layout_processes(options, trace, sec_w):
+    """Arrange the processes to draw in rows of (start, end, label, color)
+       boxes.
+
+       Without compact mode there is one row per process. In compact mode
+       a row is reused once its last process has ended and runs of
+       processes too short to tell apart at this scale are merged. Layouts
+       are cached in the trace."""
+    compact = getattr(options.app_options, 'compact', False)
+    key = (compact, options.app_options.show_all, options.app_options.mintime, sec_w)
+    if key in trace.layouts:
+        return trace.layouts[key]
+
+    procs = []
+    for start in sorted(trace.start.keys()):
+        for process in sorted(trace.start[start]):
+            end = trace.processes[process][1]
+            if not options.app_options.show_all and \
+                    end - start < options.app_options.mintime:
+                continue
+            procs.append((start, end, process, task_color(process.split(":")[1])))
+
+    if not compact:
+        rows = [[box] for box in procs]
+    else:
+        rows = []
+        busy = [] # (end, row) of the rows with a running process
+        free = []
+        for box in procs:
+            while busy and busy[0][0] <= box[0]:
+                heapq.heappush(free, heapq.heappop(busy)[1])
+            if free:
+                row = heapq.heappop(free)
+            else:
+                row = len(rows)
+                rows.append([])
+            rows[row].append(box)
+            heapq.heappush(busy, (box[1], row))
+        min_duration = LOD_MIN_W / float(sec_w or 1)
+        rows = [merge_short_boxes(row, min_duration) for row in rows]
+
+    trace.layouts[key] = rows
+    return rows
+
 def extents(options, xscale, trace):
     start = min(trace.start.keys())
     end = start
 
-    processes = 0
-    for proc in trace.processes:
-        if not options.app_options.show_all and \
-               trace.processes[proc][1] - trace.processes[proc][0] < options.app_options.mintime:
-            continue
-
-        if trace.processes[proc][1] > end:
-            end = trace.processes[proc][1]
-        processes += 1
+    rows = layout_processes(options, trace, int (xscale * sec_w_base))
+    for row in rows:
+        if row[-1][1] > end:
+            end = row[-1][1]
 
     if trace.min is not None and trace.max is not None:
         start = trace.min
         end = trace.max
 
     w = int ((end - start) * sec_w_base * xscale) + 2 * off_x
-    h = proc_h * processes + header_h + 2 * off_y
+    h = proc_h * len(rows) + header_h + 2 * off_y
 
     if options.charts:
         if trace.cpu_stats:
@@ -493,7 +583,7 @@ def render_charts(ctx, options, clip, trace, curr_y, w, h, sec_w):
 
     return curr_y
 
-def render_processes_chart(ctx, options, trace, curr_y, w, h, sec_w):
+def render_processes_chart(ctx, options, clip, trace, curr_y, w, h, sec_w):
     chart_rect = [off_x, curr_y+header_h, w, h - curr_y - 1 * off_y - header_h  ]
 
     draw_legend_box (ctx, "Configure", \
@@ -514,48 +604,34 @@ def render_processes_chart(ctx, options, trace, curr_y, w, h, sec_w):
     draw_box_ticks(ctx, chart_rect, sec_w)
     draw_sec_labels(ctx, options, chart_rect, sec_w, 30)
 
-    y = curr_y+header_h
-
+    compact = getattr(options.app_options, 'compact', False)
+    rows = layout_processes(options, trace, sec_w)
     offset = trace.min or min(trace.start.keys())
-    for start in sorted(trace.start.keys()):
-        for process in sorted(trace.start[start]):
-            if not options.app_options.show_all and \
-                    trace.processes[process][1] - start < options.app_options.mintime:
-                continue
-            task = process.split(":")[1]
-
-            #print(process)
-            #print(trace.processes[process][1])
-            #print(s)
 
+    # Only draw the rows and boxes within the clip extents
+    y = curr_y+header_h
+    first = max(0, int((clip[1] - y) / proc_h))
+    last = min(len(rows), int((clip[3] - y) / proc_h) + 1)
+    min_x = clip[0] - LABEL_MARGIN
+    max_x = clip[2] + LABEL_MARGIN
+
+    y = y + first * proc_h
+    for row in rows[first:last]:
+        for start, end, label, col in row:
             x = chart_rect[0] + (start - offset) * sec_w
-            w = ((trace.processes[process][1] - start) * sec_w)
-
-            #print("proc at %s %s %s %s" % (x, y, w, proc_h))
-            col = None
-            if task == "do_compile":
-                col = TASK_COLOR_COMPILE
-            elif task == "do_configure":
-                col = TASK_COLOR_CONFIGURE
-            elif task == "do_install":
-                col = TASK_COLOR_INSTALL
-            elif task == "do_populate_sysroot":
-                col = TASK_COLOR_SYSROOT
-            elif task == "do_package":
-                col = TASK_COLOR_PACKAGE
-            elif task == "do_package_write_rpm" or \
-                     task == "do_package_write_deb" or \
-                     task == "do_package_write_ipk":
-                col = TASK_COLOR_PACKAGE_WRITE
-            else:
-                col = WHITE
+            w = (end - start) * sec_w
+            if x > max_x or x + w < min_x:
+                continue
 
-            if col:
-                draw_fill_rect(ctx, col, (x, y, w, proc_h))
+            draw_fill_rect(ctx, col, (x, y, w, proc_h))
             draw_rect(ctx, PROC_BORDER_COLOR, (x, y, w, proc_h))
 
-            draw_label_in_box(ctx, PROC_TEXT_COLOR, process, x, y + proc_h - 4, w, proc_h)
-            y = y + proc_h
+            if not compact:
+                draw_label_in_box(ctx, PROC_TEXT_COLOR, label, x, y + proc_h - 4, w, proc_h)
+            elif ctx.text_extents(label)[2] + 4 < w:
+                # Labels next to the boxes would overlap in compact mode
+                draw_label_in_box(ctx, PROC_TEXT_COLOR, label, x, y + proc_h - 4, w, x + w)
+        y = y + proc_h
 
     return curr_y
 
@@ -580,7 +656,7 @@ def render(ctx, options, xscale, trace):
     if options.charts:
         curr_y = render_charts (ctx, options, clip, trace, curr_y, w, h, sec_w)
 
-    curr_y = render_processes_chart (ctx, options, trace, curr_y, w, h, sec_w)
+    curr_y = render_processes_chart (ctx, options, clip, trace, curr_y, w, h, sec_w)
 
     return
 
@@ -50,6 +50,7 @@ class Trace:
         self.mem_stats = []
         self.monitor_disk = None
         self.times = [] # Always empty, but expected by draw.py when drawing system charts.
+        self.layouts = {} # Process chart layouts computed by draw.py
 
         if len(paths):
             parse_paths (writer, self, paths)
@@ -115,15 +116,12 @@ class Trace:
                self.ps_stats != None and self.cpu_stats != None
 
     def add_process(self, process, start, end):
+        # start and end index the processes by the second they started and
+        # ended in
         self.processes[process] = [start, end]
-        if start not in self.start:
-            self.start[start] = []
-        if process not in self.start[start]:
-            self.start[start].append(process)
-        if end not in self.end:
-            self.end[end] = []
-        if process not in self.end[end]:
-            self.end[end].append(process)
+        self.start.setdefault(start, set()).add(process)
+        self.end.setdefault(end, set()).add(process)
+        self.layouts.clear()
 
     def compile(self, writer):
 
@@ -741,6 +739,9 @@ def _do_parse(writer, state, filename, file):
         state.cmdline = _parse_cmdline_log(writer, file)
     elif name == "monitor_disk.log":
         state.monitor_disk = _parse_monitor_disk_log(file)
+    elif name == "resource_samples.bin":
+        # Binary samples of the buildstats resource sampler, not a task
+        pass
     elif not filename.endswith('.log'):
         _parse_bitbake_buildstats(writer, state, filename, file)
     t2 = clock()
@@ -7,18 +7,28 @@
 # DESCRIPTION
 # This script is called by the SDK installer script. It replaces the dynamic
 # loader path in all binaries and also fixes the SYSDIR paths/lengths and the
-# location of ld.so.cache in the dynamic loader binary
+# location of ld.so.cache in the dynamic loader binary.
+#
+# When given a sysroot and text directories, it also replaces the default
+# install directory in the text files (configs/scripts/etc.), replaces the host
+# perl with the SDK perl and changes the symlinks pointing to the default
+# install directory. The files are processed in parallel, the ELF headers are
+# read and patched in place through mmap.
 #
 # AUTHORS
 # Laurentiu Palcu <laurentiu.palcu@intel.com>
 #
 
-import struct
-import sys
-import stat
+import argparse
+import errno
+import fnmatch
+import mmap
+import multiprocessing
 import os
 import re
-import errno
+import stat
+import struct
+import sys
 
 if sys.version < '3':
     def b(x):
@@ -29,65 +39,49 @@ else:
 
 old_prefix = re.compile(b("##DEFAULT_INSTALL_DIR##"))
 
-def get_arch():
-    f.seek(0)
-    e_ident =f.read(16)
-    ei_mag0,ei_mag1_3,ei_class = struct.unpack("<B3sB11x", e_ident)
-
-    if (ei_mag0 != 0x7f and ei_mag1_3 != "ELF") or ei_class == 0:
-        return 0
+perl_shebang = re.compile(b("^#! */usr/bin/perl.*$"), re.M)
+perl_path = re.compile(b(" /usr/bin/perl"))
 
-    if ei_class == 1:
-        return 32
-    elif ei_class == 2:
-        return 64
+# Set in each process by setup()
+new_prefix = None
+new_dl_path = None
 
-def parse_elf_header():
-    global e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,\
-           e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx
+def setup(prefix, dl_path):
+    global new_prefix, new_dl_path
+    new_prefix = prefix
+    new_dl_path = dl_path
 
-    f.seek(0)
-    elf_header = f.read(64)
+def relocate_prefix(data, count=0):
+    return old_prefix.sub(lambda m: new_prefix, data, count)
 
-    if arch == 32:
-        # 32bit
-        hdr_fmt = "<HHILLLIHHHHHH"
-        hdr_size = 52
-    else:
-        # 64bit
-        hdr_fmt = "<HHIQQQIHHHHHH"
-        hdr_size = 64
+class RelocationError(Exception):
+    pass
 
-    e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,\
-    e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx =\
-        struct.unpack(hdr_fmt, elf_header[16:hdr_size])
-
-def change_interpreter(elf_file_name):
+def change_interpreter(m, elf_file_name, endian, arch, e_phoff, e_phentsize, e_phnum):
     if arch == 32:
-        ph_fmt = "<IIIIIIII"
+        ph_fmt = endian + "IIIIIIII"
     else:
-        ph_fmt = "<IIQQQQQQ"
+        ph_fmt = endian + "IIQQQQQQ"
 
+    messages = []
     """ look for PT_INTERP section """
-    for i in range(0,e_phnum):
-        f.seek(e_phoff + i * e_phentsize)
-        ph_hdr = f.read(e_phentsize)
+    for i in range(0, e_phnum):
+        ph_hdr = struct.unpack_from(ph_fmt, m, e_phoff + i * e_phentsize)
         if arch == 32:
             # 32bit
             p_type, p_offset, p_vaddr, p_paddr, p_filesz,\
-                p_memsz, p_flags, p_align = struct.unpack(ph_fmt, ph_hdr)
+                p_memsz, p_flags, p_align = ph_hdr
         else:
             # 64bit
             p_type, p_flags, p_offset, p_vaddr, p_paddr, \
-            p_filesz, p_memsz, p_align = struct.unpack(ph_fmt, ph_hdr)
+            p_filesz, p_memsz, p_align = ph_hdr
 
         """ change interpreter """
         if p_type == 3:
             # PT_INTERP section
-            f.seek(p_offset)
             # External SDKs with mixed pre-compiled binaries should not get
             # relocated so look for some variant of /lib
-            fname = f.read(11)
+            fname = m[p_offset:p_offset + 11]
             if fname.startswith(b("/lib/")) or fname.startswith(b("/lib64/")) or \
                fname.startswith(b("/lib32/")) or fname.startswith(b("/usr/lib32/")) or \
                fname.startswith(b("/usr/lib32/")) or fname.startswith(b("/usr/lib64/")):
@@ -95,86 +89,71 @@ def change_interpreter(elf_file_name):
             if p_filesz == 0:
                 break
             if (len(new_dl_path) >= p_filesz):
-                print("ERROR: could not relocate %s, interp size = %i and %i is needed." \
+                messages.append("ERROR: could not relocate %s, interp size = %i and %i is needed." \
                     % (elf_file_name, p_memsz, len(new_dl_path) + 1))
                 break
-            dl_path = new_dl_path + b("\0") * (p_filesz - len(new_dl_path))
-            f.seek(p_offset)
-            f.write(dl_path)
+            m[p_offset:p_offset + p_filesz] = new_dl_path + b("\0") * (p_filesz - len(new_dl_path))
             break
+    return messages
 
-def change_dl_sysdirs(elf_file_name):
+def change_dl_sysdirs(m, elf_file_name, endian, arch, e_shoff, e_shentsize, e_shnum, e_shstrndx):
     if arch == 32:
-        sh_fmt = "<IIIIIIIIII"
+        sh_fmt = endian + "IIIIIIIIII"
     else:
-        sh_fmt = "<IIQQQQIIQQ"
+        sh_fmt = endian + "IIQQQQIIQQ"
 
     """ read section string table """
-    f.seek(e_shoff + e_shstrndx * e_shentsize)
-    sh_hdr = f.read(e_shentsize)
     if arch == 32:
-        sh_offset, sh_size = struct.unpack("<16xII16x", sh_hdr)
+        sh_offset, sh_size = struct.unpack_from(endian + "16xII", m, e_shoff + e_shstrndx * e_shentsize)
     else:
-        sh_offset, sh_size = struct.unpack("<24xQQ24x", sh_hdr)
+        sh_offset, sh_size = struct.unpack_from(endian + "24xQQ", m, e_shoff + e_shstrndx * e_shentsize)
+    sh_strtab = m[sh_offset:sh_offset + sh_size]
 
-    f.seek(sh_offset)
-    sh_strtab = f.read(sh_size)
-
-    sysdirs = sysdirs_len = ""
+    sysdirs = sysdirslen = None
 
     """ change ld.so.cache path and default libs path for dynamic loader """
-    for i in range(0,e_shnum):
-        f.seek(e_shoff + i * e_shentsize)
-        sh_hdr = f.read(e_shentsize)
-
+    for i in range(0, e_shnum):
         sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link,\
-            sh_info, sh_addralign, sh_entsize = struct.unpack(sh_fmt, sh_hdr)
+            sh_info, sh_addralign, sh_entsize = struct.unpack_from(sh_fmt, m, e_shoff + i * e_shentsize)
+
+        """ look only into SHT_PROGBITS sections """
+        if sh_type != 1:
+            continue
 
         name = sh_strtab[sh_name:sh_strtab.find(b("\0"), sh_name)]
 
-        """ look only into SHT_PROGBITS sections """
-        if sh_type == 1:
-            f.seek(sh_offset)
-            """ default library paths cannot be changed on the fly because  """
-            """ the string lengths have to be changed too.                  """
-            if name == b(".sysdirs"):
-                sysdirs = f.read(sh_size)
-                sysdirs_off = sh_offset
-                sysdirs_sect_size = sh_size
-            elif name == b(".sysdirslen"):
-                sysdirslen = f.read(sh_size)
-                sysdirslen_off = sh_offset
-            elif name == b(".ldsocache"):
-                ldsocache_path = f.read(sh_size)
-                new_ldsocache_path = old_prefix.sub(new_prefix, ldsocache_path)
-                new_ldsocache_path = new_ldsocache_path.rstrip(b("\0"))
-                if (len(new_ldsocache_path) >= sh_size):
-                    print("ERROR: could not relocate %s, .ldsocache section size = %i and %i is needed." \
+        """ default library paths cannot be changed on the fly because  """
+        """ the string lengths have to be changed too.                  """
+        if name == b(".sysdirs"):
+            sysdirs = m[sh_offset:sh_offset + sh_size]
+            sysdirs_off = sh_offset
+            sysdirs_sect_size = sh_size
+        elif name == b(".sysdirslen"):
+            sysdirslen = m[sh_offset:sh_offset + sh_size]
+            sysdirslen_off = sh_offset
+        elif name == b(".ldsocache"):
+            ldsocache_path = m[sh_offset:sh_offset + sh_size]
+            new_ldsocache_path = relocate_prefix(ldsocache_path)
+            new_ldsocache_path = new_ldsocache_path.rstrip(b("\0"))
+            if (len(new_ldsocache_path) >= sh_size):
+                raise RelocationError("ERROR: could not relocate %s, .ldsocache section size = %i and %i is needed." \
                     % (elf_file_name, sh_size, len(new_ldsocache_path)))
-                    sys.exit(-1)
-                # pad with zeros
-                new_ldsocache_path += b("\0") * (sh_size - len(new_ldsocache_path))
-                # write it back
-                f.seek(sh_offset)
-                f.write(new_ldsocache_path)
-            elif name == b(".gccrelocprefix"):
-                offset = 0
-                while (offset + 4096) <= sh_size:
-                    path = f.read(4096)
-                    new_path = old_prefix.sub(new_prefix, path)
-                    new_path = new_path.rstrip(b("\0"))
-                    if (len(new_path) >= 4096):
-                        print("ERROR: could not relocate %s, max path size = 4096 and %i is needed." \
+            # pad with zeros and write it back
+            m[sh_offset:sh_offset + sh_size] = new_ldsocache_path + b("\0") * (sh_size - len(new_ldsocache_path))
+        elif name == b(".gccrelocprefix"):
+            offset = 0
+            while (offset + 4096) <= sh_size:
+                path = m[sh_offset + offset:sh_offset + offset + 4096]
+                new_path = relocate_prefix(path)
+                new_path = new_path.rstrip(b("\0"))
+                if (len(new_path) >= 4096):
+                    raise RelocationError("ERROR: could not relocate %s, max path size = 4096 and %i is needed." \
                         % (elf_file_name, len(new_path)))
-                        sys.exit(-1)
-                    # pad with zeros
-                    new_path += b("\0") * (4096 - len(new_path))
-                    #print "Changing %s to %s at %s" % (str(path), str(new_path), str(offset))
-                    # write it back
-                    f.seek(sh_offset + offset)
-                    f.write(new_path)
-                    offset = offset + 4096
-    if sysdirs != "" and sysdirslen != "":
+                # pad with zeros and write it back
+                m[sh_offset + offset:sh_offset + offset + 4096] = new_path + b("\0") * (4096 - len(new_path))
+                offset = offset + 4096
+
+    if sysdirs is not None and sysdirslen is not None:
         paths = sysdirs.split(b("\0"))
         sysdirs = b("")
         sysdirslen = b("")
@@ -183,39 +162,60 @@ def change_dl_sysdirs(elf_file_name):
             if path == b(""):
                 break
 
-            new_path = old_prefix.sub(new_prefix, path)
+            new_path = relocate_prefix(path)
             sysdirs += new_path + b("\0")
 
             if arch == 32:
-                sysdirslen += struct.pack("<L", len(new_path))
+                sysdirslen += struct.pack(endian + "L", len(new_path))
             else:
-                sysdirslen += struct.pack("<Q", len(new_path))
+                sysdirslen += struct.pack(endian + "Q", len(new_path))
 
         """ pad with zeros """
         sysdirs += b("\0") * (sysdirs_sect_size - len(sysdirs))
 
         """ write the sections back """
-        f.seek(sysdirs_off)
-        f.write(sysdirs)
-        f.seek(sysdirslen_off)
-        f.write(sysdirslen)
-
-# MAIN
-if len(sys.argv) < 4:
-    sys.exit(-1)
-
-# In python > 3, strings may also contain Unicode characters. So, convert
-# them to bytes
-if sys.version_info < (3,):
-    new_prefix = sys.argv[1]
-    new_dl_path = sys.argv[2]
-else:
-    new_prefix = sys.argv[1].encode()
-    new_dl_path = sys.argv[2].encode()
+        m[sysdirs_off:sysdirs_off + len(sysdirs)] = sysdirs
+        m[sysdirslen_off:sysdirslen_off + len(sysdirslen)] = sysdirslen
 
-executables_list = sys.argv[3:]
+def relocate_elf(m, elf_file_name):
+    """Patch the ELF file mapped in m, messages to print"""
+    magic, ei_class, ei_data = struct.unpack_from("4sBB", m, 0)
+    endian = ">" if ei_data == 2 else "<"
+    if ei_class == 1:
+        # 32bit
+        arch = 32
+        hdr_fmt = endian + "HHILLLIHHHHHH"
+    else:
+        # 64bit
+        arch = 64
+        hdr_fmt = endian + "HHIQQQIHHHHHH"
+
+    e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,\
+    e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx =\
+        struct.unpack_from(hdr_fmt, m, 16)
+
+    messages = change_interpreter(m, elf_file_name, endian, arch, e_phoff, e_phentsize, e_phnum)
+    change_dl_sysdirs(m, elf_file_name, endian, arch, e_shoff, e_shentsize, e_shnum, e_shstrndx)
+    return messages
+
+def is_elf(head):
+    return head[:4] == b("\x7fELF") and head[4:5] in (b("\x01"), b("\x02"))
+
+def relocate_text(f, data):
+    """Rewrite the text file f, False if it is not changed"""
+    new_data = relocate_prefix(data)
+    new_data = perl_shebang.sub(b("#! /usr/bin/env perl"), new_data)
+    new_data = perl_path.sub(b(" /usr/bin/env perl"), new_data)
+    if new_data == data:
+        return False
+    f.seek(0)
+    f.write(new_data)
+    f.truncate()
+    return True
 
-for e in executables_list:
+def relocate_file(e, elf, text):
+    """Relocate the file e, as an ELF executable if elf is set and as a text
+    file if text is set, messages to print"""
     perms = os.stat(e)[stat.ST_MODE]
     if os.access(e, os.W_OK|os.R_OK):
         perms = None
@@ -223,33 +223,149 @@ for e in executables_list:
         os.chmod(e, perms|stat.S_IRWXU)
 
     try:
-        f = open(e, "r+b")
-    except IOError:
-        exctype, ioex = sys.exc_info()[:2]
-        if ioex.errno == errno.ETXTBSY:
-            print("Could not open %s. File used by another process.\nPlease "\
-                  "make sure you exit all processes that might use any SDK "\
-                  "binaries." % e)
-        else:
-            print("Could not open %s: %s(%d)" % (e, ioex.strerror, ioex.errno))
-        sys.exit(-1)
-
-    # Save old size and do a size check at the end. Just a safety measure.
-    old_size = os.path.getsize(e)
-    if old_size >= 64:
-        arch = get_arch()
-        if arch:
-            parse_elf_header()
-            change_interpreter(e)
-            change_dl_sysdirs(e)
-
-    """ change permissions back """
-    if perms:
-        os.chmod(e, perms)
-
-    f.close()
-
-    if old_size != os.path.getsize(e):
-        print("New file size for %s is different. Looks like a relocation error!", e)
-        sys.exit(-1)
-
+        try:
+            f = open(e, "r+b")
+        except IOError:
+            exctype, ioex = sys.exc_info()[:2]
+            if ioex.errno == errno.ETXTBSY:
+                raise RelocationError("Could not open %s. File used by another process.\nPlease "\
+                    "make sure you exit all processes that might use any SDK "\
+                    "binaries." % e)
+            raise RelocationError("Could not open %s: %s(%d)" % (e, ioex.strerror, ioex.errno))
+
+        with f:
+            head = f.read(64)
+            if is_elf(head):
+                if not elf or len(head) < 64:
+                    return []
+                m = mmap.mmap(f.fileno(), 0)
+                try:
+                    return relocate_elf(m, e)
+                except struct.error:
+                    # Truncated or corrupt headers, leave it alone
+                    return []
+                finally:
+                    m.close()
+            if text and b("\0") not in head:
+                data = head + f.read()
+                if b("\0") not in data:
+                    relocate_text(f, data)
+            return []
+    finally:
+        """ change permissions back """
+        if perms:
+            os.chmod(e, perms)
+
+def relocate_symlink(l):
+    """Change the symlink l if it points to the default install directory"""
+    target = b(os.readlink(l))
+    new_target = relocate_prefix(target, 1)
+    if new_target == target:
+        return []
+    if sys.version >= '3':
+        new_target = new_target.decode(sys.getfilesystemencoding())
+    tmp = l + ".relocate-tmp"
+    try:
+        os.unlink(tmp)
+    except OSError:
+        pass
+    os.symlink(new_target, tmp)
+    os.rename(tmp, l)
+    return []
+
+def relocate(task):
+    """Run a task of the pool, (messages, fatal)"""
+    path, link, elf, text = task
+    try:
+        if link:
+            return relocate_symlink(path), False
+        return relocate_file(path, elf, text), False
+    except RelocationError as exc:
+        return [str(exc)], True
+    except (IOError, OSError) as exc:
+        return ["Failed to relocate %s: %s" % (path, exc)], True
+
+def collect(tasks, seen, path, elf, text):
+    """Add the task relocating path, given its lstat"""
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        tasks.append((path, True, False, False))
+        return
+    if not stat.S_ISREG(st.st_mode):
+        return
+    elf = elf and bool(st.st_mode & (stat.S_IXUSR|stat.S_IXGRP|stat.S_IXOTH))
+    if not (elf or text):
+        return
+    # Relocate hardlinked files once
+    key = (st.st_dev, st.st_ino)
+    if key in seen:
+        return
+    seen.add(key)
+    tasks.append((path, False, elf, text))
+
+def collect_tasks(args):
+    tasks = []
+    seen = set()
+    for e in args.executables:
+        if not args.no_elf:
+            # Explicitly listed files may not have the executable bit set
+            st = os.stat(e)
+            key = (st.st_dev, st.st_ino)
+            if key not in seen:
+                seen.add(key)
+                tasks.append((e, False, True, False))
+    for d in args.text_dir:
+        for name in sorted(os.listdir(d)):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in args.exclude):
+                continue
+            path = os.path.join(d, name)
+            if not os.path.islink(path):
+                collect(tasks, seen, path, False, True)
+    for sysroot in args.sysroot:
+        for root, dirs, files in os.walk(sysroot):
+            for name in dirs + files:
+                collect(tasks, seen, os.path.join(root, name), not args.no_elf, True)
+    return tasks
+
+def main():
+    parser = argparse.ArgumentParser(description="Relocate an SDK installed in a directory other than its default install directory")
+    parser.add_argument("new_prefix", help="directory the SDK is installed in")
+    parser.add_argument("new_dl_path", help="path of the dynamic loader of the SDK")
+    parser.add_argument("executables", nargs="*", help="ELF files to relocate")
+    parser.add_argument("--sysroot", action="append", default=[],
+                        help="relocate the executables, text files and symlinks of this directory and its subdirectories")
+    parser.add_argument("--text-dir", action="append", default=[],
+                        help="relocate the text files directly in this directory")
+    parser.add_argument("--exclude", action="append", default=[],
+                        help="name pattern of files of the --text-dir directories to leave alone")
+    parser.add_argument("--no-elf", action="store_true", help="do not relocate ELF files")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="number of files relocated in parallel (default: %(default)s)")
+    args = parser.parse_args()
+
+    # In python > 3, strings may also contain Unicode characters. So, convert
+    # them to bytes
+    setup(b(args.new_prefix), b(args.new_dl_path))
+
+    tasks = collect_tasks(args)
+    if args.jobs > 1 and len(tasks) > 64:
+        pool = multiprocessing.Pool(args.jobs, setup, (new_prefix, new_dl_path))
+        try:
+            results = list(pool.imap_unordered(relocate, tasks, 32))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [relocate(task) for task in tasks]
+
+    failed = False
+    for messages, fatal in results:
+        for message in messages:
+            print(message)
+        failed = failed or fatal
+    if failed:
+        return -1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+#
+# Prune shared state caches
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import platform
+import sys
+
+scripts_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(scripts_path, 'lib'))
+from sstatecache import SstateCache, SstateCacheError, remove_files
+
+
+def human_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f TiB" % size
+
+
+def report(cache, remove, extra, verbose):
+    """Print what is going to be removed, per task"""
+    bytask = {}
+    for f in remove:
+        count, size = bytask.get(f.task, (0, 0))
+        bytask[f.task] = (count + 1, size + f.size)
+    for task, (count, size) in sorted(bytask.items(), key=lambda t: t[1][1], reverse=True):
+        print("  %-30s %8d files %12s" % (task, count, human_size(size)))
+    if extra:
+        print("  %-30s %8d files" % ("(other)", len(extra)))
+    if verbose:
+        for path in sorted([f.path for f in remove] + extra):
+            print(path)
+
+
+def duplicate_archs(extra_archs):
+    """SSTATE_PKGARCHs whose duplicates are removed with --extra-archs: the
+    listed ones, allarch and the build host arch, alone and as prefix of the
+    others (used by the toolchain), and the empty arch"""
+    builder = platform.machine()
+    archs = set(['allarch', builder] + extra_archs)
+    return archs | set('%s_%s' % (builder, arch) for arch in archs) | set([''])
+
+
+def confirm(args, total, count):
+    print("%d out of %d files will be removed!" % (count, total))
+    if args.yes:
+        return True
+    while True:
+        answer = input("Do you want to continue (y/n)? ").strip().lower()
+        if answer in ('y', 'n'):
+            return answer == 'y'
+        print("Invalid input '%s', please input 'y' or 'n'" % answer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove unneeded files from a shared state cache.",
+                                     epilog="The cache is indexed once, files named like sstate "
+                                            "archives are grouped by recipe, SSTATE_PKGARCH, task "
+                                            "and hash. An archive and its .siginfo, .sig and .done "
+                                            "files are always kept or removed together.")
+    parser.add_argument('--cache-dir', default=os.environ.get('SSTATE_CACHE_DIR'),
+                        help="sstate cache directory (default: $SSTATE_CACHE_DIR)")
+    parser.add_argument('-d', '--remove-duplicated', action='store_true',
+                        help="remove all but the newest hash of each recipe, architecture and task, "
+                             "and files with the old sstate-* names")
+    parser.add_argument('--stamps-dir', action='append', default=[],
+                        help="keep only the files used by the stamps directory of these builds "
+                             "(comma separated, may be given several times), all the other sstate* "
+                             "files are removed")
+    parser.add_argument('--older-than', type=float, metavar='DAYS',
+                        help="remove the files not used in the last DAYS days")
+    parser.add_argument('-L', '--follow-symlink', action='store_true',
+                        help="remove both the symlinks and the files they point to")
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help="only report what would be removed")
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help="do not ask for confirmation")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="number of directories scanned and pruned in parallel")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="list the files to remove")
+    parser.add_argument('-D', '--debug', action='count', default=0,
+                        help="same as --verbose")
+    parser.add_argument('--extra-archs', metavar='ARCHS',
+                        help="with --remove-duplicated, only remove the duplicates of these "
+                             "SSTATE_PKGARCHs (comma separated), allarch and the build host "
+                             "arch (default: all the archs found in the cache)")
+    parser.add_argument('--extra-layer', metavar='LAYERS',
+                        help="no effect, accepted for compatibility: the archs are taken "
+                             "from the cache rather than from the tune files of the layers")
+
+    args = parser.parse_args()
+    args.verbose = args.verbose or args.debug > 0
+    stamps = [s for arg in args.stamps_dir for s in arg.split(',') if s]
+
+    if not args.cache_dir:
+        parser.error("No cache dir found!")
+    if args.extra_layer:
+        print("Ignoring --extra-layer, the archs are taken from the cache")
+    if args.remove_duplicated and stamps:
+        parser.error("Can not use both --remove-duplicated and --stamps-dir")
+    if not (args.remove_duplicated or stamps or args.older_than is not None):
+        parser.error("What do you want to do? (--remove-duplicated, --stamps-dir or --older-than)")
+
+    try:
+        print("Indexing %s ..." % args.cache_dir)
+        cache = SstateCache(args.cache_dir, args.jobs).scan()
+        total = len(cache.files) + len(cache.other)
+        print("%d sstate files found" % total)
+
+        remove = {}
+        extra = []
+        if args.remove_duplicated:
+            archs = duplicate_archs(args.extra_archs.split(',')) if args.extra_archs else None
+            remove.update((f.path, f) for f in cache.duplicates(archs=archs))
+            extra.extend(p for p in cache.other if os.path.basename(p).startswith('sstate-'))
+        if stamps:
+            remove.update((f.path, f) for f in cache.unused(cache.stamp_hashes(stamps)))
+            # None of the files with the old or unknown names are used
+            extra.extend(cache.other)
+        if args.older_than is not None:
+            remove.update((f.path, f) for f in cache.older_than(args.older_than * 24 * 3600))
+        remove = list(remove.values())
+        if args.follow_symlink:
+            extra.extend(cache.link_targets(remove))
+        extra = sorted(set(extra) - set(f.path for f in remove))
+    except SstateCacheError as err:
+        print("ERROR: %s" % err, file=sys.stderr)
+        return 1
+
+    count = len(remove) + len(extra)
+    if not count:
+        print("No files to remove")
+        return 0
+
+    report(cache, remove, extra, args.verbose)
+    if args.dry_run:
+        print("%d out of %d files would be removed (%s)" %
+              (count, total, human_size(sum(f.size for f in remove))))
+        return 0
+    if not confirm(args, total, count):
+        print("Nothing to do")
+        return 0
+
+    removed = remove_files([f.path for f in remove] + extra, args.jobs)
+    print("%d files have been removed" % removed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())